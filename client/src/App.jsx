@@ -247,7 +247,22 @@ function App() {
           <HistoryModal
             history={history}
             onClose={() => setShowHistoryModal(false)}
-            onSelectQuery={(query) => {
+            onSelectQuery={async (item) => {
+              // the list only carries previews, fetch the full responses
+              let query;
+              try {
+                const token = localStorage.getItem("token");
+                const response = await fetch(`${API_BASE_URL}/api/users/queries/${item.id}`, {
+                  headers: { Authorization: `Bearer ${token}` },
+                });
+                const data = await response.json();
+                if (!response.ok) throw new Error("Failed");
+                query = data.query;
+              } catch {
+                alert("Failed to load query");
+                return;
+              }
+
               // Parse the prompt to separate system prompt and user prompt
               const fullPrompt = query.prompt;
               const separator = '\n\n';
@@ -54,6 +54,12 @@ const HistoryModal = ({ history, onClose, onSelectQuery }) => {
                   {query.prompt}
                 </div>
 
+                {query.preview && (
+                  <div className="history-preview">
+                    {query.preview}
+                  </div>
+                )}
+
                 <div className="history-click-hint">
                   Click to view response
                 </div>
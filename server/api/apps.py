@@ -5,3 +5,17 @@ class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
 
+    def ready(self):
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from config.database_config import configure_sqlite_connection
+        from .auth import User, user_changed
+        from .jobs import start_web_workers
+        from .middleware import install_query_counter
+        connection_created.connect(configure_sqlite_connection)
+        connection_created.connect(install_query_counter)
+        post_save.connect(user_changed, sender=User)
+        post_delete.connect(user_changed, sender=User)
+        # started by the first request rather than here, so management commands don't run them
+        request_started.connect(start_web_workers)
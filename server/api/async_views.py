@@ -0,0 +1,374 @@
+"""
+Async API Views for AI Comparator (served through config/asgi.py)
+"""
+import asyncio
+import json
+from functools import partial, wraps
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from .batch import astream_results
+from .cache import should_use_cache
+from .concurrency import afan_out
+from .history import arecord_query
+from .jobs import ajob_events, enqueue_comparison
+from .providers import UnknownProvider, comparison_mode, get_provider, resolve_providers
+from .rubric import (
+    aget_ai_comparison_rubric, apipelined_rubric, ascore_response, await_score, get_rubric_mode, merge_scores
+)
+from .streaming import amerge_streams, sse_event
+from .auth import aget_authenticated_user
+from .views import get_comparison_job, get_user_job, job_accepted, resolve_rubric_pair, wants_job
+
+
+def csrf_exempt_async(view_func):
+    """Async-compatible csrf_exempt (Django 4.2's decorator wraps views in a sync function)"""
+    view_func.csrf_exempt = True
+    return view_func
+
+
+def require_http_methods_async(request_method_list):
+    """Async-compatible require_http_methods"""
+    def decorator(func):
+        @wraps(func)
+        async def inner(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                return HttpResponseNotAllowed(request_method_list)
+            return await func(request, *args, **kwargs)
+        return inner
+    return decorator
+
+
+async def single_model_response(request, name):
+    """Shared body of the single-provider endpoints"""
+    provider = get_provider(name)
+    try:
+        data = json.loads(request.body)
+        prompt = data.get('prompt')
+
+        if not prompt:
+            return JsonResponse({'error': 'Prompt is required'}, status=400)
+
+        result = await provider.arespond(prompt, use_cache=should_use_cache(request, data))
+
+        # Save to history if user is authenticated
+        user = await aget_authenticated_user(request)
+        if user is not None and not result.get('error'):
+            await arecord_query(
+                user_id=user.id,
+                prompt=prompt,
+                mode=name,
+                responses={name: result}
+            )
+
+        status = 500 if result.get('error') else 200
+        return JsonResponse(result, status=status)
+
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Failed to get response from {provider.label}',
+            'details': str(e)
+        }, status=500)
+
+
+async def respond_all(providers, prompt, use_cache=True):
+    """Ask every provider concurrently; returns {name: result}"""
+    return await afan_out({
+        provider.name: (provider.label, partial(provider.arespond, use_cache=use_cache), prompt)
+        for provider in providers
+    })
+
+
+# API Endpoints
+@csrf_exempt_async
+@require_http_methods_async(["POST"])
+async def groq_view(request):
+    """Groq endpoint"""
+    return await single_model_response(request, 'groq')
+
+
+@csrf_exempt_async
+@require_http_methods_async(["POST"])
+async def gemini_view(request):
+    """Gemini endpoint"""
+    return await single_model_response(request, 'gemini')
+
+
+@csrf_exempt_async
+@require_http_methods_async(["POST"])
+async def provider_view(request, name):
+    """Single-model endpoint for any registered provider"""
+    try:
+        get_provider(name)
+    except UnknownProvider as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    return await single_model_response(request, name)
+
+
+@csrf_exempt_async
+@require_http_methods_async(["POST"])
+async def compare_view(request):
+    """Compare endpoint - gets responses from all requested AIs"""
+    try:
+        data = json.loads(request.body)
+        prompt = data.get('prompt')
+
+        if not prompt:
+            return JsonResponse({'error': 'Prompt is required'}, status=400)
+
+        try:
+            providers = resolve_providers(data.get('providers'))
+        except UnknownProvider as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        results = await respond_all(providers, prompt, use_cache=should_use_cache(request, data))
+
+        # Save to history if user is authenticated
+        user = await aget_authenticated_user(request)
+        if user is not None and not any(result.get('error') for result in results.values()):
+            await arecord_query(
+                user_id=user.id,
+                prompt=prompt,
+                mode=comparison_mode(providers),
+                responses=results
+            )
+
+        return JsonResponse(results)
+
+    except Exception as e:
+        print(f'Compare error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to compare AI responses',
+            'details': str(e)
+        }, status=500)
+
+
+@csrf_exempt_async
+@require_http_methods_async(["POST"])
+async def compare_with_rubric_view(request):
+    try:
+        data = json.loads(request.body)
+        prompt = data.get('prompt')
+
+        if not prompt:
+            return JsonResponse({'error': 'Prompt is required'}, status=400)
+
+        try:
+            provider_a, provider_b = resolve_rubric_pair(data)
+            rubric_mode = get_rubric_mode(data)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        use_cache = should_use_cache(request, data)
+        if wants_job(request, data):
+            # answer now and let a job worker run the comparison
+            user = await aget_authenticated_user(request)
+            job = await sync_to_async(enqueue_comparison)(
+                user.id if user is not None else None, prompt, [provider_a, provider_b], rubric_mode,
+                use_cache=use_cache
+            )
+            return job_accepted(job)
+
+        if rubric_mode == 'pipelined':
+            # each response is scored as soon as it arrives, overlapping the other model
+            results, rubric_result = await apipelined_rubric(prompt, provider_a, provider_b, use_cache=use_cache)
+        else:
+            results = await respond_all([provider_a, provider_b], prompt, use_cache=use_cache)
+            rubric_result = None
+
+        result_a = results[provider_a.name]
+        result_b = results[provider_b.name]
+        
+        if result_a.get('error') or result_b.get('error'):
+            return JsonResponse({
+                'error': 'Failed to get responses from one or both AI models',
+                **results
+            }, status=500)
+
+        if rubric_result is None:
+            # get AI-based comparison and rubric in a single evaluator call
+            rubric_result = await aget_ai_comparison_rubric(
+                prompt,
+                result_a.get('response'),
+                result_b.get('response'),
+                provider_a.description,
+                provider_b.description,
+                use_cache=use_cache
+            )
+
+        response_data = {
+            'prompt': prompt,
+            'responses': results,
+            'evaluation': rubric_result
+        }
+
+        user = await aget_authenticated_user(request)
+        if user is not None and rubric_result.get('success'):
+            await arecord_query(
+                user_id=user.id,
+                prompt=prompt,
+                mode='compare_with_rubric',
+                responses=results
+            )
+
+        return JsonResponse(response_data)
+
+    except Exception as e:
+        print(f'Compare with rubric error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to compare AI responses with rubric',
+            'details': str(e)
+        }, status=500)
+
+
+async def compare_stream_events(prompt, user, providers, rubric_mode=None):
+    """Async counterpart of views.compare_stream_events"""
+    results = {}
+    scores = {}
+    descriptions = {provider.name: provider.description for provider in providers}
+    try:
+        async for name, kind, payload in amerge_streams({
+            provider.name: (provider.label, provider.astream_text, prompt) for provider in providers
+        }):
+            if kind == 'token':
+                yield sse_event('token', {'provider': name, 'text': payload})
+                continue
+            results[name] = payload
+            if kind == 'done' and rubric_mode == 'pipelined':
+                scores[name] = asyncio.create_task(
+                    ascore_response(prompt, payload['response'], descriptions[name])
+                )
+            summary = {key: value for key, value in payload.items() if key != 'response'}
+            yield sse_event(kind, {'provider': name, **summary})
+
+        if any(result.get('error') for result in results.values()):
+            yield sse_event('end', {'success': False})
+            return
+
+        rubric_result = None
+        if rubric_mode is not None:
+            provider_a, provider_b = providers
+            if rubric_mode == 'pipelined':
+                rubric_result = merge_scores(
+                    await await_score(scores[provider_a.name]),
+                    await await_score(scores[provider_b.name]),
+                    provider_a.description,
+                    provider_b.description
+                )
+            else:
+                rubric_result = await aget_ai_comparison_rubric(
+                    prompt,
+                    results[provider_a.name].get('response'),
+                    results[provider_b.name].get('response'),
+                    provider_a.description,
+                    provider_b.description
+                )
+            yield sse_event('rubric', rubric_result)
+    finally:
+        # scoring is pointless once the client has gone or a model failed
+        for task in scores.values():
+            task.cancel()
+
+    if user is not None and (rubric_result is None or rubric_result.get('success')):
+        await arecord_query(
+            user_id=user.id,
+            prompt=prompt,
+            mode='compare_with_rubric' if rubric_mode is not None else comparison_mode(providers),
+            responses=results
+        )
+
+    yield sse_event('end', {'success': True})
+
+
+async def stream_comparison(request, with_rubric):
+    """Shared body of the streaming compare endpoints"""
+    try:
+        data = json.loads(request.body)
+        prompt = data.get('prompt')
+
+        if not prompt:
+            return JsonResponse({'error': 'Prompt is required'}, status=400)
+
+        try:
+            if with_rubric:
+                providers = resolve_rubric_pair(data)
+                rubric_mode = get_rubric_mode(data)
+            else:
+                providers = resolve_providers(data.get('providers'))
+                rubric_mode = None
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        user = await aget_authenticated_user(request)
+        response = StreamingHttpResponse(
+            compare_stream_events(prompt, user, providers, rubric_mode),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        print(f'Compare stream error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to stream AI responses',
+            'details': str(e)
+        }, status=500)
+
+
+@csrf_exempt_async
+@require_http_methods_async(["POST"])
+async def compare_stream_view(request):
+    """Compare endpoint streamed as server-sent events"""
+    return await stream_comparison(request, with_rubric=False)
+
+
+@csrf_exempt_async
+@require_http_methods_async(["POST"])
+async def compare_with_rubric_stream_view(request):
+    """Compare-with-rubric endpoint streamed as server-sent events"""
+    return await stream_comparison(request, with_rubric=True)
+
+
+@require_http_methods_async(["GET"])
+async def batch_results_view(request, job_id):
+    """
+    Stream a batch job's finished prompts as JSONL, in the order they finished
+
+    Query params: follow=true keeps the stream open until the job stops running.
+    """
+    try:
+        job, error = await sync_to_async(get_user_job)(request, job_id)
+        if error:
+            return error
+        follow = request.GET.get('follow', '').lower() == 'true'
+        response = StreamingHttpResponse(astream_results(job.id, follow), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        print(f'Batch results error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to get batch results',
+            'details': str(e)
+        }, status=500)
+
+
+@require_http_methods_async(["GET"])
+async def comparison_job_events_view(request, job_id):
+    """Subscribe to a background comparison job as server-sent events"""
+    try:
+        job, error = await sync_to_async(get_comparison_job)(request, job_id)
+        if error:
+            return error
+        response = StreamingHttpResponse(ajob_events(job.id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        print(f'Job events error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to stream job events',
+            'details': str(e)
+        }, status=500)
@@ -0,0 +1,156 @@
+"""
+JWT authentication with validated-token caching and lazy user loading
+"""
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
+
+User = get_user_model()
+
+# token -> (user_id, expires_at, checked_at); tokens are only cached after full
+# validation, and while their user exists and is active
+_validated_tokens = OrderedDict()
+_lock = threading.Lock()
+
+
+class LazyUser(SimpleLazyObject):
+    """
+    Authenticated user whose row is only fetched when a field other than the id
+    is needed. The row is loaded at most once.
+    """
+
+    def __init__(self, user_id):
+        super().__init__(lambda: User.objects.get(id=user_id))
+        self.__dict__['id'] = user_id
+        self.__dict__['pk'] = user_id
+
+
+def _lookup(token):
+    """(user id, expires at, whether the user row is due a check) of an access token; raises if it is invalid"""
+    with _lock:
+        entry = _validated_tokens.get(token)
+        if entry is not None:
+            user_id, expires_at, checked_at = entry
+            if expires_at > time.time():
+                _validated_tokens.move_to_end(token)
+                return user_id, expires_at, time.time() - checked_at >= settings.AUTH_USER_CHECK_INTERVAL
+            del _validated_tokens[token]
+
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    access_token = AccessToken(token)
+    return access_token['user_id'], access_token['exp'], True
+
+
+def _remember(token, user_id, expires_at):
+    with _lock:
+        _validated_tokens[token] = (user_id, expires_at, time.time())
+        _validated_tokens.move_to_end(token)
+        while len(_validated_tokens) > settings.AUTH_TOKEN_CACHE_SIZE:
+            _validated_tokens.popitem(last=False)
+
+
+def _forget(token):
+    with _lock:
+        _validated_tokens.pop(token, None)
+
+
+def forget_user(user_id):
+    """Drop the cached tokens of a user, e.g. one that was deleted or deactivated"""
+    with _lock:
+        for token in [token for token, entry in _validated_tokens.items() if entry[0] == user_id]:
+            del _validated_tokens[token]
+
+
+def user_changed(sender, instance, **kwargs):
+    """post_save/post_delete receiver: tokens of a deleted or deactivated user stop authenticating at once"""
+    if kwargs.get('origin') is not None or not instance.is_active:
+        forget_user(instance.pk)
+
+
+def _is_active_user(user_id):
+    return User.objects.filter(id=user_id, is_active=True).exists()
+
+
+def get_user_id(token):
+    """
+    Validate an access token and return the id of its user, or None when the
+    user no longer exists or is inactive. Validated tokens are cached until they
+    expire; the user row is checked again every AUTH_USER_CHECK_INTERVAL seconds.
+    """
+    user_id, expires_at, check = _lookup(token)
+    if check:
+        if not _is_active_user(user_id):
+            _forget(token)
+            return None
+        _remember(token, user_id, expires_at)
+    return user_id
+
+
+async def aget_user_id(token):
+    """get_user_id for async views"""
+    user_id, expires_at, check = _lookup(token)
+    if check:
+        if not await sync_to_async(_is_active_user)(user_id):
+            _forget(token)
+            return None
+        _remember(token, user_id, expires_at)
+    return user_id
+
+
+def issue_tokens(user):
+    """Access and refresh tokens for a user that just registered or logged in"""
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    refresh = RefreshToken.for_user(user)
+    return {
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+    }
+
+
+def _bearer_token(request):
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(' ')[1]
+    return None
+
+
+def get_authenticated_user(request):
+    """Helper function to get authenticated user from JWT token"""
+    if hasattr(request, '_jwt_user'):
+        return request._jwt_user
+
+    user = None
+    try:
+        token = _bearer_token(request)
+        user_id = get_user_id(token) if token else None
+        if user_id is not None:
+            user = LazyUser(user_id)
+    except Exception:
+        user = None
+
+    request._jwt_user = user
+    return user
+
+
+async def aget_authenticated_user(request):
+    """get_authenticated_user for async views"""
+    if hasattr(request, '_jwt_user'):
+        return request._jwt_user
+
+    user = None
+    try:
+        token = _bearer_token(request)
+        user_id = await aget_user_id(token) if token else None
+        if user_id is not None:
+            user = LazyUser(user_id)
+    except Exception:
+        user = None
+
+    request._jwt_user = user
+    return user
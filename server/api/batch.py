@@ -0,0 +1,368 @@
+"""
+Batch comparison jobs: prompt suites run through compare-with-rubric in the background
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+from .models import BatchItem, BatchJob
+from .providers import get_provider
+from .rubric import CRITERIA, rubric_comparison
+
+# how often a followed results stream checks for newly finished items
+RESULTS_POLL_INTERVAL = 1.0
+# items read per query by a results stream
+RESULTS_CHUNK = 100
+
+# prompts of every job running in this process share these workers
+_executor = ThreadPoolExecutor(
+    max_workers=settings.BATCH_CONCURRENCY,
+    thread_name_prefix='batch',
+)
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+def parse_prompts(prompts):
+    """Validate a list of prompt strings"""
+    if not isinstance(prompts, list) or not prompts:
+        raise InvalidBatch('prompts must be a non-empty list')
+    if len(prompts) > settings.BATCH_MAX_PROMPTS:
+        raise InvalidBatch(f'A batch can have at most {settings.BATCH_MAX_PROMPTS} prompts')
+    for i, prompt in enumerate(prompts):
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise InvalidBatch(f'Prompt {i} must be a non-empty string')
+    return prompts
+
+
+def read_jsonl(lines):
+    """Prompts from JSONL lines, each a JSON string or an object with a "prompt" key"""
+    prompts = []
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise InvalidBatch(f'Line {number} is not valid JSON: {str(e)}')
+        prompts.append(value.get('prompt') if isinstance(value, dict) else value)
+    return parse_prompts(prompts)
+
+
+def create_job(user_id, prompts, providers, rubric_mode, use_cache=True):
+    with transaction.atomic():
+        job = BatchJob.objects.create(
+            user_id=user_id,
+            providers=[provider.name for provider in providers],
+            rubric_mode=rubric_mode,
+            use_cache=use_cache,
+            total=len(prompts),
+        )
+        BatchItem.objects.bulk_create(
+            [BatchItem(job=job, index=i, prompt=prompt) for i, prompt in enumerate(prompts)],
+            batch_size=500,
+        )
+    return job
+
+
+def _stale_before():
+    return timezone.now() - timedelta(seconds=settings.BATCH_STALE_SECONDS)
+
+
+def is_active(job):
+    """Whether some worker is currently running the job"""
+    return (
+        job.status in (BatchJob.PENDING, BatchJob.RUNNING)
+        and job.heartbeat_at is not None
+        and job.heartbeat_at >= _stale_before()
+    )
+
+
+def resumable_jobs():
+    """Unfinished jobs that no worker is running (never started or interrupted)"""
+    return BatchJob.objects.filter(
+        Q(heartbeat_at__isnull=True) | Q(heartbeat_at__lt=_stale_before()),
+        status__in=[BatchJob.PENDING, BatchJob.RUNNING],
+    )
+
+
+def claim(job_id):
+    """Mark a job as run by this worker; False if it is finished or another worker has it"""
+    return resumable_jobs().filter(pk=job_id).update(
+        status=BatchJob.RUNNING, heartbeat_at=timezone.now()
+    ) == 1
+
+
+def start_job(job_id):
+    """Claim a job and run it on a background thread; False if it can't be claimed"""
+    if not claim(job_id):
+        return False
+    threading.Thread(target=run_job, args=(job_id,), name=f'batch-{job_id}', daemon=True).start()
+    return True
+
+
+def run_job(job_id):
+    """Run a claimed job to completion in this thread"""
+    try:
+        BatchRunner(job_id).run()
+    except Exception as e:
+        print(f'Batch {job_id} error: {str(e)}')
+    finally:
+        close_old_connections()
+
+
+def cancel_job(job):
+    """Stop a job; items already finished keep their results"""
+    return BatchJob.objects.filter(
+        pk=job.pk, status__in=[BatchJob.PENDING, BatchJob.RUNNING]
+    ).update(status=BatchJob.CANCELLED, finished_at=timezone.now()) == 1
+
+
+class BatchRunner:
+    """
+    Runs the unfinished items of a claimed job.
+
+    At most BATCH_CONCURRENCY prompts (and no more than the providers'
+    concurrency limits) are in flight. Calls still queue on the providers' rate
+    limiters; the runner also waits while a provider's circuit is open and backs
+    off after rate-limited failures. Failed prompts are retried in later passes
+    up to BATCH_MAX_ATTEMPTS. Each finished item is saved straight away and the
+    job's heartbeat is refreshed, so an interrupted job resumes where it stopped.
+    """
+
+    def __init__(self, job_id):
+        self.job = BatchJob.objects.get(pk=job_id)
+        self.providers = [get_provider(name) for name in self.job.providers]
+        self.concurrency = max(1, min(
+            [settings.BATCH_CONCURRENCY] + [provider.limiter.concurrency for provider in self.providers]
+        ))
+        self.heartbeat_interval = settings.BATCH_STALE_SECONDS / 3
+        self._seq = self.job.items.aggregate(seq=Max('seq'))['seq'] or 0
+
+    def run(self):
+        while True:
+            pending = list(self.job.items.filter(status=BatchItem.PENDING).only('id', 'prompt', 'attempts'))
+            if not pending:
+                break
+            if not self._run_pass(pending):
+                return
+        self._finish()
+
+    def _heartbeat(self):
+        """Refresh the heartbeat; False if the job was cancelled meanwhile"""
+        return BatchJob.objects.filter(pk=self.job.pk, status=BatchJob.RUNNING).update(
+            heartbeat_at=timezone.now()
+        ) == 1
+
+    def _wait_for_providers(self):
+        """Hold off while a provider's circuit is open; False if the job was cancelled"""
+        while any(provider.breaker.is_open for provider in self.providers):
+            if not self._heartbeat():
+                return False
+            time.sleep(min(settings.BREAKER_OPEN_SECONDS, self.heartbeat_interval))
+        return True
+
+    def _run_pass(self, items):
+        """Run items once; returns False if the job was cancelled"""
+        queue = deque(items)
+        futures = {}
+        try:
+            while queue or futures:
+                if not self._wait_for_providers():
+                    return False
+                while queue and len(futures) < self.concurrency:
+                    item = queue.popleft()
+                    futures[_executor.submit(self._compare, item.prompt)] = item
+
+                done, _ = wait(futures, timeout=self.heartbeat_interval, return_when=FIRST_COMPLETED)
+                throttled = False
+                for future in done:
+                    throttled |= self._record(futures.pop(future), future)
+                if not self._heartbeat():
+                    return False
+                if throttled:
+                    time.sleep(settings.RATE_LIMIT_BACKOFF)
+            return True
+        finally:
+            # prompts not yet started stay pending for a resume
+            for future in futures:
+                future.cancel()
+
+    def _compare(self, prompt):
+        provider_a, provider_b = self.providers
+        return rubric_comparison(prompt, provider_a, provider_b, self.job.rubric_mode, use_cache=self.job.use_cache)
+
+    def _record(self, item, future):
+        """Save an item's outcome; returns True if it failed for being rate limited"""
+        try:
+            results, evaluation = future.result()
+        except Exception as e:
+            results, evaluation, error = {}, None, str(e)
+        else:
+            if evaluation is None:
+                error = '; '.join(
+                    f"{name}: {result['error']}" for name, result in results.items() if result.get('error')
+                )
+            elif not evaluation.get('success'):
+                error = evaluation.get('error')
+            else:
+                error = ''
+        retryable = any(result.get('retryable') for result in results.values()) or bool(
+            evaluation and evaluation.get('retryable')
+        )
+
+        item.attempts += 1
+        item.result = {'responses': results, 'evaluation': evaluation}
+        item.error = error
+        if error and item.attempts < settings.BATCH_MAX_ATTEMPTS:
+            # stays pending and is retried in the next pass
+            item.save(update_fields=['attempts', 'result', 'error'])
+            return retryable
+
+        self._seq += 1
+        item.seq = self._seq
+        item.status = BatchItem.FAILED if error else BatchItem.DONE
+        item.finished_at = timezone.now()
+        counter = 'failed' if error else 'done'
+        with transaction.atomic():
+            item.save(update_fields=['attempts', 'result', 'error', 'seq', 'status', 'finished_at'])
+            BatchJob.objects.filter(pk=self.job.pk).update(**{counter: F(counter) + 1})
+        return retryable
+
+    def _finish(self):
+        BatchJob.objects.filter(pk=self.job.pk, status=BatchJob.RUNNING).update(
+            status=BatchJob.COMPLETED,
+            summary=aggregate_scores(self.job),
+            finished_at=timezone.now(),
+        )
+
+
+def aggregate_scores(job):
+    """Mean rubric scores, wins and ties per model over a job's scored items"""
+    name_a, name_b = job.providers
+    keys = CRITERIA + ['total']
+    sums = {name: dict.fromkeys(keys, 0) for name in job.providers}
+    counts = {name: {'scored': 0, 'wins': 0, 'ties': 0} for name in job.providers}
+
+    results = job.items.filter(status=BatchItem.DONE).values_list('result', flat=True)
+    for result in results.iterator(chunk_size=200):
+        rubric = (result.get('evaluation') or {}).get('rubric') or {}
+        scores = {name_a: rubric.get('response_a'), name_b: rubric.get('response_b')}
+        if not all(scores.values()):
+            continue
+        for name, score in scores.items():
+            counts[name]['scored'] += 1
+            for key in keys:
+                sums[name][key] += score.get(key, 0)
+        total_a, total_b = scores[name_a].get('total', 0), scores[name_b].get('total', 0)
+        if total_a == total_b:
+            counts[name_a]['ties'] += 1
+            counts[name_b]['ties'] += 1
+        else:
+            counts[name_a if total_a > total_b else name_b]['wins'] += 1
+
+    return {
+        name: {
+            **counts[name],
+            'mean': {
+                key: round(sums[name][key] / counts[name]['scored'], 2) if counts[name]['scored'] else None
+                for key in keys
+            },
+        }
+        for name in job.providers
+    }
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'active': is_active(job),
+        'providers': job.providers,
+        'rubric_mode': job.rubric_mode,
+        'total': job.total,
+        'done': job.done,
+        'failed': job.failed,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        # aggregated so far until the job completes
+        'summary': job.summary if job.summary is not None else aggregate_scores(job),
+    }
+
+
+def item_to_dict(item):
+    line = {
+        'index': item.index,
+        'prompt': item.prompt,
+        'status': item.status,
+        'attempts': item.attempts,
+        **(item.result or {}),
+    }
+    if item.error:
+        line['error'] = item.error
+    return line
+
+
+def _finished_lines(job_id, last_seq):
+    """JSONL lines of up to RESULTS_CHUNK items finished after last_seq, and the seq of the last one"""
+    items = list(BatchItem.objects.filter(job_id=job_id, seq__gt=last_seq).order_by('seq')[:RESULTS_CHUNK])
+    if not items:
+        return [], last_seq
+    return [json.dumps(item_to_dict(item)) + '\n' for item in items], items[-1].seq
+
+
+def _is_running(job_id):
+    return is_active(BatchJob.objects.only('status', 'heartbeat_at').get(pk=job_id))
+
+
+def stream_results(job_id, follow=False):
+    """
+    Yield a job's finished items as JSONL lines in the order they finished.
+
+    With follow, keep waiting for more until the job stops running.
+    """
+    last_seq = 0
+    while True:
+        lines, last_seq = _finished_lines(job_id, last_seq)
+        if lines:
+            yield from lines
+            continue
+        if not follow:
+            return
+        if not _is_running(job_id):
+            # one more pass for items that finished since the query above
+            follow = False
+            continue
+        time.sleep(RESULTS_POLL_INTERVAL)
+
+
+async def astream_results(job_id, follow=False):
+    """
+    Async counterpart of stream_results for ASGI, where Django buffers a sync
+    iterator whole; waiting for items doesn't hold a thread.
+    """
+    last_seq = 0
+    while True:
+        lines, last_seq = await sync_to_async(_finished_lines)(job_id, last_seq)
+        if lines:
+            for line in lines:
+                yield line
+            continue
+        if not follow:
+            return
+        if not await sync_to_async(_is_running)(job_id):
+            follow = False
+            continue
+        await asyncio.sleep(RESULTS_POLL_INTERVAL)
@@ -0,0 +1,130 @@
+"""
+Circuit breakers that fail fast while a provider is down
+"""
+import os
+import threading
+import time
+from collections import deque
+from django.conf import settings
+
+
+class CircuitOpen(Exception):
+    """The provider's circuit is open; the call was not attempted"""
+
+
+class CircuitBreaker:
+    """
+    Track recent call outcomes for one provider and stop calling it once too
+    many fail.
+
+    The circuit opens when at least min_calls of the last window calls were
+    recorded and failure_rate of them failed. While open, calls raise
+    CircuitOpen immediately and a background thread probes the provider,
+    first after open_seconds and then with doubling intervals (capped at
+    max_open_seconds); the first successful probe closes the circuit.
+    """
+
+    def __init__(self, name, probe, window, min_calls, failure_rate, open_seconds, max_open_seconds):
+        self.name = name
+        self.probe = probe
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.is_open = False
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._retry_in = open_seconds
+        self._prober = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'opened': 0,
+            'rejected': 0,
+            'probes': 0,
+        }
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def check(self):
+        """Raise CircuitOpen if calls to the provider should not be attempted"""
+        if not self.is_open or not settings.BREAKER_ENABLED:
+            return
+        # a forked worker inherits an open circuit but not the probe thread
+        self._ensure_probing()
+        with self._lock:
+            self._stats['rejected'] += 1
+        raise CircuitOpen(f'{self.name} is unavailable (circuit open), failing fast')
+
+    def record_success(self):
+        with self._lock:
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        if not settings.BREAKER_ENABLED:
+            return
+        with self._lock:
+            self._outcomes.append(False)
+            if self.is_open or len(self._outcomes) < self.min_calls:
+                return
+            failures = self._outcomes.count(False)
+            if failures / len(self._outcomes) < self.failure_rate:
+                return
+            self.is_open = True
+            self._opened_at = time.monotonic()
+            self._retry_in = self.open_seconds
+            self._stats['opened'] += 1
+        print(f'{self.name} circuit opened after {failures} failed calls')
+        self._ensure_probing()
+
+    def _ensure_probing(self):
+        if self._prober is None or not self._prober.is_alive():
+            with self._lock:
+                if self.is_open and (self._prober is None or not self._prober.is_alive()):
+                    self._prober = threading.Thread(
+                        target=self._probe_until_closed, name=f'{self.name}-probe', daemon=True
+                    )
+                    self._prober.start()
+
+    def _probe_until_closed(self):
+        while self.is_open:
+            time.sleep(self._retry_in)
+            with self._lock:
+                self._stats['probes'] += 1
+            try:
+                self.probe()
+            except Exception as e:
+                print(f'{self.name} probe error: {str(e)}')
+                self._retry_in = min(self._retry_in * 2, self.max_open_seconds)
+                continue
+            with self._lock:
+                self.is_open = False
+                self._opened_at = None
+                self._outcomes.clear()
+            print(f'{self.name} circuit closed, provider recovered')
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._prober = None
+
+    def stats(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            opened_at = self._opened_at
+            stats = dict(self._stats)
+        stats['state'] = 'open' if opened_at is not None else 'closed'
+        stats['failure_rate'] = round(outcomes.count(False) / len(outcomes), 2) if outcomes else 0.0
+        if opened_at is not None:
+            stats['open_for'] = round(time.monotonic() - opened_at, 1)
+        return stats
+
+
+def create_breaker(name, probe):
+    """Circuit breaker for a provider from the BREAKER_* settings"""
+    return CircuitBreaker(
+        name,
+        probe,
+        window=settings.BREAKER_WINDOW,
+        min_calls=settings.BREAKER_MIN_CALLS,
+        failure_rate=settings.BREAKER_FAILURE_RATE,
+        open_seconds=settings.BREAKER_OPEN_SECONDS,
+        max_open_seconds=settings.BREAKER_MAX_OPEN_SECONDS,
+    )
@@ -0,0 +1,236 @@
+"""
+Content-addressed cache for AI provider responses
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from .singleflight import AsyncSingleFlight, SingleFlight
+
+
+class LocalMemoryBackend:
+    """Per-process LRU cache with TTL expiry"""
+
+    blocking = False
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheBackend:
+    """Stores entries in a Django cache alias (shared across workers for db/redis/memcached caches)"""
+
+    blocking = True
+
+    def __init__(self, ttl, max_entries, alias='default'):
+        self.ttl = ttl
+        self.alias = alias
+
+    def get(self, key):
+        return caches[self.alias].get(f'ai-response:{key}')
+
+    def set(self, key, value):
+        caches[self.alias].set(f'ai-response:{key}', value, timeout=self.ttl)
+
+    def clear(self):
+        caches[self.alias].clear()
+
+
+_backend_classes = {
+    'local': LocalMemoryBackend,
+    'django': DjangoCacheBackend,
+    # the 'responses' alias is a DatabaseCache table (run `manage.py createcachetable`)
+    'database': lambda ttl, max_entries: DjangoCacheBackend(ttl, max_entries, alias='responses'),
+}
+_backend = None
+_backend_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'coalesced': 0}
+_stats_lock = threading.Lock()
+
+
+def register_backend(name, factory):
+    """Make a cache backend selectable through RESPONSE_CACHE_BACKEND"""
+    _backend_classes[name] = factory
+
+
+def get_backend():
+    """Get the configured cache backend, creating it on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                factory = _backend_classes[settings.RESPONSE_CACHE_BACKEND]
+                _backend = factory(settings.RESPONSE_CACHE_TTL, settings.RESPONSE_CACHE_MAX_ENTRIES)
+    return _backend
+
+
+def set_backend(backend):
+    """Replace the active backend (None re-reads the settings on next use)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    """Hit/miss/coalesced counters for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    stats['backend'] = settings.RESPONSE_CACHE_BACKEND
+    return stats
+
+
+def make_key(namespace, args, params):
+    """Hash of the provider, the prompt arguments and the generation parameters (incl. model)"""
+    payload = json.dumps({'namespace': namespace, 'args': args, 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def should_use_cache(request, data):
+    """Per-request bypass via {"cache": false} or a Cache-Control: no-cache header"""
+    if data.get('cache') is False:
+        return False
+    return 'no-cache' not in request.headers.get('Cache-Control', '')
+
+
+def _cacheable(result):
+    return not result.get('error') and result.get('success', True)
+
+
+def _shared_result(result, shared):
+    """Give every caller of a coalesced call its own copy of the result"""
+    if shared:
+        _count('coalesced')
+        return {**result, 'coalesced': True}
+    return dict(result)
+
+
+def _lookup(backend, key):
+    """Read an entry; a failing cache backend counts as a miss rather than an error"""
+    try:
+        return backend.get(key)
+    except Exception as e:
+        print(f'Response cache error: {str(e)}')
+        return None
+
+
+def _store(backend, key, result):
+    try:
+        backend.set(key, dict(result))
+    except Exception as e:
+        print(f'Response cache error: {str(e)}')
+
+
+def cache_response(namespace, **params):
+    """
+    Cache successful results of a provider call and coalesce identical calls.
+
+    The wrapped function gains a use_cache keyword; use_cache=False skips both the
+    cache and coalescing. Hits are returned with 'cached': True, results shared
+    with a concurrent identical call with 'coalesced': True. Works for both plain
+    and async provider functions.
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            flights = AsyncSingleFlight()
+
+            async def compute(backend, key, *args):
+                result = await func(*args)
+                if backend is not None and _cacheable(result):
+                    if backend.blocking:
+                        await sync_to_async(_store)(backend, key, result)
+                    else:
+                        _store(backend, key, result)
+                return result
+
+            @wraps(func)
+            async def async_wrapper(*args, use_cache=True):
+                if not use_cache:
+                    _count('bypassed')
+                    return await func(*args)
+
+                key = make_key(namespace, args, params)
+                backend = get_backend() if settings.RESPONSE_CACHE_ENABLED else None
+                if backend is not None:
+                    if backend.blocking:
+                        hit = await sync_to_async(_lookup)(backend, key)
+                    else:
+                        hit = _lookup(backend, key)
+                    if hit is not None:
+                        _count('hits')
+                        return {**hit, 'cached': True}
+                    _count('misses')
+
+                if not settings.SINGLE_FLIGHT_ENABLED:
+                    return await compute(backend, key, *args)
+                result, shared = await flights.do(key, compute, backend, key, *args)
+                return _shared_result(result, shared)
+            return async_wrapper
+
+        flights = SingleFlight()
+
+        def compute(backend, key, *args):
+            result = func(*args)
+            if backend is not None and _cacheable(result):
+                _store(backend, key, result)
+            return result
+
+        @wraps(func)
+        def wrapper(*args, use_cache=True):
+            if not use_cache:
+                _count('bypassed')
+                return func(*args)
+
+            key = make_key(namespace, args, params)
+            backend = get_backend() if settings.RESPONSE_CACHE_ENABLED else None
+            if backend is not None:
+                hit = _lookup(backend, key)
+                if hit is not None:
+                    _count('hits')
+                    return {**hit, 'cached': True}
+                _count('misses')
+
+            if not settings.SINGLE_FLIGHT_ENABLED:
+                return compute(backend, key, *args)
+            result, shared = flights.do(key, compute, backend, key, *args)
+            return _shared_result(result, shared)
+        return wrapper
+    return decorator
@@ -0,0 +1,178 @@
+"""
+Process-wide registry of AI provider SDK clients
+
+The SDKs are imported when their first client is built rather than at module
+load: google.generativeai and groq account for most of a worker's import time.
+"""
+import asyncio
+import importlib
+import os
+import threading
+import weakref
+from django.conf import settings
+
+# imported by preload_sdks() (and by the first client built from each)
+SDK_MODULES = ['httpx', 'groq', 'google.generativeai']
+
+GROQ_MODEL = 'llama-3.3-70b-versatile'
+GEMINI_MODEL = 'gemini-flash-latest'
+
+_factories = {}
+_clients = {}
+# clients whose connections belong to an event loop: one per loop, dropped with it
+_per_loop = set()
+_loop_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+# genai.configure() drops the SDK's shared clients, so it is only called once
+_gemini_configured = False
+
+
+def register_client(name, factory, per_loop=False):
+    """
+    Register the factory used to build a provider client; per_loop clients are
+    built once for each event loop that uses them.
+
+    Replacing a factory drops any client already built from the old one, so tests
+    can swap in a local stand-in backend before the next call.
+    """
+    with _lock:
+        _factories[name] = factory
+        _clients.pop(name, None)
+        for clients in _loop_clients.values():
+            clients.pop(name, None)
+        if per_loop:
+            _per_loop.add(name)
+        else:
+            _per_loop.discard(name)
+
+
+def _get_loop_client(name):
+    loop = asyncio.get_running_loop()
+    client = _loop_clients.get(loop, {}).get(name)
+    if client is not None:
+        return client
+
+    with _lock:
+        clients = _loop_clients.setdefault(loop, {})
+        if name not in clients:
+            clients[name] = _factories[name]()
+        return clients[name]
+
+
+def get_client(name):
+    """Get the shared client for a provider (for per_loop ones, the running loop's), creating it on first use"""
+    if name in _per_loop:
+        return _get_loop_client(name)
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    with _lock:
+        if name not in _clients:
+            if name not in _factories:
+                raise KeyError(f'No client registered for provider {name!r}')
+            _clients[name] = _factories[name]()
+        return _clients[name]
+
+
+def reset_clients():
+    """Drop every built client so the next call creates fresh ones"""
+    with _lock:
+        _clients.clear()
+        _loop_clients.clear()
+
+
+def preload_sdks():
+    """
+    Import the provider SDKs now, e.g. in a pre-fork parent process (gunicorn
+    --preload) so workers share the imported modules copy-on-write
+    """
+    for module in SDK_MODULES:
+        importlib.import_module(module)
+
+
+def _create_groq_client():
+    """Groq client with a pooled keep-alive HTTP connection pool (thread-safe)"""
+    import httpx
+    from groq import DefaultHttpxClient, Groq
+
+    return Groq(
+        api_key=settings.GROQ_API_KEY,
+        # 429s go back to the provider's rate limiter instead of being retried here
+        max_retries=0,
+        http_client=DefaultHttpxClient(limits=httpx.Limits(
+            max_connections=settings.PROVIDER_POOL_SIZE,
+            max_keepalive_connections=settings.PROVIDER_POOL_SIZE,
+        )),
+    )
+
+
+def _create_groq_async_client():
+    """
+    AsyncGroq client for the ASGI views; its connections belong to the event loop
+    that uses them, so it is registered per loop
+    """
+    import httpx
+    from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+    return AsyncGroq(
+        api_key=settings.GROQ_API_KEY,
+        # 429s go back to the provider's rate limiter instead of being retried here
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+            max_connections=settings.PROVIDER_POOL_SIZE,
+            max_keepalive_connections=settings.PROVIDER_POOL_SIZE,
+        )),
+    )
+
+
+def _configure_gemini():
+    """Set the process-wide google.generativeai configuration once; called under _lock"""
+    global _gemini_configured
+    import google.generativeai as genai
+
+    if not _gemini_configured:
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+        _gemini_configured = True
+    return genai
+
+
+def _create_gemini_client():
+    """Gemini model for sync calls, on google.generativeai's process-wide client (thread-safe)"""
+    genai = _configure_gemini()
+    return genai.GenerativeModel(GEMINI_MODEL)
+
+
+def _create_gemini_async_client():
+    """
+    Gemini model for the ASGI views. google.generativeai would hand every model its
+    one process-wide async client, whose channel belongs to the loop that first used
+    it, so each loop's model is given a GenerativeServiceAsyncClient of its own
+    (built from the same configuration as the sync client).
+    """
+    genai = _configure_gemini()
+    from google.generativeai.client import _client_manager
+
+    model = genai.GenerativeModel(GEMINI_MODEL)
+    # make_client builds a new client each time; get_default_client would share one
+    model._async_client = _client_manager.make_client('generative_async')
+    return model
+
+
+register_client('groq', _create_groq_client)
+register_client('groq_async', _create_groq_async_client, per_loop=True)
+register_client('gemini', _create_gemini_client)
+register_client('gemini_async', _create_gemini_async_client, per_loop=True)
+
+
+def _reset_after_fork():
+    """Connections must not be shared across forked workers (e.g. gunicorn --preload)"""
+    global _lock, _gemini_configured
+    _lock = threading.Lock()
+    # the SDK's shared clients were built in the parent; configuring again rebuilds them
+    _gemini_configured = False
+    _clients.clear()
+    _loop_clients.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
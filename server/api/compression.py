@@ -0,0 +1,164 @@
+"""
+Compression of stored history text (prompts and model responses)
+"""
+import struct
+import threading
+import time
+import zlib
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:
+    # zlib only; HISTORY_COMPRESSION=zstd needs `pip install zstandard`
+    zstandard = None
+
+PLAIN = 0
+ZLIB = 1
+ZSTD = 2
+CODECS = {'none': PLAIN, 'zlib': ZLIB, 'zstd': ZSTD}
+CODEC_NAMES = {value: name for name, value in CODECS.items()}
+# every stored value starts with its codec and the id of its dictionary (0: none)
+HEADER = struct.Struct('>BI')
+# deflate only looks back 32 KiB, so a longer zlib dictionary is wasted
+ZLIB_MAX_DICTIONARY = 32 * 1024
+# how long a process keeps using a dictionary before it checks for a newer one (seconds)
+DICTIONARY_REFRESH = 300
+
+# dictionaries never change once saved, so they are cached for good
+_dictionaries = {}
+_active = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_dictionary(dictionary_id):
+    """Data of a saved CompressionDictionary"""
+    data = _dictionaries.get(dictionary_id)
+    if data is None:
+        from .models import CompressionDictionary
+        data = bytes(CompressionDictionary.objects.values_list('data', flat=True).get(pk=dictionary_id))
+        _dictionaries[dictionary_id] = data
+    return data
+
+
+def active_dictionary_id(codec, refresh=False):
+    """
+    Newest dictionary trained for codec (0 when there is none or
+    HISTORY_COMPRESSION_DICTIONARY is off), looked up at most every
+    DICTIONARY_REFRESH seconds unless refresh is set
+    """
+    if codec == PLAIN or not settings.HISTORY_COMPRESSION_DICTIONARY:
+        return 0
+    with _lock:
+        cached = _active.get(codec)
+        if not refresh and cached is not None and time.monotonic() - cached[1] < DICTIONARY_REFRESH:
+            return cached[0]
+    from .models import CompressionDictionary
+    try:
+        dictionary_id = CompressionDictionary.objects.filter(codec=CODEC_NAMES[codec]).order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+    except Exception as e:
+        # compress without one rather than fail the write
+        print(f'Compression dictionary error: {str(e)}')
+        return 0
+    with _lock:
+        _active[codec] = (dictionary_id, time.monotonic())
+    return dictionary_id
+
+
+def _zstd():
+    if zstandard is None:
+        raise RuntimeError('zstd compressed data needs the zstandard package (pip install zstandard)')
+    return zstandard
+
+
+def _zstd_dict(dictionary_id):
+    return _zstd().ZstdCompressionDict(get_dictionary(dictionary_id)) if dictionary_id else None
+
+
+def _zstd_coder(kind, level, dictionary_id):
+    # zstandard (de)compressors may not be shared between threads
+    coders = getattr(_local, 'zstd', None)
+    if coders is None:
+        coders = _local.zstd = {}
+    key = (kind, level, dictionary_id)
+    if key not in coders:
+        if kind == 'compress':
+            coders[key] = _zstd().ZstdCompressor(level=level, dict_data=_zstd_dict(dictionary_id))
+        else:
+            coders[key] = _zstd().ZstdDecompressor(dict_data=_zstd_dict(dictionary_id))
+    return coders[key]
+
+
+def compress(text, codec=None, dictionary_id=None, level=None):
+    """
+    Stored form of text, compressed with codec (default HISTORY_COMPRESSION) and
+    dictionary_id (default: the active one). Short texts, and texts that don't
+    shrink, are stored as they are.
+    """
+    data = text.encode('utf-8')
+    codec = CODECS[codec or settings.HISTORY_COMPRESSION]
+    if codec == PLAIN or len(data) < settings.HISTORY_COMPRESSION_MIN_SIZE:
+        return HEADER.pack(PLAIN, 0) + data
+    if dictionary_id is None:
+        dictionary_id = active_dictionary_id(codec)
+    level = level or settings.HISTORY_COMPRESSION_LEVEL
+
+    if codec == ZLIB:
+        if dictionary_id:
+            compressor = zlib.compressobj(level, zdict=get_dictionary(dictionary_id))
+        else:
+            compressor = zlib.compressobj(level)
+        body = compressor.compress(data) + compressor.flush()
+    else:
+        body = _zstd_coder('compress', level, dictionary_id).compress(data)
+    if len(body) >= len(data):
+        return HEADER.pack(PLAIN, 0) + data
+    return HEADER.pack(codec, dictionary_id) + body
+
+
+def stored_format(value):
+    """(codec, dictionary id) of a stored value"""
+    return HEADER.unpack_from(value)
+
+
+def decompress(value, max_chars=None):
+    """Text of a stored value; with max_chars only as much as that needs is decompressed where the codec allows"""
+    value = memoryview(value)
+    codec, dictionary_id = HEADER.unpack_from(value)
+    body = value[HEADER.size:]
+    # a UTF-8 character is at most 4 bytes
+    limit = max_chars * 4 if max_chars else 0
+
+    if codec == PLAIN:
+        data = bytes(body[:limit] if limit else body)
+    elif codec == ZLIB:
+        if dictionary_id:
+            decompressor = zlib.decompressobj(zdict=get_dictionary(dictionary_id))
+        else:
+            decompressor = zlib.decompressobj()
+        data = decompressor.decompress(body, limit)
+    elif codec == ZSTD:
+        data = _zstd_coder('decompress', 0, dictionary_id).decompress(body)
+    else:
+        raise ValueError(f'Unknown compression codec {codec}')
+
+    if not max_chars:
+        return data.decode('utf-8')
+    # the cut may fall inside a character
+    return data[:limit].decode('utf-8', errors='ignore')[:max_chars]
+
+
+def train_dictionary(samples, codec, size):
+    """Dictionary data for codec from sample texts (at most size bytes)"""
+    codec = CODECS[codec]
+    if codec == ZSTD:
+        return _zstd().train_dictionary(size, [text.encode('utf-8') for text in samples]).as_bytes()
+    if codec == ZLIB:
+        # deflate has no trainer: a preset dictionary is text that later data can
+        # refer back to, with the most useful strings nearest its end
+        data = '\n'.join(samples).encode('utf-8')
+        return data[-min(size, ZLIB_MAX_DICTIONARY):]
+    raise ValueError('Dictionaries need a compression codec')
@@ -0,0 +1,253 @@
+"""
+Concurrent fan-out for AI provider calls
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+from django.conf import settings
+
+# shared by every request in this worker so threads are reused instead of spawned per call
+_executor = ThreadPoolExecutor(
+    max_workers=settings.PROVIDER_MAX_WORKERS,
+    thread_name_prefix='provider',
+)
+
+
+# pipelines wait on provider calls, so they get their own pool instead of
+# tying up (and possibly deadlocking) the provider pool
+_pipeline_executor = ThreadPoolExecutor(
+    max_workers=settings.PROVIDER_MAX_WORKERS,
+    thread_name_prefix='pipeline',
+)
+
+
+def submit(func, *args):
+    """Run func on the shared provider pool"""
+    return _executor.submit(func, *args)
+
+
+def submit_pipeline(func, *args):
+    """Run func, which may itself wait on provider-pool calls, on the pipeline pool"""
+    return _pipeline_executor.submit(func, *args)
+
+
+def _timed(func, *args):
+    """
+    Run a provider call and return a copy of its result with the latency attached
+    (a copy, so a call finishing after fan_out gave up on it changes nothing it returned)
+    """
+    started = time.perf_counter()
+    result = func(*args)
+    return {**result, 'latency_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+
+async def _atimed(func, *args):
+    """Await a provider coroutine and return a copy of its result with the latency attached"""
+    started = time.perf_counter()
+    result = await func(*args)
+    return {**result, 'latency_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+
+def get_provider_timeout(name):
+    """Timeout in seconds for a single provider call"""
+    return settings.PROVIDER_TIMEOUTS.get(name, settings.PROVIDER_TIMEOUT)
+
+
+def failed_result(label, error, started):
+    """Result of a provider call that failed or timed out (started: its perf_counter start)"""
+    return {
+        'model': label,
+        'error': error,
+        'response': f'Failed to get response from {label}',
+        'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def fan_out(calls):
+    """
+    Run provider calls concurrently and collect their results by name.
+
+    calls maps a name (e.g. 'groq') to a (label, func, *args) tuple. Every call
+    gets its own timeout; calls that miss it are reported as errors so the whole
+    fan-out costs about as much as the slowest provider. A running thread can't be
+    cancelled, so the call has to stop itself: Provider calls are bounded by the
+    same timeout (see Provider._call), which frees their worker at about the same
+    time. Calls still queued for a worker are cancelled.
+    """
+    started = time.perf_counter()
+    futures = {
+        name: submit(_timed, func, *args)
+        for name, (label, func, *args) in calls.items()
+    }
+
+    results = {}
+    for name, future in futures.items():
+        label = calls[name][0]
+        timeout = get_provider_timeout(name)
+        try:
+            remaining = timeout - (time.perf_counter() - started)
+            results[name] = future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            future.cancel()
+            print(f'{label} timed out after {timeout}s')
+            results[name] = failed_result(label, f'{label} timed out after {timeout}s', started)
+        except Exception as e:
+            print(f'{label} error: {str(e)}')
+            results[name] = failed_result(label, str(e), started)
+    return results
+
+
+async def afan_out(calls):
+    """
+    Async counterpart of fan_out for the ASGI views.
+
+    calls maps a name to a (label, coroutine_func, *args) tuple. Calls run on the
+    event loop and are cancelled outright when they miss their timeout.
+    """
+    async def run(name, label, func, *args):
+        started = time.perf_counter()
+        timeout = get_provider_timeout(name)
+        try:
+            return await asyncio.wait_for(_atimed(func, *args), timeout)
+        except asyncio.TimeoutError:
+            print(f'{label} timed out after {timeout}s')
+            error = f'{label} timed out after {timeout}s'
+        except Exception as e:
+            print(f'{label} error: {str(e)}')
+            error = str(e)
+        return failed_result(label, error, started)
+
+    results = await asyncio.gather(*(run(name, *call) for name, call in calls.items()))
+    return dict(zip(calls, results))
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls at one call site"""
+
+    def __init__(self, size):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        """The p-th percentile in seconds, or None until HEDGE_MIN_SAMPLES are recorded"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+_hedge_stats = {
+    'hedged': 0,
+    'backup_wins': 0,
+}
+_hedge_stats_lock = threading.Lock()
+
+
+def _count_hedge(name):
+    with _hedge_stats_lock:
+        _hedge_stats[name] += 1
+
+
+def hedge_stats():
+    with _hedge_stats_lock:
+        return dict(_hedge_stats)
+
+
+def _hedge_delay(latency):
+    if latency is None or not settings.HEDGE_ENABLED:
+        return None
+    return latency.percentile(settings.HEDGE_PERCENTILE)
+
+
+def hedge(calls, latency=None):
+    """
+    Run zero-argument calls, in order of preference, until one succeeds.
+
+    The next call starts once the ones in flight have all failed or, when
+    hedging is enabled, once they have run longer than the HEDGE_PERCENTILE
+    latency recorded in latency for the first call. The first success wins and
+    slower calls are abandoned; raises the last error if every call fails.
+    """
+    delay = _hedge_delay(latency)
+    started = time.perf_counter()
+
+    def first():
+        result = calls[0]()
+        if latency is not None:
+            latency.record(time.perf_counter() - started)
+        return result
+
+    futures = {submit(first): 0}
+    next_index = 1
+    error = None
+    while futures:
+        more = next_index < len(calls)
+        done, _ = wait(futures, timeout=delay if more else None, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if index:
+                _count_hedge('backup_wins')
+            return result
+        if more and (not done or not futures):
+            if not done:
+                _count_hedge('hedged')
+            futures[submit(calls[next_index])] = next_index
+            next_index += 1
+    raise error
+
+
+async def ahedge(calls, latency=None):
+    """Async counterpart of hedge; calls are coroutine functions and losers are cancelled"""
+    delay = _hedge_delay(latency)
+    started = time.perf_counter()
+
+    async def first():
+        try:
+            result = await calls[0]()
+        except asyncio.CancelledError:
+            # cancelled for being slower than the hedge, so at least this slow
+            if latency is not None:
+                latency.record(time.perf_counter() - started)
+            raise
+        if latency is not None:
+            latency.record(time.perf_counter() - started)
+        return result
+
+    tasks = {asyncio.ensure_future(first()): 0}
+    next_index = 1
+    error = None
+    try:
+        while tasks:
+            more = next_index < len(calls)
+            done, _ = await asyncio.wait(tasks, timeout=delay if more else None, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = tasks.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if index:
+                    _count_hedge('backup_wins')
+                return result
+            if more and (not done or not tasks):
+                if not done:
+                    _count_hedge('hedged')
+                tasks[asyncio.ensure_future(calls[next_index]())] = next_index
+                next_index += 1
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
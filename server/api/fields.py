@@ -0,0 +1,47 @@
+"""
+Custom model fields
+"""
+from django.db import models
+from django.db.models import ExpressionWrapper, F
+from .compression import compress, decompress
+
+
+class CompressedTextField(models.BinaryField):
+    """
+    Text stored compressed (see api.compression). Values are decompressed as
+    they are loaded, for model instances as well as values(), values_list()
+    and other expressions; use stored_bytes() to read the stored form. Defer
+    the column (only()/defer()) where it isn't read, so it isn't decompressed.
+    The column is binary, so it can't be filtered or searched in SQL.
+    """
+
+    def get_default(self):
+        default = super().get_default()
+        return '' if default == b'' else default
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decompress(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if isinstance(value, str):
+            value = compress(value)
+        return value
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return decompress(value)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+
+def stored_bytes(name):
+    """
+    The stored (compressed) bytes of a CompressedTextField column, for
+    values()/values_list(); as a plain binary expression it isn't decompressed
+    """
+    return ExpressionWrapper(F(name), output_field=models.BinaryField())
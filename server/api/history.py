@@ -0,0 +1,239 @@
+"""
+Write-behind queue for QueryHistory inserts (and other rows written off the request path)
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from .models import ModelResponse, QueryHistory
+from .search import index_entries
+
+
+class HistoryWriter:
+    """
+    Buffers history entries (a QueryHistory row and its ModelResponse rows) and
+    inserts them with bulk_create from a background thread, flushing when
+    flush_size entries are waiting or every flush_interval seconds. An entry
+    without a QueryHistory row holds standalone rows (e.g. ProviderCall).
+    """
+
+    def __init__(self, flush_size, flush_interval, max_queue):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # rows taken off the queue but not yet flushed
+        self._batch = []
+        self._stats = {
+            'flushed': 0,
+            'batches': 0,
+            'sync_writes': 0,
+            'errors': 0,
+            'last_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+        self._stats_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(
+                        target=self._run, name='history-writer', daemon=True
+                    )
+                    self._thread.start()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def offer(self, entry):
+        """Queue a (query, rows) entry; False if the buffer is full and the caller must save it"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self._count('sync_writes')
+            return False
+
+    def _take_batch(self):
+        batch = []
+        try:
+            while len(batch) < self.flush_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = self._batch = []
+            while len(batch) < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop.is_set():
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                self._flush(batch)
+            self._batch = []
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                queries = QueryHistory.objects.bulk_create([query for query, _ in batch if query is not None])
+                if any(query.pk is None for query in queries):
+                    raise RuntimeError('database did not return ids from bulk insert')
+                rows_by_model = defaultdict(list)
+                for query, rows in batch:
+                    for row in rows:
+                        if query is not None:
+                            row.query_id = query.pk
+                        rows_by_model[type(row)].append(row)
+                for model, rows in rows_by_model.items():
+                    model.objects.bulk_create(rows)
+                index_entries(batch)
+        except Exception as e:
+            print(f'History flush error: {str(e)}')
+            # salvage what we can (e.g. an entry whose user was deleted meanwhile)
+            for query, rows in batch:
+                try:
+                    save_entry(query, rows)
+                except Exception as e2:
+                    self._count('errors')
+                    print(f'History write error: {str(e2)}')
+        finally:
+            close_old_connections()
+
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats['flushed'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['last_flush_ms'] = round(elapsed, 2)
+            self._stats['total_flush_ms'] += elapsed
+
+    def drain(self):
+        """Stop the background thread and write everything still buffered"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                break
+            self._flush(batch)
+
+    def reset_after_fork(self):
+        """The writer thread does not survive fork; start a fresh one on next offer"""
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        total_flush_ms = stats.pop('total_flush_ms')
+        stats['avg_flush_ms'] = round(total_flush_ms / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['queue_depth'] = self._queue.qsize() + len(self._batch)
+        return stats
+
+
+_writer = HistoryWriter(
+    flush_size=settings.HISTORY_FLUSH_SIZE,
+    flush_interval=settings.HISTORY_FLUSH_INTERVAL,
+    max_queue=settings.HISTORY_QUEUE_MAX,
+)
+atexit.register(_writer.drain)
+os.register_at_fork(after_in_child=_writer.reset_after_fork)
+
+
+def build_entry(user_id, prompt, mode, responses):
+    """Unsaved QueryHistory row plus one ModelResponse per provider result in responses"""
+    from .providers import get_provider, UnknownProvider
+
+    query = QueryHistory(user_id=user_id, prompt=prompt, mode=mode)
+    rows = []
+    for provider, result in responses.items():
+        if not rows:
+            query.preview = (result.get('response') or '')[:settings.HISTORY_PREVIEW_CHARS]
+        try:
+            model = get_provider(provider).model
+        except UnknownProvider:
+            model = ''
+        cached = bool(result.get('cached') or result.get('coalesced'))
+        # a cached response carries the original call's usage but cost no tokens
+        usage = {} if cached else result.get('usage') or {}
+        rows.append(ModelResponse(
+            provider=provider,
+            model=model,
+            response=result.get('response') or '',
+            latency_ms=result.get('latency_ms'),
+            prompt_tokens=usage.get('prompt_tokens'),
+            completion_tokens=usage.get('completion_tokens'),
+            cached=cached,
+        ))
+    return query, rows
+
+
+def save_entry(query, rows):
+    with transaction.atomic():
+        if query is not None:
+            query.save()
+            for row in rows:
+                row.query = query
+        rows_by_model = defaultdict(list)
+        for row in rows:
+            rows_by_model[type(row)].append(row)
+        for model, model_rows in rows_by_model.items():
+            model.objects.bulk_create(model_rows)
+        index_entries([(query, rows)])
+
+
+def record_query(user_id, prompt, mode, responses):
+    """Save a history entry ({provider: result dict} responses), through the write-behind queue when enabled"""
+    entry = build_entry(user_id, prompt, mode, responses)
+    if not (settings.HISTORY_WRITE_BEHIND and _writer.offer(entry)):
+        save_entry(*entry)
+
+
+async def arecord_query(user_id, prompt, mode, responses):
+    """Async counterpart of record_query; a direct save runs off the event loop"""
+    entry = build_entry(user_id, prompt, mode, responses)
+    if not (settings.HISTORY_WRITE_BEHIND and _writer.offer(entry)):
+        await sync_to_async(save_entry)(*entry)
+
+
+def history_writer_stats():
+    """Queue depth and flush metrics for this process"""
+    return _writer.stats()
+
+
+def flush_history():
+    """Write everything buffered so far (shutdown hook, tests, management commands)"""
+    _writer.drain()
+
+
+def record_rows(rows):
+    """Save standalone rows (e.g. ProviderCall), through the write-behind queue when enabled"""
+    if not (settings.HISTORY_WRITE_BEHIND and _writer.offer((None, rows))):
+        save_entry(None, rows)
+
+
+async def arecord_rows(rows):
+    if not (settings.HISTORY_WRITE_BEHIND and _writer.offer((None, rows))):
+        await sync_to_async(save_entry)(None, rows)
@@ -0,0 +1,315 @@
+"""
+Background compare-with-rubric jobs, queued in the database
+"""
+import asyncio
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .history import record_query
+from .models import ComparisonJob
+from .providers import get_provider
+from .rubric import rubric_comparison
+from .streaming import sse_event
+
+# how many queued jobs a worker tries when claiming without SKIP LOCKED
+CLAIM_CANDIDATES = 5
+# how often an idle pool deletes finished jobs past JOB_RETENTION_SECONDS
+PURGE_INTERVAL = 3600
+# comment lines sent on a quiet event stream so proxies don't close it
+KEEPALIVE_INTERVAL = 15
+
+FINISHED = (ComparisonJob.DONE, ComparisonJob.FAILED)
+
+
+def enqueue_comparison(user_id, prompt, providers, rubric_mode, use_cache=True):
+    """Queue a compare-with-rubric request; returns the job"""
+    job = ComparisonJob.objects.create(
+        user_id=user_id,
+        prompt=prompt,
+        providers=[provider.name for provider in providers],
+        rubric_mode=rubric_mode,
+        use_cache=use_cache,
+    )
+    if settings.JOB_WEB_WORKERS:
+        _web_pool.notify()
+    return job
+
+
+def _claimable():
+    stale = timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    return ComparisonJob.objects.filter(
+        Q(status=ComparisonJob.QUEUED) | Q(status=ComparisonJob.RUNNING, locked_at__lt=stale)
+    ).order_by('created_at')
+
+
+def claim_next(worker):
+    """Take the oldest queued (or abandoned) job for worker; None if the queue is empty"""
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = _claimable().select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            ComparisonJob.objects.filter(pk=job.pk).update(
+                status=ComparisonJob.RUNNING, locked_by=worker, locked_at=now,
+                attempts=F('attempts') + 1, started_at=job.started_at or now,
+            )
+        job.refresh_from_db()
+        return job
+
+    # no SKIP LOCKED (SQLite): claim with a conditional update, moving on if another worker won
+    for job in _claimable()[:CLAIM_CANDIDATES]:
+        claimed = ComparisonJob.objects.filter(pk=job.pk, status=job.status, locked_at=job.locked_at).update(
+            status=ComparisonJob.RUNNING, locked_by=worker, locked_at=now,
+            attempts=F('attempts') + 1, started_at=job.started_at or now,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def _finish(job, worker, status, result, error=''):
+    # a worker that ran past JOB_STALE_SECONDS may have lost the job to another one
+    ComparisonJob.objects.filter(pk=job.pk, locked_by=worker, status=ComparisonJob.RUNNING).update(
+        status=status, result=result, error=error, finished_at=timezone.now()
+    )
+
+
+def run_comparison_job(job, worker):
+    """Run a claimed job and store its result"""
+    if job.attempts > settings.JOB_MAX_ATTEMPTS:
+        _finish(job, worker, ComparisonJob.FAILED, None, 'Job was interrupted too many times')
+        return
+
+    try:
+        provider_a, provider_b = [get_provider(name) for name in job.providers]
+        results, rubric_result = rubric_comparison(
+            job.prompt, provider_a, provider_b, job.rubric_mode, use_cache=job.use_cache
+        )
+    except Exception as e:
+        print(f'Comparison job error: {str(e)}')
+        _finish(job, worker, ComparisonJob.FAILED, None, str(e))
+        return
+
+    if rubric_result is None:
+        error = 'Failed to get responses from one or both AI models'
+        _finish(job, worker, ComparisonJob.FAILED, {'error': error, **results}, error)
+        return
+
+    # saved first so the history already has the query when the client sees the job done
+    if job.user_id is not None and rubric_result.get('success'):
+        record_query(
+            user_id=job.user_id,
+            prompt=job.prompt,
+            mode='compare_with_rubric',
+            responses=results
+        )
+    _finish(job, worker, ComparisonJob.DONE, {
+        'prompt': job.prompt,
+        'responses': results,
+        'evaluation': rubric_result
+    })
+
+
+def purge_finished_jobs():
+    """Delete finished jobs older than JOB_RETENTION_SECONDS"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_RETENTION_SECONDS)
+    deleted, _ = ComparisonJob.objects.filter(status__in=FINISHED, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+class JobWorkerPool:
+    """
+    Threads that take jobs off the database queue and run them.
+
+    Idle workers poll every JOB_POLL_INTERVAL seconds; notify() wakes them at
+    once for jobs queued by this process. Any number of pools, in web processes
+    or run_job_workers processes, can share the queue.
+    """
+
+    def __init__(self, size, name):
+        self.size = size
+        self.name = name
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_purge = 0.0
+        self._stats = {
+            'ran': 0,
+            'errors': 0,
+        }
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _worker_id(self, i):
+        return f'{socket.gethostname()}:{os.getpid()}:{self.name}-{i}'
+
+    def ensure_started(self):
+        if len(self._threads) == self.size and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._lock:
+            self._stop.clear()
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for i in range(len(self._threads), self.size):
+                thread = threading.Thread(
+                    target=self._work, args=(self._worker_id(i),), name=f'{self.name}-{i}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        """A job was queued: start the workers if needed and wake an idle one"""
+        self.ensure_started()
+        self._wake.set()
+
+    def _work(self, worker):
+        while not self._stop.is_set():
+            try:
+                job = claim_next(worker)
+                if job is None:
+                    self._idle()
+                    continue
+                run_comparison_job(job, worker)
+                self._count('ran')
+            except Exception as e:
+                self._count('errors')
+                print(f'Job worker error: {str(e)}')
+                self._stop.wait(settings.JOB_POLL_INTERVAL)
+            finally:
+                close_old_connections()
+
+    def _idle(self):
+        if time.monotonic() - self._last_purge > PURGE_INTERVAL:
+            self._last_purge = time.monotonic()
+            purge_finished_jobs()
+        self._wake.wait(settings.JOB_POLL_INTERVAL)
+        self._wake.clear()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def reset_after_fork(self):
+        """Worker threads do not survive fork; start fresh ones on next notify"""
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._threads = []
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['workers'] = sum(thread.is_alive() for thread in self._threads)
+        return stats
+
+
+_web_pool = JobWorkerPool(settings.JOB_WEB_WORKERS, 'web-jobs')
+os.register_at_fork(after_in_child=_web_pool.reset_after_fork)
+
+
+def start_web_workers(**kwargs):
+    """
+    request_started handler running this web process's job workers, so jobs left
+    queued by a restart are picked up without waiting for a new one to be queued
+    """
+    if settings.JOB_WEB_WORKERS:
+        _web_pool.ensure_started()
+
+
+def job_queue_stats():
+    """Queue depth by status, plus this process's workers"""
+    counts = dict.fromkeys([ComparisonJob.QUEUED, ComparisonJob.RUNNING], 0)
+    rows = ComparisonJob.objects.filter(status__in=list(counts)).values('status').annotate(jobs=Count('id'))
+    for row in rows.order_by():
+        counts[row['status']] = row['jobs']
+    return {**counts, 'web_workers': _web_pool.stats()}
+
+
+def job_status(job):
+    """A job's state as returned by /ai/jobs/<id>, with the result once it finished"""
+    data = {
+        'job_id': str(job.id),
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status in FINISHED:
+        data['result'] = job.result
+    if job.error:
+        data['error'] = job.error
+    return data
+
+
+def _job_snapshot(job_id):
+    """(status, /ai/jobs/<id> body) of a job, or None once it is gone"""
+    job = ComparisonJob.objects.filter(pk=job_id).first()
+    return None if job is None else (job.status, job_status(job))
+
+
+class _JobEventState:
+    """What a job event stream has sent so far; turns snapshots into events"""
+
+    def __init__(self):
+        self.status = None
+        self.last_sent = time.monotonic()
+        self.finished = False
+
+    def events(self, snapshot):
+        if snapshot is None:
+            self.finished = True
+            return [sse_event('end', {'success': False, 'error': 'Job not found'})]
+        status, data = snapshot
+        events = []
+        if status != self.status:
+            self.status = status
+            events.append(sse_event('status', {'job_id': data['job_id'], 'status': status}))
+        if status in FINISHED:
+            self.finished = True
+            events.append(sse_event('result', data))
+            events.append(sse_event('end', {'success': status == ComparisonJob.DONE}))
+        elif not events and time.monotonic() - self.last_sent > KEEPALIVE_INTERVAL:
+            events.append(': keep-alive\n\n')
+        if events:
+            self.last_sent = time.monotonic()
+        return events
+
+
+def job_events(job_id):
+    """
+    Yield SSE events for a job: 'status' whenever its status changes, then
+    'result' (the same body as /ai/jobs/<id>) and 'end' once it has finished.
+    """
+    state = _JobEventState()
+    while True:
+        yield from state.events(_job_snapshot(job_id))
+        if state.finished:
+            return
+        time.sleep(settings.JOB_POLL_INTERVAL)
+
+
+async def ajob_events(job_id):
+    """
+    Async counterpart of job_events for ASGI, where Django buffers a sync
+    iterator whole; waiting between polls doesn't hold a thread.
+    """
+    state = _JobEventState()
+    while True:
+        for event in state.events(await sync_to_async(_job_snapshot)(job_id)):
+            yield event
+        if state.finished:
+            return
+        await asyncio.sleep(settings.JOB_POLL_INTERVAL)
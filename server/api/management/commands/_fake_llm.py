@@ -0,0 +1,222 @@
+"""
+Simulated LLM backends that stand in for the Groq and Gemini clients in benchmark_api
+
+They plug in through clients.register_client in place of the SDK clients, so
+they bypass the SDKs' HTTP layer: everything from the provider classes up runs
+for real, connection pooling and HTTP parsing do not.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+from api.clients import register_client
+from api.rubric import CRITERIA
+
+WORDS = (
+    'the model answers with a short explanation of the question and a few examples that '
+    'cover the common cases before it summarizes the key points for the reader'
+).split()
+
+
+class FakeAPIError(Exception):
+    """An error response from a fake backend, shaped like the SDKs' status errors"""
+
+    def __init__(self, status_code, message, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        headers = {'retry-after': str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class FakeBackend:
+    """
+    A simulated model endpoint.
+
+    Each call waits for a time to first token drawn from a lognormal
+    distribution (median latency_ms, spread jitter), then produces reply_tokens
+    tokens at tokens_per_second. rate_limit_rate of calls fail with a 429
+    carrying Retry-After: retry_after, and error_rate with a 500. Evaluator
+    prompts get valid rubric JSON back.
+    """
+
+    def __init__(self, name, latency_ms=500.0, jitter=0.3, tokens_per_second=250.0, reply_tokens=120,
+                 rate_limit_rate=0.0, error_rate=0.0, retry_after=1, seed=None):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'rate_limited': 0,
+            'errors': 0,
+        }
+
+    def config(self):
+        return {
+            'latency_ms': self.latency_ms,
+            'jitter': self.jitter,
+            'tokens_per_second': self.tokens_per_second,
+            'reply_tokens': self.reply_tokens,
+            'rate_limit_rate': self.rate_limit_rate,
+            'error_rate': self.error_rate,
+        }
+
+    def stats(self):
+        return dict(self._stats)
+
+    def _draw(self):
+        """(seconds to first token, seconds between tokens) for one call; raises the injected errors"""
+        with self._lock:
+            self._stats['calls'] += 1
+            roll = self._random.random()
+            first_token = self.latency_ms / 1000 * self._random.lognormvariate(0, self.jitter)
+            if roll < self.rate_limit_rate:
+                self._stats['rate_limited'] += 1
+                raise FakeAPIError(429, f'{self.name}: rate limit exceeded', retry_after=self.retry_after)
+            if roll < self.rate_limit_rate + self.error_rate:
+                self._stats['errors'] += 1
+                raise FakeAPIError(500, f'{self.name}: internal server error')
+        per_token = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        return first_token, per_token
+
+    def _score(self):
+        with self._lock:
+            return {criterion: self._random.randint(5, 9) for criterion in CRITERIA}
+
+    def reply(self, prompt):
+        """Reply text for prompt: rubric JSON for evaluator prompts, filler words otherwise"""
+        if prompt.startswith('You are an expert AI evaluator'):
+            if 'Evaluate this AI response' in prompt:
+                scores = {**self._score(), 'strengths': ['clear'], 'weaknesses': ['brief']}
+            else:
+                scores = {
+                    'response_a': {**self._score(), 'strengths': ['clear'], 'weaknesses': ['brief']},
+                    'response_b': {**self._score(), 'strengths': ['thorough'], 'weaknesses': ['long']},
+                    'overall_comparison': 'Both responses answer the prompt.',
+                    'recommendation': 'Response A',
+                }
+            return json.dumps(scores)
+        return ' '.join(WORDS[i % len(WORDS)] for i in range(self.reply_tokens))
+
+    def _tokens(self, text):
+        # one word per streamed token keeps the chunk count close to reply_tokens
+        words = text.split(' ')
+        return [word + ' ' for word in words[:-1]] + words[-1:]
+
+    def _usage(self, prompt, text):
+        return len(prompt.split()), len(text.split())
+
+    def complete(self, prompt):
+        first_token, per_token = self._draw()
+        text = self.reply(prompt)
+        time.sleep(first_token + per_token * len(self._tokens(text)))
+        return text, self._usage(prompt, text)
+
+    async def acomplete(self, prompt):
+        first_token, per_token = self._draw()
+        text = self.reply(prompt)
+        await asyncio.sleep(first_token + per_token * len(self._tokens(text)))
+        return text, self._usage(prompt, text)
+
+    def stream(self, prompt):
+        first_token, per_token = self._draw()
+        time.sleep(first_token)
+        for token in self._tokens(self.reply(prompt)):
+            yield token
+            time.sleep(per_token)
+
+    async def astream(self, prompt):
+        first_token, per_token = self._draw()
+        await asyncio.sleep(first_token)
+        for token in self._tokens(self.reply(prompt)):
+            yield token
+            await asyncio.sleep(per_token)
+
+
+def _groq_completion(text, usage):
+    prompt_tokens, completion_tokens = usage
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens),
+    )
+
+
+def _groq_chunk(token):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+
+class FakeGroqClient:
+    """Stands in for groq.Groq (chat.completions.create only)"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, messages, stream=False, **kwargs):
+        prompt = messages[-1]['content']
+        if stream:
+            return (_groq_chunk(token) for token in self.backend.stream(prompt))
+        return _groq_completion(*self.backend.complete(prompt))
+
+
+class FakeAsyncGroqClient:
+    """Stands in for groq.AsyncGroq"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.chat = SimpleNamespace(completions=self)
+
+    async def create(self, messages, stream=False, **kwargs):
+        prompt = messages[-1]['content']
+        if stream:
+            return self._chunks(prompt)
+        return _groq_completion(*await self.backend.acomplete(prompt))
+
+    async def _chunks(self, prompt):
+        async for token in self.backend.astream(prompt):
+            yield _groq_chunk(token)
+
+
+def _gemini_result(text, usage=None):
+    prompt_tokens, completion_tokens = usage or (None, None)
+    return SimpleNamespace(
+        text=text,
+        usage_metadata=SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=completion_tokens),
+    )
+
+
+class FakeGeminiModel:
+    """Stands in for genai.GenerativeModel (generate_content and generate_content_async)"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return (_gemini_result(token) for token in self.backend.stream(prompt))
+        return _gemini_result(*self.backend.complete(prompt))
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._chunks(prompt)
+        return _gemini_result(*await self.backend.acomplete(prompt))
+
+    async def _chunks(self, prompt):
+        async for token in self.backend.astream(prompt):
+            yield _gemini_result(token)
+
+
+def install_fake_backends(groq, gemini):
+    """Route the Groq and Gemini providers to the given FakeBackends"""
+    register_client('groq', lambda: FakeGroqClient(groq))
+    register_client('groq_async', lambda: FakeAsyncGroqClient(groq), per_loop=True)
+    register_client('gemini', lambda: FakeGeminiModel(gemini))
+    register_client('gemini_async', lambda: FakeGeminiModel(gemini), per_loop=True)
@@ -0,0 +1,391 @@
+"""
+Load-test the API endpoints against simulated LLM backends
+"""
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection, connections
+from django.test import RequestFactory, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from api.breaker import create_breaker
+from api.history import flush_history
+from api.metrics import registry as metrics_registry
+from api.models import ModelResponse, QueryHistory, User
+from api.passwords import shutdown_pool
+from api.providers import available_providers, get_provider
+from api.ratelimit import create_limiter
+from api.search import index_entries
+from api.usage import percentile
+from ._fake_llm import WORDS, FakeBackend, install_fake_backends
+
+PASSWORD = 'benchmark-password'
+# history rows seeded for the history and search scenarios (default of --history-size)
+SEEDED_QUERIES = 200
+# seeded prompts are about one of these, so a search matches a share of the history
+SEEDED_TOPICS = [
+    'python generators', 'rust ownership', 'sql indexes', 'http caching',
+    'css grid layouts', 'docker volumes', 'git rebasing', 'tcp handshakes',
+]
+
+
+def _body(prompt):
+    return {'prompt': prompt}
+
+
+# name: (method, path, body for the request's prompt or None, authenticated)
+SCENARIOS = {
+    'single': ('POST', '/api/ai/groq', _body, True),
+    'compare': ('POST', '/api/ai/compare', _body, True),
+    'rubric': ('POST', '/api/ai/compare-with-rubric', _body, True),
+    'stream': ('POST', '/api/ai/compare/stream', _body, True),
+    'history': ('GET', '/api/users/queries?limit=20', None, True),
+    'search': ('GET', '/api/users/queries/search?q=explain+sql+index&limit=20', None, True),
+    'login': ('POST', '/api/auth/login', lambda prompt: {'email': 'bench@example.com', 'password': PASSWORD}, False),
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def call_wsgi(handler, environ):
+    """Serve one request through the WSGI handler, reading the whole body; returns the status code"""
+    status = []
+
+    def start_response(line, headers, exc_info=None):
+        status.append(int(line.split()[0]))
+
+    response = handler(environ, start_response)
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()
+    return status[0]
+
+
+async def call_asgi(handler, method, path, body, headers):
+    """Serve one request through the ASGI handler, reading the whole body; returns the status code"""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 0),
+    }
+    received = False
+    status = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # the client never disconnects
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await handler(scope, receive, send)
+    return status[0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the API endpoints (single model, compare, rubric, stream, history, search, login) against '
+        'simulated LLM backends in a throwaway test database, and report throughput and latency percentiles'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                            help='Scenarios to run (default: all)')
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight')
+        parser.add_argument('--warmup', type=int, default=4, help='Unmeasured requests before each scenario')
+        parser.add_argument('--server', choices=['wsgi', 'asgi'],
+                            help='Handler to drive (default: asgi when ASYNC_AI_VIEWS is on)')
+        parser.add_argument('--history-size', type=int, default=SEEDED_QUERIES,
+                            help='History entries seeded for the history and search scenarios')
+        parser.add_argument('--distinct-prompts', type=int, default=0,
+                            help='Cycle through this many prompts so repeats hit the response cache (0: all distinct)')
+        parser.add_argument('--latency-ms', type=float, default=500.0, help='Median time to first token')
+        parser.add_argument('--jitter', type=float, default=0.3, help='Spread (sigma) of the lognormal latency')
+        parser.add_argument('--tokens-per-second', type=float, default=250.0)
+        parser.add_argument('--reply-tokens', type=int, default=120)
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of calls answered with a 429')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls failing with a 500')
+        parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After of the simulated 429s')
+        parser.add_argument('--rpm', type=int, default=0, help='Rate limit per provider (0: unlimited)')
+        parser.add_argument('--hash-workers', type=int,
+                            help='Password hashing processes (default: PASSWORD_HASH_WORKERS; 0: in the request thread)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Print a machine-readable report')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+        parser.add_argument('--baseline', help='Compare against a report from an earlier run')
+        parser.add_argument('--max-regression', type=float, default=10.0,
+                            help='Percent drop in throughput or rise in p95 latency that fails the comparison')
+
+    def handle(self, *args, **options):
+        server = options['server'] or ('asgi' if settings.ASYNC_AI_VIEWS else 'wsgi')
+        scenarios = options['scenario'] or list(SCENARIOS)
+        backends = {
+            name: FakeBackend(
+                name,
+                latency_ms=options['latency_ms'],
+                jitter=options['jitter'],
+                tokens_per_second=options['tokens_per_second'],
+                reply_tokens=options['reply_tokens'],
+                rate_limit_rate=options['rate_limit_rate'],
+                error_rate=options['error_rate'],
+                retry_after=options['retry_after'],
+                seed=options['seed'] + i,
+            )
+            for i, name in enumerate(['groq', 'gemini'])
+        }
+        install_fake_backends(backends['groq'], backends['gemini'])
+        # keep this process's metrics out of the running server's
+        metrics_registry.directory = tempfile.mkdtemp(prefix='benchmark-metrics-')
+
+        limits = {name: options['rpm'] for name in backends}
+        hash_workers = settings.PASSWORD_HASH_WORKERS if options['hash_workers'] is None else options['hash_workers']
+        with override_settings(PASSWORD_HASH_WORKERS=hash_workers,
+                               RATE_LIMIT_DIR=tempfile.mkdtemp(prefix='benchmark-ratelimit-'),
+                               PROVIDER_RATE_LIMITS=limits,
+                               GROQ_API_KEY='benchmark', GEMINI_API_KEY='benchmark'):
+            for provider in available_providers():
+                provider.limiter = create_limiter(provider.name)
+                provider.breaker = create_breaker(provider.name, provider.probe)
+
+            if connection.vendor == 'sqlite':
+                # a file rather than shared-cache memory, whose table locks fail concurrent writers
+                connection.settings_dict['TEST']['NAME'] = os.path.join(
+                    tempfile.mkdtemp(prefix='benchmark-db-'), 'benchmark.sqlite3'
+                )
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                results = self.run_scenarios(scenarios, server, options)
+            finally:
+                flush_history()
+                shutdown_pool()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'commit': _git_commit(),
+            'created_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'server': server,
+            'async_views': settings.ASYNC_AI_VIEWS,
+            'config': {
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'distinct_prompts': options['distinct_prompts'],
+                'history_size': options['history_size'],
+                'rpm': options['rpm'],
+                'password_hasher': settings.PASSWORD_HASHER,
+                'hash_workers': hash_workers,
+                'backend': backends['groq'].config(),
+            },
+            'scenarios': results,
+            'backends': {name: backend.stats() for name, backend in backends.items()},
+        }
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                report['regressions'] = compare_reports(json.load(f), report, options['max_regression'])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+        else:
+            self.print_report(report)
+
+        if report.get('regressions'):
+            raise CommandError(f"{len(report['regressions'])} regression(s) against {options['baseline']}")
+
+    def setup_data(self, history_size):
+        """Benchmark user, its auth header and some history to page through and search"""
+        user = User.objects.create_user(email='bench@example.com', password=PASSWORD, username='bench')
+        filler = ' '.join(WORDS)
+        for start in range(0, history_size, 1000):
+            topics = [SEEDED_TOPICS[i % len(SEEDED_TOPICS)] for i in range(start, min(start + 1000, history_size))]
+            queries = QueryHistory.objects.bulk_create([
+                QueryHistory(user=user, prompt=f'Seeded prompt {start + i}: explain {topic}', mode='both',
+                             preview=f'Seeded response about {topic}. {filler}'[:settings.HISTORY_PREVIEW_CHARS])
+                for i, topic in enumerate(topics)
+            ])
+            responses = ModelResponse.objects.bulk_create([
+                ModelResponse(query=query, provider=name, model=get_provider(name).model,
+                              response=f'Seeded response about {topic}. {filler}')
+                for query, topic in zip(queries, topics) for name in ('groq', 'gemini')
+            ])
+            index_entries([(query, responses[2 * i:2 * i + 2]) for i, query in enumerate(queries)])
+        return {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+    def run_scenarios(self, scenarios, server, options):
+        auth = self.setup_data(options['history_size'])
+        results = {}
+        for name in scenarios:
+            method, path, body, authenticated = SCENARIOS[name]
+            headers = {'Content-Type': 'application/json', **(auth if authenticated else {})}
+
+            def request(i):
+                distinct = options['distinct_prompts']
+                prompt = f'Benchmark prompt {i % distinct if distinct else i}: explain how {name} works'
+                return method, path, json.dumps(body(prompt)).encode() if body else b'', headers
+
+            run = self.run_asgi if server == 'asgi' else self.run_wsgi
+            if options['warmup']:
+                run(lambda i: request(-1 - i), options['warmup'], options['concurrency'])
+            results[name] = run(request, options['requests'], options['concurrency'])
+            if not options['json']:
+                self.stdout.write(f"{name}: {results[name]['throughput_rps']} req/s")
+        return results
+
+    def run_wsgi(self, request, requests, concurrency):
+        """Drive the WSGI handler from concurrency threads"""
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        indexes = itertools.count()
+        latencies = []
+        statuses = Counter()
+        lock = threading.Lock()
+
+        def worker():
+            while (i := next(indexes)) < requests:
+                method, path, body, headers = request(i)
+                environ = factory.generic(
+                    method, path, body, content_type=headers['Content-Type'],
+                    **{f"HTTP_{key.upper().replace('-', '_')}": value
+                       for key, value in headers.items() if key != 'Content-Type'}
+                ).environ
+                started = time.perf_counter()
+                status = call_wsgi(handler, environ)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[status] += 1
+            # the test database can't be dropped while connections are open
+            connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, name=f'benchmark-{i}') for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize_run(latencies, statuses, time.perf_counter() - started)
+
+    def run_asgi(self, request, requests, concurrency):
+        """Drive the ASGI handler from concurrency tasks on one event loop, like a uvicorn worker"""
+        handler = ASGIHandler()
+        indexes = itertools.count()
+        latencies = []
+        statuses = Counter()
+
+        async def worker():
+            while (i := next(indexes)) < requests:
+                method, path, body, headers = request(i)
+                started = time.perf_counter()
+                status = await call_asgi(handler, method, path, body, headers)
+                latencies.append(time.perf_counter() - started)
+                statuses[status] += 1
+
+        async def main():
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            await sync_to_async(connections.close_all)()
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return summarize_run(latencies, statuses, time.perf_counter() - started)
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"\nCommit {report['commit']}, {report['server']} server, {report['database']} database, "
+            f"{report['config']['concurrency']} concurrent"
+        )
+        self.stdout.write(f"{'scenario':<10} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+        for name, run in report['scenarios'].items():
+            latency = run['latency_ms']
+            self.stdout.write(
+                f"{name:<10} {run['throughput_rps']:>8} {latency['p50']:>8} {latency['p95']:>8} "
+                f"{latency['p99']:>8} {run['errors']:>7}"
+            )
+        for name, stats in report['backends'].items():
+            self.stdout.write(
+                f"fake {name}: {stats['calls']} calls, {stats['rate_limited']} rate limited, {stats['errors']} errors"
+            )
+        for regression in report.get('regressions', []):
+            self.stdout.write(self.style.ERROR(
+                f"{regression['scenario']} {regression['metric']}: {regression['baseline']} -> "
+                f"{regression['current']} ({regression['change_pct']:+}%)"
+            ))
+
+
+def summarize_run(latencies, statuses, elapsed):
+    latencies = sorted(latency * 1000 for latency in latencies)
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            **{f'p{p}': round(percentile(latencies, p), 1) for p in (50, 90, 95, 99)},
+            'max': round(latencies[-1], 1),
+            'mean': round(sum(latencies) / len(latencies), 1),
+        } if latencies else {},
+    }
+
+
+def compare_reports(baseline, current, max_regression):
+    """Scenarios whose throughput fell or p95 latency rose by more than max_regression percent"""
+    regressions = []
+    for name, run in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before or not run['latency_ms'] or not before.get('latency_ms'):
+            continue
+        checks = [
+            ('throughput_rps', before['throughput_rps'], run['throughput_rps'], -1),
+            ('latency_p95_ms', before['latency_ms']['p95'], run['latency_ms']['p95'], 1),
+        ]
+        for metric, old, new, worse in checks:
+            if not old:
+                continue
+            change = round((new - old) / old * 100, 1)
+            if change * worse > max_regression:
+                regressions.append({
+                    'scenario': name, 'metric': metric, 'baseline': old, 'current': new, 'change_pct': change,
+                })
+    return regressions
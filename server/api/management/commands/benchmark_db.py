@@ -0,0 +1,69 @@
+"""
+Benchmark database connection reuse across simulated requests
+"""
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/sec and connections opened with and without persistent connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--json', action='store_true', help='Print a machine-readable report')
+
+    def run(self, requests, conn_max_age):
+        """Run request cycles that each issue one query, like a light API request"""
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+        opened = []
+
+        def count(sender, **kwargs):
+            opened.append(1)
+
+        connection_created.connect(count)
+        try:
+            started = time.perf_counter()
+            for _ in range(requests):
+                request_started.send(sender=self.__class__)
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                request_finished.send(sender=self.__class__)
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(count)
+            connection.close()
+
+        return {
+            'conn_max_age': conn_max_age,
+            'requests': requests,
+            'connections_opened': len(opened),
+            'requests_per_sec': round(requests / elapsed, 1),
+            'ms_per_request': round(elapsed * 1000 / requests, 3),
+        }
+
+    def handle(self, *args, **options):
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        report = {
+            'vendor': connection.vendor,
+            'before': self.run(options['requests'], 0),
+            'after': self.run(options['requests'], configured),
+        }
+        connection.settings_dict['CONN_MAX_AGE'] = configured
+
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+
+        self.stdout.write(f"Database: {report['vendor']}")
+        for label in ('before', 'after'):
+            run = report[label]
+            self.stdout.write(
+                f"{label:>6} (CONN_MAX_AGE={run['conn_max_age']}): "
+                f"{run['requests_per_sec']} req/s, {run['ms_per_request']} ms/req, "
+                f"{run['connections_opened']} connections opened"
+            )
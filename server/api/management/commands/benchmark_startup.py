@@ -0,0 +1,128 @@
+"""
+Measure worker boot time and memory, and the import cost of each heavy module
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.clients import SDK_MODULES
+
+MODULES = SDK_MODULES + ['rest_framework_simplejwt.tokens', 'api.views', 'api.async_views']
+
+# probes run in a fresh interpreter and print one JSON object
+PROBE_PRELUDE = r'''
+import json, os, sys, time
+sys.path.insert(0, os.getcwd())
+
+def rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # no /proc: peak rather than current RSS
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+'''
+
+BOOT_PROBE = PROBE_PRELUDE + r'''
+steps = []
+def step(name, func):
+    started = time.perf_counter()
+    func()
+    steps.append({'step': name, 'seconds': time.perf_counter() - started, 'rss': rss()})
+
+import django
+from importlib import import_module
+step('interpreter', lambda: None)
+step('django.setup', django.setup)
+step('import config.urls', lambda: import_module('config.urls'))
+from api.clients import SDK_MODULES, preload_sdks
+loaded = [module for module in SDK_MODULES if module in sys.modules]
+step('preload_sdks', preload_sdks)
+print(json.dumps({'steps': steps, 'sdks_loaded_at_boot': loaded}))
+'''
+
+MODULE_PROBE = PROBE_PRELUDE + r'''
+import django
+from importlib import import_module
+django.setup()
+before = rss()
+started = time.perf_counter()
+import_module(sys.argv[1])
+print(json.dumps({'seconds': time.perf_counter() - started, 'rss': rss() - before}))
+'''
+
+
+def _run(code, *args, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code, *args]
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings')}
+    result = subprocess.run(command, capture_output=True, text=True, cwd=settings.BASE_DIR, env=env)
+    if result.returncode != 0:
+        raise CommandError(f'Probe failed: {result.stderr.strip().splitlines()[-1:]}')
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def package_times(importtime_output):
+    """Self import time per top-level package from -X importtime output, slowest first"""
+    totals = defaultdict(int)
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, module = line[len('import time:'):].split('|')
+        totals[module.strip().split('.')[0]] += int(self_us)
+    return sorted(({'package': name, 'seconds': round(us / 1e6, 4)} for name, us in totals.items()),
+                  key=lambda row: row['seconds'], reverse=True)
+
+
+def _mb(size):
+    return round(size / (1024 * 1024), 1)
+
+
+class Command(BaseCommand):
+    help = 'Report worker boot time and RSS, what the provider SDKs cost to import and the import time per package'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Boot probes to take the median time of')
+        parser.add_argument('--top', type=int, default=15, help='Packages to list by import time')
+        parser.add_argument('--module', action='append', help=f'Modules to measure (default: {", ".join(MODULES)})')
+        parser.add_argument('--json', action='store_true', help='Print a machine-readable report')
+
+    def handle(self, *args, **options):
+        runs = [_run(BOOT_PROBE, importtime=True) for _ in range(max(1, options['runs']))]
+        boots = [boot for boot, _ in runs]
+        steps = [{
+            'step': step['step'],
+            'seconds': round(statistics.median(boot['steps'][i]['seconds'] for boot in boots), 4),
+            'rss_mb': _mb(boots[-1]['steps'][i]['rss']),
+        } for i, step in enumerate(boots[0]['steps'])]
+
+        modules = {}
+        for module in options['module'] or MODULES:
+            cost, _ = _run(MODULE_PROBE, module)
+            modules[module] = {'seconds': round(cost['seconds'], 4), 'rss_mb': _mb(cost['rss'])}
+
+        report = {
+            'python': sys.version.split()[0],
+            'boot': steps,
+            'sdks_loaded_at_boot': boots[-1]['sdks_loaded_at_boot'],
+            'modules': modules,
+            'packages': package_times(runs[-1][1])[:options['top']],
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+
+        self.stdout.write(f"Worker boot (median of {len(boots)} runs):")
+        for step in steps:
+            self.stdout.write(f"  {step['step']:<20} {step['seconds']:>8.3f}s   RSS {step['rss_mb']:>7} MB")
+        self.stdout.write(f"SDKs imported at boot: {', '.join(report['sdks_loaded_at_boot']) or 'none'}")
+        self.stdout.write('Import cost on top of django.setup():')
+        for module, cost in modules.items():
+            self.stdout.write(f"  {module:<35} {cost['seconds']:>8.3f}s   +{cost['rss_mb']} MB")
+        self.stdout.write('Self import time by package (boot and preload):')
+        for row in report['packages']:
+            self.stdout.write(f"  {row['package']:<35} {row['seconds']:>8.3f}s")
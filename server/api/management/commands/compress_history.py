@@ -0,0 +1,104 @@
+"""
+Recompress stored history text with the current compression settings, optionally training a dictionary first
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import BinaryField, Value
+from api.compression import (
+    CODECS, PLAIN, ZLIB_MAX_DICTIONARY, active_dictionary_id, compress, decompress, stored_format, train_dictionary,
+)
+from api.fields import stored_bytes
+from api.models import CompressionDictionary, ModelResponse, QueryHistory
+
+COLUMNS = [(QueryHistory, 'prompt'), (ModelResponse, 'response')]
+
+
+def _mb(size):
+    return round(size / (1024 * 1024), 2)
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrite history prompts and responses with the configured codec and dictionary, in batches '
+        '(rows already in that format are skipped), and report the space saved'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--codec', choices=list(CODECS), help='Codec to store with (default: HISTORY_COMPRESSION)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows read and updated per transaction')
+        parser.add_argument('--train', action='store_true',
+                            help='Train a new dictionary on recent responses first and compress with it')
+        parser.add_argument('--samples', type=int, default=2000, help='Responses to train the dictionary on')
+        parser.add_argument('--dictionary-size', type=int, default=112640,
+                            help=f'Dictionary size in bytes (zlib uses at most {ZLIB_MAX_DICTIONARY})')
+        parser.add_argument('--no-dictionary', action='store_true', help='Compress without a dictionary')
+        parser.add_argument('--force', action='store_true', help='Recompress rows already in the target format')
+        parser.add_argument('--dry-run', action='store_true', help='Report the sizes without writing anything')
+
+    def handle(self, *args, **options):
+        codec = options['codec'] or settings.HISTORY_COMPRESSION
+        if options['train'] and options['no_dictionary']:
+            raise CommandError('--train and --no-dictionary exclude each other')
+        if options['train'] and CODECS[codec] == PLAIN:
+            raise CommandError('Dictionaries need a compression codec')
+
+        if options['no_dictionary']:
+            dictionary_id = 0
+        elif options['train']:
+            dictionary_id = self.train(codec, options)
+        else:
+            dictionary_id = active_dictionary_id(CODECS[codec], refresh=True)
+
+        for model, column in COLUMNS:
+            self.recompress(model, column, codec, dictionary_id, options)
+
+    def train(self, codec, options):
+        stored = ModelResponse.objects.order_by('-id').values_list('response', flat=True)[:options['samples']]
+        samples = list(stored)[::-1]
+        if not samples:
+            raise CommandError('No responses to train a dictionary on')
+        data = train_dictionary(samples, codec, options['dictionary_size'])
+        if options['dry_run']:
+            self.stdout.write(f'Trained a {len(data)} byte {codec} dictionary on {len(samples)} responses (not saved)')
+            return 0
+        dictionary = CompressionDictionary.objects.create(codec=codec, data=data, samples=len(samples))
+        self.stdout.write(f'Trained {dictionary} on {len(samples)} responses')
+        return dictionary.id
+
+    def recompress(self, model, column, codec, dictionary_id, options):
+        label = f'{model._meta.db_table}.{column}'
+        rows = rewritten = stored_before = stored_after = text_size = 0
+        last_id = 0
+        while True:
+            batch = list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', stored_bytes(column))[
+                :options['batch_size']
+            ])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            updates = []
+            for row_id, value in batch:
+                value = bytes(value)
+                text = decompress(value)
+                rows += 1
+                text_size += len(text.encode('utf-8'))
+                stored_before += len(value)
+                new = value
+                if options['force'] or stored_format(value) != (CODECS[codec], dictionary_id):
+                    new = compress(text, codec, dictionary_id)
+                if new != value:
+                    # an expression, so bulk_update writes the bytes as they are
+                    updates.append(model(id=row_id, **{column: Value(new, output_field=BinaryField())}))
+                stored_after += len(new)
+            if updates and not options['dry_run']:
+                model.objects.bulk_update(updates, [column])
+            rewritten += len(updates)
+            if self.stdout.isatty():
+                self.stdout.write(f'{label}: {rows} rows read, {rewritten} rewritten', ending='\r')
+
+        ratio = round(text_size / stored_after, 2) if stored_after else 0
+        verb = 'would rewrite' if options['dry_run'] else 'rewrote'
+        self.stdout.write(
+            f'{label}: {rows} rows, {verb} {rewritten}; {_mb(text_size)} MB of text stored in '
+            f'{_mb(stored_before)} MB -> {_mb(stored_after)} MB ({ratio}x)'
+        )
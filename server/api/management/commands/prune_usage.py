@@ -0,0 +1,30 @@
+"""
+Delete provider call accounting rows past USAGE_RETENTION_DAYS
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.usage import prune_calls
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete ProviderCall rows older than USAGE_RETENTION_DAYS (or --days), in batches; '
+        'run it daily, e.g. from cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Keep this many days of rows (default: USAGE_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per query')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else settings.USAGE_RETENTION_DAYS
+        if days <= 0:
+            if options['days'] is not None:
+                raise CommandError('--days must be a positive integer')
+            self.stdout.write('USAGE_RETENTION_DAYS is 0: provider calls are kept')
+            return
+        before = timezone.now() - timedelta(days=days)
+        deleted = prune_calls(before, options['batch_size'])
+        self.stdout.write(f'Deleted {deleted} provider calls recorded before {before.isoformat()}')
@@ -0,0 +1,40 @@
+"""
+Rebuild the history search index from the stored prompts and responses
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from api.models import QueryHistory
+from api.search import build_document, get_backend
+
+
+class Command(BaseCommand):
+    help = (
+        'Index every history entry for /users/queries/search, e.g. entries saved before search existed; '
+        'also drops index rows of deleted entries'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Entries indexed per transaction')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if backend is None:
+            raise CommandError(f'Search is not available on {connection.vendor}')
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            backend.clear(cursor)
+        indexed = 0
+        last_id = 0
+        while True:
+            queries = list(QueryHistory.objects.filter(id__gt=last_id).order_by('id').only(
+                'id', 'user_id', 'prompt'
+            ).prefetch_related('responses')[:options['batch_size']])
+            if not queries:
+                break
+            last_id = queries[-1].id
+            with transaction.atomic(), connection.cursor() as cursor:
+                backend.index(cursor, [build_document(query, query.responses.all()) for query in queries])
+            indexed += len(queries)
+            if self.stdout.isatty():
+                self.stdout.write(f'{indexed} entries indexed', ending='\r')
+        self.stdout.write(f'Indexed {indexed} history entries')
@@ -0,0 +1,25 @@
+"""
+Resume batch comparison jobs that were interrupted, e.g. by a server restart
+"""
+from django.core.management.base import BaseCommand
+from api.batch import claim, resumable_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run batch jobs that no worker is running (never started or interrupted) to completion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', type=int, action='append', help='Only run these job ids')
+
+    def handle(self, *args, **options):
+        jobs = resumable_jobs().order_by('created_at')
+        if options['job']:
+            jobs = jobs.filter(id__in=options['job'])
+
+        for job_id in jobs.values_list('id', flat=True):
+            # another worker may have picked it up since the query
+            if not claim(job_id):
+                continue
+            self.stdout.write(f'Running batch job {job_id}')
+            run_job(job_id)
+        self.stdout.write('No more batch jobs to resume')
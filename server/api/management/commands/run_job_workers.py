@@ -0,0 +1,27 @@
+"""
+Run background compare-with-rubric jobs from the database queue
+"""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.history import flush_history
+from api.jobs import JobWorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of job workers until interrupted (size web and worker processes independently)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS)
+
+    def handle(self, *args, **options):
+        pool = JobWorkerPool(options['workers'], 'jobs')
+        pool.ensure_started()
+        self.stdout.write(f"Running {options['workers']} job workers (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping job workers after their current jobs')
+            pool.stop()
+            flush_history()
@@ -0,0 +1,317 @@
+"""
+Prometheus-style metrics, aggregated across the worker processes on the host
+"""
+import atexit
+import json
+import math
+import os
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    # no flock (Windows): /metrics then only reports the process that serves it
+    fcntl = None
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROVIDER_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# counters and histograms of exited processes are folded into this file
+ARCHIVE_FILE = 'archive.json'
+
+
+class Metric:
+    """A named metric with a fixed set of label names; values are kept per label combination"""
+
+    kind = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def zero(self):
+        return 0.0
+
+    def merge(self, total, value):
+        return total + value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.update(self, self._key(labels), lambda value: value + amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self.registry.update(self, self._key(labels), lambda value: value + amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Observation counts per bucket (the last one is +Inf) plus their sum"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        self.buckets = tuple(float(bound) for bound in buckets)
+        super().__init__(registry, name, help, labels)
+
+    def zero(self):
+        return [[0] * (len(self.buckets) + 1), 0.0]
+
+    def merge(self, total, value):
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+    def observe(self, amount, **labels):
+        index = next((i for i, bound in enumerate(self.buckets) if amount <= bound), len(self.buckets))
+
+        def add(value):
+            value[0][index] += 1
+            value[1] += amount
+            return value
+
+        self.registry.update(self, self._key(labels), add)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _copy(value):
+    # histogram values are mutated in place
+    return [list(value[0]), value[1]] if isinstance(value, list) else value
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsRegistry:
+    """
+    Metric values of this process, shared with the other worker processes.
+
+    Each process writes its values to METRICS_DIR/<pid>.json every
+    flush_interval seconds (and at exit); render() merges those files, so a
+    scrape of any worker reports the whole host, with other processes' values
+    up to flush_interval old. Counters and histograms of processes that have
+    exited are kept in an archive file, their gauges are dropped.
+    """
+
+    def __init__(self, directory, flush_interval):
+        self.directory = directory if fcntl is not None else None
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._values = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop = threading.Event()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        self._values[metric.name] = {}
+
+    def update(self, metric, key, change):
+        with self._lock:
+            values = self._values[metric.name]
+            values[key] = change(values.get(key, metric.zero()))
+        if self._flusher is None and self.directory:
+            self._ensure_flushing()
+
+    def _ensure_flushing(self):
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f'Metrics flush error: {str(e)}')
+
+    def snapshot(self):
+        """This process's values as {metric name: [[label values, value], ...]}"""
+        with self._lock:
+            return {name: [[list(key), _copy(value)] for key, value in values.items()]
+                    for name, values in self._values.items()}
+
+    def flush(self):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    @contextmanager
+    def _archive_lock(self):
+        with open(os.path.join(self.directory, 'archive.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _merge(self, totals, snapshot, gauges=True):
+        for name, entries in snapshot.items():
+            metric = self._metrics.get(name)
+            if metric is None or (metric.kind == 'gauge' and not gauges):
+                continue
+            values = totals.setdefault(name, {})
+            for key, value in entries:
+                key = tuple(key)
+                values[key] = metric.merge(values.get(key, metric.zero()), value)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def collect(self):
+        """Values merged over every process on the host"""
+        totals = {}
+        self._merge(totals, self.snapshot())
+        if not self.directory:
+            return totals
+
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        with self._archive_lock():
+            archive = {}
+            self._merge(archive, self._read(archive_path))
+            exited = []
+            for filename in os.listdir(self.directory):
+                pid, ext = os.path.splitext(filename)
+                if ext != '.json' or not pid.isdigit() or int(pid) == os.getpid():
+                    continue
+                path = os.path.join(self.directory, filename)
+                if _pid_alive(int(pid)):
+                    self._merge(totals, self._read(path))
+                else:
+                    self._merge(archive, self._read(path), gauges=False)
+                    exited.append(path)
+            if exited:
+                with open(archive_path + '.tmp', 'w') as f:
+                    json.dump({name: [[list(key), value] for key, value in values.items()]
+                               for name, values in archive.items()}, f)
+                os.replace(archive_path + '.tmp', archive_path)
+                for path in exited:
+                    os.remove(path)
+        self._merge(totals, {name: [[list(key), value] for key, value in values.items()]
+                             for name, values in archive.items()})
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        totals = self.collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(totals.get(name, {}).items()):
+                if metric.kind != 'histogram':
+                    lines.append(f'{name}{_format_labels(metric.labels, key)} {_format_value(value)}')
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (math.inf,), counts):
+                    cumulative += count
+                    le = ('le', _format_value(bound))
+                    lines.append(f'{name}_bucket{_format_labels(metric.labels, key, [le])} {_format_value(cumulative)}')
+                lines.append(f'{name}_sum{_format_labels(metric.labels, key)} {_format_value(total)}')
+                lines.append(f'{name}_count{_format_labels(metric.labels, key)} {_format_value(cumulative)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset_after_fork(self):
+        """A forked worker starts from zero (the parent reports its own values) with its own flush thread"""
+        self._lock = threading.Lock()
+        self._flusher = None
+        for values in self._values.values():
+            values.clear()
+
+
+registry = MetricsRegistry(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+os.register_at_fork(after_in_child=registry.reset_after_fork)
+atexit.register(registry.flush)
+
+REQUESTS = Counter(registry, 'http_requests_total', 'HTTP requests served', ('method', 'route', 'status'))
+REQUEST_DURATION = Histogram(
+    registry, 'http_request_duration_seconds', 'Time to serve a request (streams: until the stream ends)',
+    ('method', 'route'), REQUEST_BUCKETS,
+)
+IN_FLIGHT = Gauge(registry, 'http_requests_in_flight', 'Requests being served', ('route',))
+DB_QUERIES = Histogram(
+    registry, 'http_request_db_queries', 'Database queries run by the view of a request', ('route',), QUERY_BUCKETS,
+)
+PROVIDER_CALLS = Counter(
+    registry, 'ai_provider_calls_total', 'Provider calls by outcome (ok, error or cached)',
+    ('provider', 'purpose', 'outcome'),
+)
+PROVIDER_DURATION = Histogram(
+    registry, 'ai_provider_call_duration_seconds', 'Latency of upstream provider calls',
+    ('provider', 'purpose'), PROVIDER_BUCKETS,
+)
+PROVIDER_ERRORS = Counter(
+    registry, 'ai_provider_errors_total', 'Failed provider calls by exception type', ('provider', 'purpose', 'error'),
+)
+PROVIDER_TOKENS = Counter(
+    registry, 'ai_provider_tokens_total', 'Tokens used by provider calls', ('provider', 'kind'),
+)
+
+
+def observe_provider_call(provider, purpose, latency, usage=None, cached=False, error=None):
+    """Count one provider call (latency in seconds) in the provider metrics"""
+    if not settings.METRICS_ENABLED:
+        return
+    if cached:
+        PROVIDER_CALLS.inc(provider=provider.name, purpose=purpose, outcome='cached')
+        return
+    PROVIDER_DURATION.observe(latency, provider=provider.name, purpose=purpose)
+    if error is not None:
+        PROVIDER_CALLS.inc(provider=provider.name, purpose=purpose, outcome='error')
+        PROVIDER_ERRORS.inc(provider=provider.name, purpose=purpose, error=type(error).__name__)
+        return
+    PROVIDER_CALLS.inc(provider=provider.name, purpose=purpose, outcome='ok')
+    for kind in ('prompt', 'completion'):
+        tokens = (usage or {}).get(f'{kind}_tokens')
+        if tokens:
+            PROVIDER_TOKENS.inc(tokens, provider=provider.name, kind=kind)
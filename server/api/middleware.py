@@ -0,0 +1,138 @@
+"""
+Request timing and metrics middleware
+"""
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from .metrics import DB_QUERIES, IN_FLIGHT, REQUEST_DURATION, REQUESTS
+
+
+class QueryCounter:
+    """Counts the queries of one request and the time spent in them"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+# the current request's counter; context variables carry over into sync_to_async
+# threads, so queries of async views are counted too
+_queries = ContextVar('request_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    queries = _queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created handler adding the per-request query counter to the connection"""
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+def _route(request):
+    """The URL pattern that served the request, so metrics don't get a label per id"""
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Time every request and count its database queries for /metrics, and report
+    them to the client in a Server-Timing header.
+
+    Streamed responses are timed until the stream ends (and carry no
+    Server-Timing header, which would have to be sent before the body).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # the route is known once the URL resolved
+        request._metrics_route = _route(request)
+        IN_FLIGHT.inc(route=request._metrics_route)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        queries = QueryCounter()
+        token = _queries.set(queries)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self._finish(request, 500, started)
+            raise
+        finally:
+            _queries.reset(token)
+        return self._observe(request, response, started, queries)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        queries = QueryCounter()
+        token = _queries.set(queries)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            self._finish(request, 500, started)
+            raise
+        finally:
+            _queries.reset(token)
+        return self._observe(request, response, started, queries)
+
+    def _observe(self, request, response, started, queries):
+        DB_QUERIES.observe(queries.count, route=_route(request))
+        if response.streaming:
+            finish = lambda: self._finish(request, response.status_code, started)
+            if getattr(response, 'is_async', False):
+                response.streaming_content = self._atimed(response.streaming_content, finish)
+            else:
+                response.streaming_content = self._timed(response.streaming_content, finish)
+            return response
+
+        elapsed = self._finish(request, response.status_code, started)
+        response['Server-Timing'] = f'app;dur={elapsed * 1000:.1f}, db;dur={queries.duration * 1000:.1f}'
+        return response
+
+    def _finish(self, request, status, started):
+        elapsed = time.perf_counter() - started
+        route = _route(request)
+        REQUESTS.inc(method=request.method, route=route, status=status)
+        REQUEST_DURATION.observe(elapsed, method=request.method, route=route)
+        if hasattr(request, '_metrics_route'):
+            IN_FLIGHT.dec(route=request._metrics_route)
+        return elapsed
+
+    def _timed(self, content, finish):
+        try:
+            yield from content
+        finally:
+            finish()
+
+    async def _atimed(self, content, finish):
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            finish()
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_user_bio_user_first_name_user_last_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='queryhistory',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='queryhistory_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='queryhistory',
+            index=models.Index(fields=['user', 'mode', '-created_at', '-id'], name='queryhistory_user_mode'),
+        ),
+    ]
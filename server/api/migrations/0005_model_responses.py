@@ -0,0 +1,71 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+LEGACY_COLUMNS = {
+    'groq': ('response_groq', 'llama-3.3-70b-versatile'),
+    'gemini': ('response_gemini', 'gemini-flash-latest'),
+}
+
+
+def copy_legacy_responses(apps, schema_editor):
+    """Move response_groq/response_gemini into one ModelResponse row per provider"""
+    QueryHistory = apps.get_model('api', 'QueryHistory')
+    ModelResponse = apps.get_model('api', 'ModelResponse')
+
+    batch = []
+    for query in QueryHistory.objects.only('id', 'response_groq', 'response_gemini').iterator(chunk_size=1000):
+        for provider, (column, model) in LEGACY_COLUMNS.items():
+            text = getattr(query, column)
+            if text is not None:
+                batch.append(ModelResponse(query_id=query.id, provider=provider, model=model, response=text))
+        if len(batch) >= 1000:
+            ModelResponse.objects.bulk_create(batch)
+            batch = []
+    ModelResponse.objects.bulk_create(batch)
+
+
+def restore_legacy_responses(apps, schema_editor):
+    QueryHistory = apps.get_model('api', 'QueryHistory')
+    ModelResponse = apps.get_model('api', 'ModelResponse')
+
+    for provider, (column, _) in LEGACY_COLUMNS.items():
+        for row in ModelResponse.objects.filter(provider=provider).iterator(chunk_size=1000):
+            QueryHistory.objects.filter(id=row.query_id).update(**{column: row.response})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_queryhistory_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelResponse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50)),
+                ('model', models.CharField(blank=True, default='', max_length=100)),
+                ('response', models.TextField()),
+                ('query', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='responses', to='api.queryhistory')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='modelresponse',
+            constraint=models.UniqueConstraint(fields=('query', 'provider'), name='modelresponse_query_provider'),
+        ),
+        migrations.RunPython(copy_legacy_responses, restore_legacy_responses),
+        migrations.RemoveField(
+            model_name='queryhistory',
+            name='response_gemini',
+        ),
+        migrations.RemoveField(
+            model_name='queryhistory',
+            name='response_groq',
+        ),
+    ]
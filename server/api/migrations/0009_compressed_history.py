@@ -0,0 +1,148 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:14
+
+import struct
+import zlib
+import api.fields
+from django.db import migrations, models
+
+# (model, text column) pairs moved to compressed storage
+COLUMNS = [('QueryHistory', 'prompt'), ('ModelResponse', 'response')]
+
+# the stored format of api.compression as of this migration, copied so later
+# changes there don't change what it does: a (codec, dictionary id) header, then the body
+HEADER = struct.Struct('>BI')
+PLAIN = 0
+ZLIB = 1
+ZSTD = 2
+
+
+def decompress(value, get_dictionary):
+    """Text of a stored value; get_dictionary(id) returns a dictionary's data"""
+    value = bytes(value)
+    codec, dictionary_id = HEADER.unpack_from(value)
+    body = value[HEADER.size:]
+    if codec == PLAIN:
+        data = body
+    elif codec == ZLIB:
+        if dictionary_id:
+            decompressor = zlib.decompressobj(zdict=get_dictionary(dictionary_id))
+        else:
+            decompressor = zlib.decompressobj()
+        data = decompressor.decompress(body) + decompressor.flush()
+    elif codec == ZSTD:
+        import zstandard
+        dict_data = zstandard.ZstdCompressionDict(get_dictionary(dictionary_id)) if dictionary_id else None
+        data = zstandard.ZstdDecompressor(dict_data=dict_data).decompress(body)
+    else:
+        raise ValueError(f'Unknown compression codec {codec}')
+    return data.decode('utf-8')
+
+
+def dictionary_loader(apps):
+    """get_dictionary for decompress, reading the migration state's CompressionDictionary"""
+    CompressionDictionary = apps.get_model('api', 'CompressionDictionary')
+    dictionaries = {}
+
+    def get_dictionary(dictionary_id):
+        if dictionary_id not in dictionaries:
+            dictionaries[dictionary_id] = bytes(CompressionDictionary.objects.get(pk=dictionary_id).data)
+        return dictionaries[dictionary_id]
+    return get_dictionary
+
+
+def store_text(apps, schema_editor):
+    """Copy the text columns into the binary ones, uncompressed (compress_history compresses them)"""
+    for model_name, column in COLUMNS:
+        model = apps.get_model('api', model_name)
+        batch = []
+        for row in model.objects.only('id', column).iterator(chunk_size=1000):
+            setattr(row, f'{column}_data', HEADER.pack(PLAIN, 0) + getattr(row, column).encode('utf-8'))
+            batch.append(row)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, [f'{column}_data'])
+                batch = []
+        model.objects.bulk_update(batch, [f'{column}_data'])
+
+
+def restore_text(apps, schema_editor):
+    get_dictionary = dictionary_loader(apps)
+    for model_name, column in COLUMNS:
+        model = apps.get_model('api', model_name)
+        batch = []
+        for row in model.objects.only('id', f'{column}_data').iterator(chunk_size=1000):
+            setattr(row, column, decompress(getattr(row, f'{column}_data'), get_dictionary))
+            batch.append(row)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, [column])
+                batch = []
+        model.objects.bulk_update(batch, [column])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_usage_accounting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressionDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codec', models.CharField(max_length=10)),
+                ('data', models.BinaryField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='queryhistory',
+            name='prompt_data',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='modelresponse',
+            name='response_data',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(store_text, restore_text),
+        # a default, so undoing the removal below can add the columns back to filled tables
+        migrations.AlterField(
+            model_name='queryhistory',
+            name='prompt',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='modelresponse',
+            name='response',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='queryhistory',
+            name='prompt',
+        ),
+        migrations.RemoveField(
+            model_name='modelresponse',
+            name='response',
+        ),
+        migrations.RenameField(
+            model_name='queryhistory',
+            old_name='prompt_data',
+            new_name='prompt',
+        ),
+        migrations.RenameField(
+            model_name='modelresponse',
+            old_name='response_data',
+            new_name='response',
+        ),
+        migrations.AlterField(
+            model_name='queryhistory',
+            name='prompt',
+            field=api.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='modelresponse',
+            name='response',
+            field=api.fields.CompressedTextField(),
+        ),
+    ]
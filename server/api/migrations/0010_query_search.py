@@ -0,0 +1,78 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:52
+
+from django.db import migrations
+
+# the search table of api.search as of this migration, copied so later changes
+# there don't change what it does
+TABLE = 'api_query_search'
+
+CREATE = {
+    'postgresql': [
+        f'''
+            CREATE TABLE {TABLE} (
+                query_id bigint PRIMARY KEY,
+                user_id bigint NOT NULL,
+                document tsvector NOT NULL
+            )
+        ''',
+        f'CREATE INDEX {TABLE}_document ON {TABLE} USING gin (document)',
+        f'CREATE INDEX {TABLE}_user ON {TABLE} (user_id)',
+        f'''
+            CREATE FUNCTION {TABLE}_delete() RETURNS trigger AS $$
+            BEGIN
+                DELETE FROM {TABLE} WHERE query_id = OLD.id;
+                RETURN OLD;
+            END
+            $$ LANGUAGE plpgsql
+        ''',
+        f'''
+            CREATE TRIGGER {TABLE}_delete AFTER DELETE ON api_queryhistory
+            FOR EACH ROW EXECUTE FUNCTION {TABLE}_delete()
+        ''',
+    ],
+    'sqlite': [
+        f'''
+            CREATE VIRTUAL TABLE {TABLE} USING fts5(
+                owner, prompt, responses, content='', tokenize='porter unicode61'
+            )
+        ''',
+        f"INSERT INTO {TABLE}({TABLE}, rank) VALUES ('rank', 'bm25(0.0, 4.0, 1.0)')",
+    ],
+}
+
+DROP = {
+    'postgresql': [
+        f'DROP TRIGGER IF EXISTS {TABLE}_delete ON api_queryhistory',
+        f'DROP FUNCTION IF EXISTS {TABLE}_delete()',
+        f'DROP TABLE IF EXISTS {TABLE}',
+    ],
+    'sqlite': [
+        f'DROP TABLE IF EXISTS {TABLE}',
+    ],
+}
+
+
+def _execute(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            cursor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    """The search table (none on databases without a search backend)"""
+    _execute(schema_editor, CREATE)
+
+
+def drop_search_index(apps, schema_editor):
+    _execute(schema_editor, DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_compressed_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
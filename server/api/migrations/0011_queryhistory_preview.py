@@ -0,0 +1,86 @@
+# Generated by Django 4.2.7 on 2026-10-17 15:20
+
+import struct
+import zlib
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F
+
+# the stored format of api.compression as of this migration, copied so later
+# changes there don't change what it does: a (codec, dictionary id) header, then the body
+HEADER = struct.Struct('>BI')
+PLAIN = 0
+ZLIB = 1
+ZSTD = 2
+
+
+def decompress(value, get_dictionary):
+    """Text of a stored value; get_dictionary(id) returns a dictionary's data"""
+    value = bytes(value)
+    codec, dictionary_id = HEADER.unpack_from(value)
+    body = value[HEADER.size:]
+    if codec == PLAIN:
+        data = body
+    elif codec == ZLIB:
+        if dictionary_id:
+            decompressor = zlib.decompressobj(zdict=get_dictionary(dictionary_id))
+        else:
+            decompressor = zlib.decompressobj()
+        data = decompressor.decompress(body) + decompressor.flush()
+    elif codec == ZSTD:
+        import zstandard
+        dict_data = zstandard.ZstdCompressionDict(get_dictionary(dictionary_id)) if dictionary_id else None
+        data = zstandard.ZstdDecompressor(dict_data=dict_data).decompress(body)
+    else:
+        raise ValueError(f'Unknown compression codec {codec}')
+    return data.decode('utf-8')
+
+
+def dictionary_loader(apps):
+    """get_dictionary for decompress, reading the migration state's CompressionDictionary"""
+    CompressionDictionary = apps.get_model('api', 'CompressionDictionary')
+    dictionaries = {}
+
+    def get_dictionary(dictionary_id):
+        if dictionary_id not in dictionaries:
+            dictionaries[dictionary_id] = bytes(CompressionDictionary.objects.get(pk=dictionary_id).data)
+        return dictionaries[dictionary_id]
+    return get_dictionary
+
+
+def fill_previews(apps, schema_editor):
+    """Preview of each saved query from its first response (the only full read of the responses)"""
+    get_dictionary = dictionary_loader(apps)
+    QueryHistory = apps.get_model('api', 'QueryHistory')
+    ModelResponse = apps.get_model('api', 'ModelResponse')
+    batch = []
+    last_query_id = None
+    # the stored bytes, decompressed here rather than by the field
+    stored = ExpressionWrapper(F('response'), output_field=models.BinaryField())
+    responses = ModelResponse.objects.order_by('query_id', 'id').values_list('query_id', stored)
+    for query_id, value in responses.iterator(chunk_size=1000):
+        if query_id == last_query_id:
+            continue
+        last_query_id = query_id
+        preview = decompress(value, get_dictionary)[:settings.HISTORY_PREVIEW_CHARS]
+        batch.append(QueryHistory(id=query_id, preview=preview))
+        if len(batch) >= 1000:
+            QueryHistory.objects.bulk_update(batch, ['preview'])
+            batch = []
+    QueryHistory.objects.bulk_update(batch, ['preview'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_query_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queryhistory',
+            name='preview',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_previews, migrations.RunPython.noop),
+    ]
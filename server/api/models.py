@@ -1,6 +1,8 @@
+import uuid
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
 from django.utils import timezone
+from .fields import CompressedTextField
 
 
 class UserManager(BaseUserManager):
@@ -51,16 +53,188 @@ class QueryHistory(models.Model):
     """Store user's query history"""
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='queries')
-    prompt = models.TextField()
-    response_groq = models.TextField(blank=True, null=True)
-    response_gemini = models.TextField(blank=True, null=True)
+    prompt = CompressedTextField()
     mode = models.CharField(max_length=20, default='both')
+    # start of the first response, stored plain so the history list never reads the responses
+    preview = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'Query Histories'
+        indexes = [
+            # keyset pagination of a user's history (newest first)
+            models.Index(fields=['user', '-created_at', '-id'], name='queryhistory_user_created'),
+            models.Index(fields=['user', 'mode', '-created_at', '-id'], name='queryhistory_user_mode'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.prompt[:50]}... ({self.created_at})"
 
+
+class ModelResponse(models.Model):
+    """One model's response to a query (one row per provider)"""
+
+    query = models.ForeignKey(QueryHistory, on_delete=models.CASCADE, related_name='responses')
+    provider = models.CharField(max_length=50)
+    model = models.CharField(max_length=100, blank=True, default='')
+    response = CompressedTextField()
+    # how the response was produced (null when not known, e.g. for older rows)
+    latency_ms = models.FloatField(null=True, blank=True)
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+    cached = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['query', 'provider'], name='modelresponse_query_provider'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} - {self.response[:50]}..."
+
+
+class CompressionDictionary(models.Model):
+    """
+    A dictionary for compressing history text, trained on stored responses by
+    `manage.py compress_history --train`. Stored values refer to it by id, so it
+    must be kept while any row uses it.
+    """
+
+    codec = models.CharField(max_length=10)
+    data = models.BinaryField()
+    samples = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.codec} dictionary {self.id} ({len(self.data)} bytes)"
+
+
+class ProviderCall(models.Model):
+    """One call to a provider (or a response served from the cache) for usage stats"""
+
+    provider = models.CharField(max_length=50)
+    model = models.CharField(max_length=100, blank=True, default='')
+    # response, rubric or stream
+    purpose = models.CharField(max_length=20)
+    latency_ms = models.FloatField()
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+    cached = models.BooleanField(default=False)
+    error = models.TextField(blank=True, default='')
+    # set when the call is made, not when the write-behind queue inserts it
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['provider', '-created_at'], name='providercall_provider_created'),
+            models.Index(fields=['-created_at'], name='providercall_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.purpose} ({self.latency_ms}ms)"
+
+
+class BatchJob(models.Model):
+    """A suite of prompts run through compare-with-rubric in the background"""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    CANCELLED = 'cancelled'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='batch_jobs')
+    status = models.CharField(max_length=20, default=PENDING)
+    providers = models.JSONField()
+    rubric_mode = models.CharField(max_length=20)
+    use_cache = models.BooleanField(default=True)
+    total = models.PositiveIntegerField(default=0)
+    done = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # aggregate rubric scores per model, filled in when the job completes
+    summary = models.JSONField(null=True, blank=True)
+    # refreshed while a worker runs the job; a stale heartbeat means it was interrupted
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='batchjob_user_created'),
+            models.Index(fields=['status', 'heartbeat_at'], name='batchjob_status_heartbeat'),
+        ]
+
+    def __str__(self):
+        return f"Batch {self.id} ({self.status}, {self.done + self.failed}/{self.total})"
+
+
+class BatchItem(models.Model):
+    """One prompt of a batch job and, once finished, its result"""
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    job = models.ForeignKey(BatchJob, on_delete=models.CASCADE, related_name='items')
+    index = models.PositiveIntegerField()
+    prompt = models.TextField()
+    status = models.CharField(max_length=20, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # order in which items finished, so results can be streamed as they complete
+    seq = models.PositiveIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['index']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'index'], name='batchitem_job_index'),
+        ]
+        indexes = [
+            models.Index(fields=['job', 'seq'], name='batchitem_job_seq'),
+        ]
+
+    def __str__(self):
+        return f"Batch {self.job_id} #{self.index} ({self.status})"
+
+
+class ComparisonJob(models.Model):
+    """A compare-with-rubric request queued for a background worker"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    # random so a job's result can't be fetched by guessing ids
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comparison_jobs', null=True, blank=True)
+    prompt = models.TextField()
+    providers = models.JSONField()
+    rubric_mode = models.CharField(max_length=20)
+    use_cache = models.BooleanField(default=True)
+    status = models.CharField(max_length=20, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # worker running the job and when it took it; a job locked too long ago is retried
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    # the compare-with-rubric response body (or error body) once finished
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # workers take the oldest queued job
+            models.Index(fields=['status', 'created_at'], name='comparisonjob_status_created'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
@@ -0,0 +1,62 @@
+"""
+Keyset (cursor) pagination helpers
+"""
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    """Opaque cursor pointing just past a row in (-created_at, -id) order"""
+    raw = f'{created_at.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+
+
+def encode_offset_cursor(offset):
+    """Opaque cursor for pages of ranked results, which have no stable key to seek past"""
+    return base64.urlsafe_b64encode(f'offset|{offset}'.encode('utf-8')).decode('ascii')
+
+
+def decode_offset_cursor(cursor):
+    try:
+        kind, offset = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        if kind != 'offset' or int(offset) < 0:
+            raise ValueError(cursor)
+        return int(offset)
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+
+
+def keyset_page(queryset, cursor, limit):
+    """
+    Return (rows, next_cursor) for one page of a queryset, newest first.
+
+    Seeks past the cursor with a (created_at, id) comparison instead of OFFSET,
+    so every page is a short range scan of the (user, -created_at, -id) index.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
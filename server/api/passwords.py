@@ -0,0 +1,140 @@
+"""
+Password hashing in a bounded pool of worker processes, off the request threads
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+
+# settings the pool processes need to hash the way this process would
+HASH_SETTINGS = ['PASSWORD_HASHERS', 'PBKDF2_ITERATIONS', 'ARGON2_TIME_COST', 'ARGON2_MEMORY_COST', 'ARGON2_PARALLELISM']
+
+
+class HashingBusy(Exception):
+    """PASSWORD_HASH_MAX_PENDING hashes are already queued or running in this process"""
+
+
+def _init_worker(values):
+    # only the settings are needed (no django.setup(), which would start the app's threads)
+    for name, value in values.items():
+        setattr(settings, name, value)
+
+
+def _check(password, encoded):
+    """(whether password matches encoded, a new hash when encoded was made with outdated settings)"""
+    from django.contrib.auth.hashers import check_password, make_password
+    outdated = []
+    valid = check_password(password, encoded, setter=outdated.append)
+    return valid, make_password(password) if outdated else None
+
+
+def _make(password):
+    from django.contrib.auth.hashers import make_password
+    return make_password(password)
+
+
+class HashPool:
+    """
+    PASSWORD_HASH_WORKERS processes shared by the request threads of this worker.
+
+    Hashing is deliberately slow CPU work; in the pool it can't hold up the
+    other requests of the worker. At most PASSWORD_HASH_MAX_PENDING hashes wait
+    or run at once, further ones fail with HashingBusy instead of queueing
+    without bound. Processes are spawned rather than forked, which is not safe
+    from a threaded server, and start on first use.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=({name: getattr(settings, name) for name in HASH_SETTINGS},),
+                )
+            return self._executor
+
+    def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password checks in progress')
+        try:
+            executor = self._get_executor()
+            try:
+                return executor.submit(func, *args).result()
+            except BrokenProcessPool:
+                # a pool process died; the next call starts a new pool
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                raise
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HashPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the pool processes; the next hash starts a pool with the current settings"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def _reset_after_fork():
+    # the parent's pool processes belong to the parent
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _run(func, *args):
+    if settings.PASSWORD_HASH_WORKERS <= 0:
+        return func(*args)
+    return get_pool().run(func, *args)
+
+
+def hash_password(password):
+    """A hash of password made with the preferred hasher"""
+    return _run(_make, password)
+
+
+def check_user_password(user, password):
+    """
+    Whether password is the user's. A hash made with another hasher or outdated
+    cost settings is replaced by one with the current settings.
+    """
+    valid, upgraded = _run(_check, password, user.password)
+    if upgraded:
+        user.password = upgraded
+        user.save(update_fields=['password'])
+    return valid
@@ -0,0 +1,454 @@
+"""
+Registry of AI model providers behind a common interface
+"""
+import asyncio
+import time
+from datetime import datetime
+from django.conf import settings
+from .breaker import CircuitOpen, create_breaker
+from .cache import cache_response
+from .clients import GEMINI_MODEL, GROQ_MODEL, get_client
+from .concurrency import get_provider_timeout
+from .ratelimit import RateLimited, create_limiter, parse_retry_after
+from .usage import arecord_call, record_call
+
+
+class UnknownProvider(ValueError):
+    pass
+
+
+def _status_code(error):
+    response = getattr(error, 'response', None)
+    return (
+        getattr(error, 'status_code', None)
+        or getattr(response, 'status_code', None)
+        or getattr(error, 'code', None)
+    )
+
+
+def is_transient(error):
+    """Whether a failed call is worth retrying later (rate limited or circuit open)"""
+    return isinstance(error, (RateLimited, CircuitOpen)) or _status_code(error) == 429
+
+
+def _text_and_usage(completion):
+    """_generate may return just the text or (text, usage)"""
+    return completion if isinstance(completion, tuple) else (completion, None)
+
+
+def _usage(prompt_tokens, completion_tokens):
+    if prompt_tokens is None and completion_tokens is None:
+        return None
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens}
+
+
+class Provider:
+    """
+    Base class for a model provider.
+
+    Subclasses set the class attributes and implement _generate, _agenerate,
+    _stream and _astream; json_mode asks the model for a JSON object reply. The
+    base class puts every call behind the provider's circuit breaker and rate
+    limiter (retrying after 429s), records each call's latency, token usage and
+    errors, and turns results into the dicts the views return
+    (respond/arespond, cached and coalesced).
+    """
+
+    name = None
+    label = None
+    # how the rubric evaluator refers to this model
+    description = None
+    model = None
+    api_key_setting = None
+    max_tokens = None
+
+    def __init__(self):
+        self.limiter = create_limiter(self.name)
+        self.breaker = create_breaker(self.name, self.probe)
+        cached = cache_response(self.name, model=self.model, max_tokens=self.max_tokens)
+        self._cached_complete = cached(self.complete)
+        self._cached_acomplete = cached(self.acomplete)
+
+    @property
+    def configured(self):
+        return bool(getattr(settings, self.api_key_setting, None))
+
+    def _generate(self, prompt, max_tokens=None, timeout=None, json_mode=False):
+        """
+        Return the completion text for prompt, or (text, usage) where usage is
+        {'prompt_tokens': ..., 'completion_tokens': ...} (raises on failure)
+        """
+        raise NotImplementedError
+
+    async def _agenerate(self, prompt, max_tokens=None, timeout=None, json_mode=False):
+        raise NotImplementedError
+
+    def _stream(self, prompt):
+        """Yield completion text as it is generated (raises on failure)"""
+        raise NotImplementedError
+
+    async def _astream(self, prompt):
+        raise NotImplementedError
+        yield
+
+    def probe(self):
+        """Cheapest real request, used to detect recovery while the circuit is open"""
+        with self.limiter.limit():
+            self._generate('ping', max_tokens=1, timeout=settings.BREAKER_PROBE_TIMEOUT)
+
+    def retry_after(self, error):
+        """Seconds to back off if error is a rate-limit (429) response, otherwise None"""
+        if _status_code(error) != 429:
+            return None
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        return parse_retry_after(headers.get('retry-after'))
+
+    def _backoff(self, error, attempt):
+        """Penalize the limiter for a 429; True if the call should be retried"""
+        retry_after = self.retry_after(error)
+        if retry_after is None:
+            return False
+        self.limiter.penalize(retry_after)
+        return attempt < settings.RATE_LIMIT_RETRIES
+
+    async def _abackoff(self, error, attempt):
+        retry_after = self.retry_after(error)
+        if retry_after is None:
+            return False
+        await self.limiter.apenalize(retry_after)
+        return attempt < settings.RATE_LIMIT_RETRIES
+
+    def _record_failure(self, error):
+        # rate limits mean the provider is up, just busy
+        if not isinstance(error, (RateLimited, CircuitOpen)) and self.retry_after(error) is None:
+            self.breaker.record_failure()
+
+    def _attempt(self, prompt, max_tokens, timeout, json_mode, purpose):
+        """One upstream request, recorded with its latency and usage or error"""
+        started = time.perf_counter()
+        try:
+            text, usage = _text_and_usage(self._generate(prompt, max_tokens, timeout, json_mode))
+        except Exception as e:
+            record_call(self, purpose, time.perf_counter() - started, error=e)
+            raise
+        record_call(self, purpose, time.perf_counter() - started, usage=usage)
+        return text, usage
+
+    async def _aattempt(self, prompt, max_tokens, timeout, json_mode, purpose):
+        started = time.perf_counter()
+        try:
+            # enforced here too so timeouts count against the breaker
+            text, usage = _text_and_usage(
+                await asyncio.wait_for(self._agenerate(prompt, max_tokens, timeout, json_mode), timeout)
+            )
+        except Exception as e:
+            await arecord_call(self, purpose, time.perf_counter() - started, error=e)
+            raise
+        await arecord_call(self, purpose, time.perf_counter() - started, usage=usage)
+        return text, usage
+
+    def _remaining(self, deadline, timeout):
+        """Seconds left before deadline for the next attempt (raises once it has passed)"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f'{self.label} timed out after {timeout}s')
+        return remaining
+
+    def _call(self, prompt, max_tokens=None, timeout=None, json_mode=False, purpose='response'):
+        """
+        (text, usage) for prompt through the breaker and rate limiter (raises on failure).
+
+        timeout bounds the whole call: limiter waits and retries after 429s all
+        come out of it, and each request gets what is left as its SDK timeout.
+        """
+        self.breaker.check()
+        timeout = timeout or get_provider_timeout(self.name)
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            try:
+                with self.limiter.limit(deadline):
+                    remaining = self._remaining(deadline, timeout)
+                    completion = self._attempt(prompt, max_tokens, remaining, json_mode, purpose)
+            except Exception as e:
+                if self._backoff(e, attempt):
+                    attempt += 1
+                    continue
+                self._record_failure(e)
+                raise
+            self.breaker.record_success()
+            return completion
+
+    async def _acall(self, prompt, max_tokens=None, timeout=None, json_mode=False, purpose='response'):
+        self.breaker.check()
+        timeout = timeout or get_provider_timeout(self.name)
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            try:
+                async with self.limiter.alimit(deadline):
+                    remaining = self._remaining(deadline, timeout)
+                    completion = await self._aattempt(prompt, max_tokens, remaining, json_mode, purpose)
+            except Exception as e:
+                if await self._abackoff(e, attempt):
+                    attempt += 1
+                    continue
+                self._record_failure(e)
+                raise
+            self.breaker.record_success()
+            return completion
+
+    def generate(self, prompt, max_tokens=None, timeout=None, json_mode=False, purpose='response'):
+        """Completion text for prompt through the breaker and rate limiter (raises on failure)"""
+        return self._call(prompt, max_tokens, timeout, json_mode, purpose)[0]
+
+    async def agenerate(self, prompt, max_tokens=None, timeout=None, json_mode=False, purpose='response'):
+        return (await self._acall(prompt, max_tokens, timeout, json_mode, purpose))[0]
+
+    def _missing_key(self):
+        return {
+            'model': self.label,
+            'response': 'API key not configured',
+            'error': f'Please configure {self.api_key_setting} in .env file'
+        }
+
+    def _succeeded(self, text, usage=None):
+        result = {
+            'model': self.label,
+            'response': text,
+            'timestamp': datetime.now().isoformat(),
+        }
+        if usage:
+            result['usage'] = usage
+        return result
+
+    def _failed(self, e):
+        print(f'{self.label} error: {str(e)}')
+        result = {
+            'model': self.label,
+            'error': str(e),
+            'response': f'Failed to get response from {self.label}',
+        }
+        if is_transient(e):
+            result['retryable'] = True
+        return result
+
+    def complete(self, prompt):
+        """Get a response as a result dict (errors are reported, not raised)"""
+        if not self.configured:
+            return self._missing_key()
+        try:
+            return self._succeeded(*self._call(prompt))
+        except Exception as e:
+            return self._failed(e)
+
+    async def acomplete(self, prompt):
+        """Async counterpart of complete"""
+        if not self.configured:
+            return self._missing_key()
+        try:
+            return self._succeeded(*await self._acall(prompt))
+        except Exception as e:
+            return self._failed(e)
+
+    def respond(self, prompt, use_cache=True):
+        """complete, answered from the response cache when possible (see cache_response)"""
+        started = time.perf_counter()
+        result = self._cached_complete(prompt, use_cache=use_cache)
+        elapsed = time.perf_counter() - started
+        if result.get('cached') or result.get('coalesced'):
+            record_call(self, 'response', elapsed, cached=True)
+        result.setdefault('latency_ms', round(elapsed * 1000, 1))
+        return result
+
+    async def arespond(self, prompt, use_cache=True):
+        started = time.perf_counter()
+        result = await self._cached_acomplete(prompt, use_cache=use_cache)
+        elapsed = time.perf_counter() - started
+        if result.get('cached') or result.get('coalesced'):
+            await arecord_call(self, 'response', elapsed, cached=True)
+        result.setdefault('latency_ms', round(elapsed * 1000, 1))
+        return result
+
+    def stream_text(self, prompt):
+        """Rate-limited _stream with the API key check applied"""
+        if not self.configured:
+            raise ValueError(f'Please configure {self.api_key_setting} in .env file')
+        self.breaker.check()
+        with self.limiter.limit():
+            started = time.perf_counter()
+            try:
+                yield from self._stream(prompt)
+            except Exception as e:
+                record_call(self, 'stream', time.perf_counter() - started, error=e)
+                # text may already have been sent, so back off but don't retry
+                self._backoff(e, settings.RATE_LIMIT_RETRIES)
+                self._record_failure(e)
+                raise
+            record_call(self, 'stream', time.perf_counter() - started)
+        self.breaker.record_success()
+
+    async def astream_text(self, prompt):
+        if not self.configured:
+            raise ValueError(f'Please configure {self.api_key_setting} in .env file')
+        self.breaker.check()
+        async with self.limiter.alimit():
+            started = time.perf_counter()
+            try:
+                async for text in self._astream(prompt):
+                    yield text
+            except Exception as e:
+                await arecord_call(self, 'stream', time.perf_counter() - started, error=e)
+                await self._abackoff(e, settings.RATE_LIMIT_RETRIES)
+                self._record_failure(e)
+                raise
+            await arecord_call(self, 'stream', time.perf_counter() - started)
+        self.breaker.record_success()
+
+
+class GroqProvider(Provider):
+    name = 'groq'
+    label = 'Groq'
+    description = 'Groq/Llama 3.3'
+    model = GROQ_MODEL
+    api_key_setting = 'GROQ_API_KEY'
+    max_tokens = 1000
+
+    def _request(self, prompt, max_tokens, timeout, json_mode=False, **kwargs):
+        if json_mode:
+            kwargs['response_format'] = {'type': 'json_object'}
+        return {
+            'model': self.model,
+            'messages': [{"role": "user", "content": prompt}],
+            'max_tokens': max_tokens or self.max_tokens,
+            'timeout': timeout or get_provider_timeout(self.name),
+            **kwargs,
+        }
+
+    def _usage(self, completion):
+        usage = getattr(completion, 'usage', None)
+        return _usage(getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None))
+
+    def _generate(self, prompt, max_tokens=None, timeout=None, json_mode=False):
+        completion = get_client('groq').chat.completions.create(
+            **self._request(prompt, max_tokens, timeout, json_mode)
+        )
+        return completion.choices[0].message.content, self._usage(completion)
+
+    async def _agenerate(self, prompt, max_tokens=None, timeout=None, json_mode=False):
+        completion = await get_client('groq_async').chat.completions.create(
+            **self._request(prompt, max_tokens, timeout, json_mode)
+        )
+        return completion.choices[0].message.content, self._usage(completion)
+
+    def _stream(self, prompt):
+        stream = get_client('groq').chat.completions.create(
+            **self._request(prompt, None, None, stream=True)
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def _astream(self, prompt):
+        stream = await get_client('groq_async').chat.completions.create(
+            **self._request(prompt, None, None, stream=True)
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class GeminiProvider(Provider):
+    name = 'gemini'
+    label = 'Gemini'
+    description = 'Gemini'
+    model = GEMINI_MODEL
+    api_key_setting = 'GEMINI_API_KEY'
+
+    def _options(self, max_tokens, timeout, json_mode=False):
+        options = {'request_options': {'timeout': timeout or get_provider_timeout(self.name)}}
+        generation_config = {}
+        if max_tokens or self.max_tokens:
+            generation_config['max_output_tokens'] = max_tokens or self.max_tokens
+        if json_mode:
+            generation_config['response_mime_type'] = 'application/json'
+        if generation_config:
+            options['generation_config'] = generation_config
+        return options
+
+    def _usage(self, result):
+        usage = getattr(result, 'usage_metadata', None)
+        return _usage(getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None))
+
+    def _generate(self, prompt, max_tokens=None, timeout=None, json_mode=False):
+        result = get_client('gemini').generate_content(prompt, **self._options(max_tokens, timeout, json_mode))
+        return result.text, self._usage(result)
+
+    def probe(self):
+        # a one-token reply may carry no text part, so only the request has to succeed
+        with self.limiter.limit():
+            get_client('gemini').generate_content('ping', **self._options(1, settings.BREAKER_PROBE_TIMEOUT))
+
+    async def _agenerate(self, prompt, max_tokens=None, timeout=None, json_mode=False):
+        result = await get_client('gemini_async').generate_content_async(
+            prompt, **self._options(max_tokens, timeout, json_mode)
+        )
+        return result.text, self._usage(result)
+
+    def _stream(self, prompt):
+        stream = get_client('gemini').generate_content(
+            prompt, stream=True, **self._options(None, None)
+        )
+        for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+    async def _astream(self, prompt):
+        stream = await get_client('gemini_async').generate_content_async(
+            prompt, stream=True, **self._options(None, None)
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+
+_providers = {}
+
+
+def register_provider(provider):
+    """Make a provider available to the AI endpoints under provider.name"""
+    _providers[provider.name] = provider
+    return provider
+
+
+def get_provider(name):
+    try:
+        return _providers[name]
+    except KeyError:
+        raise UnknownProvider(f'Unknown provider: {name}')
+
+
+def resolve_providers(names=None):
+    """Providers for a request's "providers" list (defaults to COMPARE_PROVIDERS)"""
+    if names is None:
+        names = settings.COMPARE_PROVIDERS
+    if not isinstance(names, list) or not names:
+        raise UnknownProvider('providers must be a non-empty list')
+    if not all(isinstance(name, str) for name in names):
+        raise UnknownProvider('providers must be a list of provider names')
+    return [get_provider(name) for name in dict.fromkeys(names)]
+
+
+def comparison_mode(providers):
+    """History mode of a comparison: the provider's name for one, 'both' for two, 'compare' for more"""
+    if len(providers) == 1:
+        return providers[0].name
+    return 'both' if len(providers) == 2 else 'compare'
+
+
+def available_providers():
+    return list(_providers.values())
+
+
+register_provider(GroqProvider())
+register_provider(GeminiProvider())
@@ -0,0 +1,297 @@
+"""
+Per-provider rate limiting shared by every worker process on the host
+"""
+import asyncio
+import os
+import random
+import struct
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    # no flock (Windows): limits then only apply within each process
+    fcntl = None
+
+# tokens, updated_at, blocked_until, rate_scale
+_STATE = struct.Struct('dddd')
+# how often a caller waiting for a concurrency slot checks again
+SLOT_POLL_INTERVAL = 0.05
+# how often an async caller retries the bucket lock while another thread or process holds it
+STATE_POLL_INTERVAL = 0.002
+# the adaptive rate never drops below this fraction of the configured rate
+MIN_RATE_SCALE = 0.1
+
+
+class RateLimited(Exception):
+    """The limiter could not admit a call within RATE_LIMIT_MAX_WAIT"""
+
+
+class _Busy(Exception):
+    """The bucket state is locked by another thread or process (non-blocking access only)"""
+
+
+def parse_retry_after(value):
+    """Seconds to back off for a Retry-After header value (RATE_LIMIT_BACKOFF if absent)"""
+    if value is None:
+        return settings.RATE_LIMIT_BACKOFF
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return settings.RATE_LIMIT_BACKOFF
+
+
+class ProviderLimiter:
+    """
+    Token bucket plus concurrency cap for one provider.
+
+    Both are kept in small files under RATE_LIMIT_DIR and guarded with flock, so
+    every thread and worker process on the host draws from the same budget. A
+    rate-limit response (penalize) pauses the bucket for the Retry-After period
+    and halves the request rate, which then recovers linearly over
+    RATE_LIMIT_RECOVERY seconds.
+
+    The async methods never block the event loop on those locks: they try them
+    without waiting and sleep briefly on the loop while they are held.
+    """
+
+    def __init__(self, name, rpm, burst, concurrency, directory, max_wait):
+        self.name = name
+        self.rate = rpm / 60.0
+        self.burst = max(burst, 1)
+        self.concurrency = max(concurrency, 1)
+        self.max_wait = max_wait
+        self._path = os.path.join(directory, f'{name}.bucket')
+        self._slot_paths = [os.path.join(directory, f'{name}.slot{i}') for i in range(self.concurrency)]
+        self._lock = threading.Lock()
+        # in-process fallbacks when flock is unavailable
+        self._local_state = None
+        self._local_slots = threading.BoundedSemaphore(self.concurrency)
+        self._stats = {
+            'admitted': 0,
+            'waited_ms': 0.0,
+            'throttled': 0,
+            'rejected': 0,
+        }
+        self._stats_lock = threading.Lock()
+        if fcntl is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    @contextmanager
+    def _state(self, blocking=True):
+        """
+        Read-modify-write the bucket state under an exclusive lock (with
+        blocking=False, raises _Busy instead of waiting for it)
+        """
+        if not self._lock.acquire(blocking):
+            raise _Busy
+        try:
+            if fcntl is None:
+                state = self._local_state or self._initial_state()
+                yield state
+                self._local_state = state
+                return
+
+            # opened per use: an inherited descriptor would share its lock with the parent
+            fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise _Busy
+                data = os.pread(fd, _STATE.size, 0)
+                state = list(_STATE.unpack(data)) if len(data) == _STATE.size else self._initial_state()
+                yield state
+                os.pwrite(fd, _STATE.pack(*state), 0)
+            finally:
+                os.close(fd)
+        finally:
+            self._lock.release()
+
+    def _initial_state(self):
+        return [float(self.burst), time.time(), 0.0, 1.0]
+
+    def _refill(self, state, now):
+        tokens, updated, blocked_until, scale = state
+        elapsed = max(now - updated, 0.0)
+        scale = min(1.0, scale + elapsed / settings.RATE_LIMIT_RECOVERY)
+        state[:] = [min(self.burst, tokens + elapsed * self.rate * scale), now, blocked_until, scale]
+
+    def _reserve(self, blocking=True):
+        """Take a token if one is available, otherwise return the seconds until one is"""
+        if not self.rate:
+            return 0.0
+        with self._state(blocking) as state:
+            now = time.time()
+            self._refill(state, now)
+            tokens, _, blocked_until, scale = state
+            if blocked_until > now:
+                return blocked_until - now
+            if tokens >= 1:
+                state[0] = tokens - 1
+                return 0.0
+            return (1 - tokens) / (self.rate * scale)
+
+    def _penalize(self, state, retry_after):
+        now = time.time()
+        self._refill(state, now)
+        state[0] = 0.0
+        state[2] = max(state[2], now + retry_after)
+        state[3] = max(state[3] / 2, MIN_RATE_SCALE)
+
+    def penalize(self, retry_after):
+        """Back off after the provider answered 429 (retry_after in seconds)"""
+        self._count('throttled')
+        with self._state() as state:
+            self._penalize(state, retry_after)
+        print(f'{self.name} rate limited, backing off {retry_after:.1f}s')
+
+    async def apenalize(self, retry_after):
+        """Async counterpart of penalize"""
+        self._count('throttled')
+        while True:
+            try:
+                with self._state(blocking=False) as state:
+                    self._penalize(state, retry_after)
+                break
+            except _Busy:
+                await asyncio.sleep(STATE_POLL_INTERVAL)
+        print(f'{self.name} rate limited, backing off {retry_after:.1f}s')
+
+    def _try_slot(self):
+        if fcntl is None:
+            return self._local_slots if self._local_slots.acquire(blocking=False) else None
+
+        # start at a random slot so waiters don't all contend for slot 0
+        offset = random.randrange(self.concurrency)
+        for i in range(self.concurrency):
+            path = self._slot_paths[(offset + i) % self.concurrency]
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def _release_slot(self, slot):
+        if fcntl is None:
+            slot.release()
+        else:
+            # closing the descriptor drops the flock (also if the process dies)
+            os.close(slot)
+
+    def _delay(self, wait, deadline, max_wait):
+        if time.monotonic() + wait > deadline:
+            self._count('rejected')
+            raise RateLimited(f'{self.name} is rate limited; no capacity within {max_wait:.1f}s')
+        return wait
+
+    def _admit(self, deadline=None, blocking=True):
+        """
+        Yield how long to sleep until admitted; returns the held concurrency slot.
+        Waits up to max_wait, or until deadline (a time.monotonic() value) if sooner.
+        With blocking=False a locked bucket is retried after STATE_POLL_INTERVAL.
+        """
+        now = time.monotonic()
+        deadline = min(now + self.max_wait, deadline if deadline is not None else float('inf'))
+        max_wait = max(deadline - now, 0.0)
+        slot = self._try_slot()
+        while slot is None:
+            yield self._delay(SLOT_POLL_INTERVAL, deadline, max_wait)
+            slot = self._try_slot()
+        try:
+            while True:
+                try:
+                    wait = self._reserve(blocking)
+                except _Busy:
+                    wait = STATE_POLL_INTERVAL
+                else:
+                    if wait <= 0:
+                        return slot
+                yield self._delay(wait, deadline, max_wait)
+        except BaseException:
+            self._release_slot(slot)
+            raise
+
+    def _admitted(self, started):
+        with self._stats_lock:
+            self._stats['admitted'] += 1
+            self._stats['waited_ms'] += (time.perf_counter() - started) * 1000
+
+    @contextmanager
+    def limit(self, deadline=None):
+        """
+        Hold a concurrency slot and one request token for the duration of a call
+        (raises RateLimited if they can't be had before deadline, see _admit)
+        """
+        started = time.perf_counter()
+        admit = self._admit(deadline)
+        try:
+            while True:
+                time.sleep(next(admit))
+        except StopIteration as done:
+            slot = done.value
+        self._admitted(started)
+        try:
+            yield
+        finally:
+            self._release_slot(slot)
+
+    @asynccontextmanager
+    async def alimit(self, deadline=None):
+        """Async counterpart of limit; waiting happens on the event loop"""
+        started = time.perf_counter()
+        admit = self._admit(deadline, blocking=False)
+        try:
+            while True:
+                wait = next(admit)
+                try:
+                    await asyncio.sleep(wait)
+                except BaseException:
+                    admit.close()
+                    raise
+        except StopIteration as done:
+            slot = done.value
+        self._admitted(started)
+        try:
+            yield
+        finally:
+            self._release_slot(slot)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['waited_ms'] = round(stats['waited_ms'], 1)
+        if self.rate:
+            with self._state() as state:
+                now = time.time()
+                self._refill(state, now)
+                stats['tokens'] = round(state[0], 2)
+                stats['blocked_for'] = round(max(state[2] - now, 0.0), 1)
+                stats['rate_scale'] = round(state[3], 2)
+        return stats
+
+
+def create_limiter(name):
+    """Limiter for a provider from the RATE_LIMIT_* / PROVIDER_* settings"""
+    return ProviderLimiter(
+        name,
+        rpm=settings.PROVIDER_RATE_LIMITS.get(name, 0),
+        burst=settings.RATE_LIMIT_BURST,
+        concurrency=settings.PROVIDER_CONCURRENCY.get(name, settings.PROVIDER_MAX_CONCURRENCY),
+        directory=settings.RATE_LIMIT_DIR,
+        max_wait=settings.RATE_LIMIT_MAX_WAIT,
+    )
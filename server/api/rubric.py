@@ -0,0 +1,595 @@
+"""
+AI-evaluated comparison rubric (pairwise or pipelined per-response scoring)
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from concurrent.futures import TimeoutError
+from functools import partial
+from django.conf import settings
+from .cache import cache_response
+from .concurrency import (
+    LatencyWindow, ahedge, failed_result, fan_out, get_provider_timeout, hedge, submit_pipeline,
+)
+from .providers import get_provider, is_transient
+
+CRITERIA = ['accuracy', 'relevance', 'clarity', 'completeness', 'usefulness']
+
+RUBRIC_MODES = ('pipelined', 'pairwise')
+
+RUBRIC_CRITERIA_TEXT = """1. **Accuracy**: How factually correct and reliable is the information?
+2. **Relevance**: How well does it address the prompt?
+3. **Clarity**: How clear and easy to understand is the response?
+4. **Completeness**: How thorough and comprehensive is the answer?
+5. **Usefulness**: How practical and helpful is the response?"""
+
+# evaluator providers in order of preference: (name, label, max_tokens)
+RUBRIC_EVALUATORS = [
+    ('gemini', 'Gemini Flash', None),
+    ('groq', 'Groq Llama 3.3', 2000),
+]
+
+_evaluator_params = [(name, get_provider(name).model, max_tokens) for name, _, max_tokens in RUBRIC_EVALUATORS]
+
+# shared by the sync and async functions so both hit the same cache entries
+cache_rubric = cache_response('rubric', evaluators=_evaluator_params)
+cache_score = cache_response('rubric_score', evaluators=_evaluator_params)
+
+# how long the preferred evaluator usually takes, to decide when to hedge
+RUBRIC_LATENCY = LatencyWindow(settings.HEDGE_WINDOW)
+SCORE_LATENCY = LatencyWindow(settings.HEDGE_WINDOW)
+
+
+def build_comparison_prompt(prompt, response_a, response_b, label_a='Groq/Llama 3.3', label_b='Gemini'):
+    """Build the evaluator prompt that scores both responses against the rubric"""
+    return f"""You are an expert AI evaluator. Compare these two AI responses to the same prompt and provide a detailed evaluation.
+
+Original Prompt: {prompt}
+
+Response A ({label_a}): {response_a}
+
+Response B ({label_b}): {response_b}
+
+Please evaluate both responses using the following rubric (score each criterion from 1-10):
+
+{RUBRIC_CRITERIA_TEXT}
+
+Provide your evaluation in the following JSON format:
+{{
+    "response_a": {{
+        "accuracy": <score>,
+        "relevance": <score>,
+        "clarity": <score>,
+        "completeness": <score>,
+        "usefulness": <score>,
+        "total": <sum of all scores>,
+        "strengths": ["strength 1", "strength 2"],
+        "weaknesses": ["weakness 1", "weakness 2"]
+    }},
+    "response_b": {{
+        "accuracy": <score>,
+        "relevance": <score>,
+        "clarity": <score>,
+        "completeness": <score>,
+        "usefulness": <score>,
+        "total": <sum of all scores>,
+        "strengths": ["strength 1", "strength 2"],
+        "weaknesses": ["weakness 1", "weakness 2"]
+    }},
+    "overall_comparison": "Brief summary of which is better and why",
+    "recommendation": "Which response would you recommend and why?"
+}}"""
+
+
+def build_scoring_prompt(prompt, response, label):
+    """Build the evaluator prompt that scores a single response against the rubric"""
+    return f"""You are an expert AI evaluator. Evaluate this AI response to the prompt below.
+
+Original Prompt: {prompt}
+
+Response ({label}): {response}
+
+Please evaluate the response using the following rubric (score each criterion from 1-10):
+
+{RUBRIC_CRITERIA_TEXT}
+
+Provide your evaluation in the following JSON format:
+{{
+    "accuracy": <score>,
+    "relevance": <score>,
+    "clarity": <score>,
+    "completeness": <score>,
+    "usefulness": <score>,
+    "total": <sum of all scores>,
+    "strengths": ["strength 1", "strength 2"],
+    "weaknesses": ["weakness 1", "weakness 2"],
+    "summary": "One sentence on how good the response is overall"
+}}"""
+
+
+class RubricParseError(ValueError):
+    """An evaluator reply could not be turned into a valid rubric"""
+
+
+# parsed: valid JSON as returned, repaired: fixed up locally, invalid: unusable,
+# fallbacks: invalid replies that made us ask the next evaluator
+_parse_stats = {
+    'parsed': 0,
+    'repaired': 0,
+    'invalid': 0,
+    'fallbacks': 0,
+}
+_parse_stats_lock = threading.Lock()
+
+_CLOSERS = {'{': '}', '[': ']'}
+_SMART_QUOTES = str.maketrans({'\u201c': '"', '\u201d': '"', '\u2018': "'", '\u2019': "'"})
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+_decoder = json.JSONDecoder()
+
+
+def _count_parse(name):
+    with _parse_stats_lock:
+        _parse_stats[name] += 1
+
+
+def rubric_stats():
+    with _parse_stats_lock:
+        return dict(_parse_stats)
+
+
+def extract_json(text):
+    """The JSON object in an evaluator reply, without code fences or surrounding prose"""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+    start = text.find('{')
+    if start < 0:
+        raise RubricParseError('no JSON object in evaluator reply')
+    # anything after the object is ignored by the decoder / repair
+    return text[start:].strip()
+
+
+def repair_json(text):
+    """
+    Fix the usual ways LLM output misses being JSON: smart quotes, comments,
+    trailing commas, raw newlines in strings, text after the object and a
+    reply truncated mid-object (open strings, arrays and objects are closed).
+    """
+    text = text.translate(_SMART_QUOTES)
+    out = []
+    stack = []
+    in_string = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            if char == '\\' and i + 1 < len(text):
+                out.append(text[i:i + 2])
+                i += 2
+                continue
+            if char == '"':
+                in_string = False
+            out.append({'\n': '\\n', '\r': '\\r', '\t': '\\t'}.get(char, char))
+        elif char == '"':
+            in_string = True
+            out.append(char)
+        elif text.startswith('//', i):
+            end = text.find('\n', i)
+            i = len(text) if end < 0 else end
+            continue
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = len(text) if end < 0 else end + 2
+            continue
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+            out.append(char)
+        elif char in '}]':
+            _drop_trailing_comma(out)
+            if stack and stack[-1] == char:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                break
+        else:
+            out.append(char)
+        i += 1
+
+    if in_string:
+        out.append('"')
+    # a truncated reply may end on a dangling key or comma
+    while out and out[-1].strip() in ('', ',', ':'):
+        out.pop()
+    if out and out[-1].endswith('"') and stack and stack[-1] == '}' and _ends_with_key(out):
+        out.append(': null')
+    for closer in reversed(stack):
+        _drop_trailing_comma(out)
+        out.append(closer)
+    return ''.join(out)
+
+
+def _drop_trailing_comma(out):
+    i = len(out) - 1
+    while i >= 0 and not out[i].strip():
+        i -= 1
+    if i >= 0 and out[i] == ',':
+        del out[i]
+
+
+def _ends_with_key(out):
+    """Whether the string that ends out is an object key (follows '{' or ',')"""
+    text = ''.join(out).rstrip()
+    start = text.rfind('"', 0, len(text) - 1)
+    while start > 0 and text[start - 1] == '\\':
+        start = text.rfind('"', 0, start - 1)
+    return text[:start].rstrip().endswith(('{', ','))
+
+
+def _score(scores, criterion):
+    value = scores.get(criterion)
+    if isinstance(value, str):
+        # e.g. "8", "8/10" or "8 - clear and concise"
+        match = _NUMBER.search(value)
+        value = float(match.group()) if match else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RubricParseError(f'missing or non-numeric {criterion} score')
+    return min(max(round(value), 1), 10)
+
+
+def _text_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [str(item) for item in value if item is not None]
+    return [str(value)]
+
+
+def validate_scores(scores):
+    """Check one response's scores; coerces scores to 1-10 and recomputes total"""
+    if not isinstance(scores, dict):
+        raise RubricParseError('scores must be an object')
+    for criterion in CRITERIA:
+        scores[criterion] = _score(scores, criterion)
+    # models often get the sum wrong, so don't trust theirs
+    scores['total'] = sum(scores[criterion] for criterion in CRITERIA)
+    scores['strengths'] = _text_list(scores.get('strengths'))
+    scores['weaknesses'] = _text_list(scores.get('weaknesses'))
+    if scores.get('summary') is not None:
+        scores['summary'] = str(scores['summary'])
+    return scores
+
+
+def validate_rubric(rubric):
+    """Check a pairwise rubric (response_a, response_b and the comparison text)"""
+    if not isinstance(rubric, dict):
+        raise RubricParseError('rubric must be an object')
+    for key in ('response_a', 'response_b'):
+        rubric[key] = validate_scores(rubric.get(key))
+    for key in ('overall_comparison', 'recommendation'):
+        rubric[key] = str(rubric.get(key) or '')
+    return rubric
+
+
+def parse_rubric_text(response_text, validate=validate_rubric):
+    """
+    Extract and validate the rubric JSON from an evaluator reply, repairing
+    near-valid JSON; raises RubricParseError if it can't be used.
+    """
+    text = extract_json(response_text)
+    try:
+        result = validate(_decoder.raw_decode(text)[0])
+        _count_parse('parsed')
+        return result
+    except json.JSONDecodeError:
+        pass
+    try:
+        result = validate(json.loads(repair_json(text)))
+    except json.JSONDecodeError as e:
+        raise RubricParseError(f'invalid JSON in evaluator reply: {str(e)}')
+    _count_parse('repaired')
+    return result
+
+
+def get_rubric_mode(data):
+    """The rubric mode a request asked for (defaults to RUBRIC_MODE)"""
+    mode = data.get('rubric_mode') or settings.RUBRIC_MODE
+    if mode not in RUBRIC_MODES:
+        raise ValueError(f'rubric_mode must be one of: {", ".join(RUBRIC_MODES)}')
+    return mode
+
+
+def _rejected(evaluator, e):
+    print(f'Rubric parse error ({evaluator}): {str(e)}')
+    _count_parse('invalid')
+    if evaluator != RUBRIC_EVALUATORS[-1][1]:
+        _count_parse('fallbacks')
+
+
+def evaluate(name, evaluator, max_tokens, evaluator_prompt, validate=validate_rubric):
+    """Ask one evaluator; returns (validated JSON, evaluator label) or raises"""
+    try:
+        text = get_provider(name).generate(
+            evaluator_prompt, max_tokens=max_tokens, json_mode=settings.RUBRIC_JSON_MODE, purpose='rubric'
+        )
+        return parse_rubric_text(text, validate), evaluator
+    except RubricParseError as e:
+        _rejected(evaluator, e)
+        raise
+    except Exception as e:
+        print(f'Rubric generation error ({evaluator}): {str(e)}')
+        raise
+
+
+async def aevaluate(name, evaluator, max_tokens, evaluator_prompt, validate=validate_rubric):
+    """Async counterpart of evaluate"""
+    try:
+        text = await get_provider(name).agenerate(
+            evaluator_prompt, max_tokens=max_tokens, json_mode=settings.RUBRIC_JSON_MODE, purpose='rubric'
+        )
+        return parse_rubric_text(text, validate), evaluator
+    except RubricParseError as e:
+        _rejected(evaluator, e)
+        raise
+    except Exception as e:
+        print(f'Rubric generation error ({evaluator}): {str(e)}')
+        raise
+
+
+def _failed(e):
+    result = {
+        'success': False,
+        'error': 'Failed to generate comparison rubric',
+        'details': str(e)
+    }
+    if is_transient(e):
+        result['retryable'] = True
+    return result
+
+
+@cache_rubric
+def get_ai_comparison_rubric(prompt, response_a, response_b, label_a='Groq/Llama 3.3', label_b='Gemini'):
+    comparison_prompt = build_comparison_prompt(prompt, response_a, response_b, label_a, label_b)
+
+    # later evaluators are fallbacks, and hedges when the first one is unusually slow
+    try:
+        rubric, evaluator = hedge([
+            partial(evaluate, *evaluator, comparison_prompt) for evaluator in RUBRIC_EVALUATORS
+        ], RUBRIC_LATENCY)
+    except Exception as e:
+        return _failed(e)
+    return {
+        'success': True,
+        'rubric': rubric,
+        'evaluator': evaluator,
+        'rubric_mode': 'pairwise',
+    }
+
+
+@cache_rubric
+async def aget_ai_comparison_rubric(prompt, response_a, response_b, label_a='Groq/Llama 3.3', label_b='Gemini'):
+    """Async counterpart of get_ai_comparison_rubric"""
+    comparison_prompt = build_comparison_prompt(prompt, response_a, response_b, label_a, label_b)
+
+    try:
+        rubric, evaluator = await ahedge([
+            partial(aevaluate, *evaluator, comparison_prompt) for evaluator in RUBRIC_EVALUATORS
+        ], RUBRIC_LATENCY)
+    except Exception as e:
+        return _failed(e)
+    return {
+        'success': True,
+        'rubric': rubric,
+        'evaluator': evaluator,
+        'rubric_mode': 'pairwise',
+    }
+
+
+@cache_score
+def score_response(prompt, response, label):
+    """Score one response on its own, so it can start as soon as that response is ready"""
+    try:
+        scores, evaluator = hedge([
+            partial(evaluate, *evaluator, build_scoring_prompt(prompt, response, label), validate_scores)
+            for evaluator in RUBRIC_EVALUATORS
+        ], SCORE_LATENCY)
+    except Exception as e:
+        return _failed(e)
+    return {
+        'success': True,
+        'scores': scores,
+        'evaluator': evaluator
+    }
+
+
+@cache_score
+async def ascore_response(prompt, response, label):
+    """Async counterpart of score_response"""
+    try:
+        scores, evaluator = await ahedge([
+            partial(aevaluate, *evaluator, build_scoring_prompt(prompt, response, label), validate_scores)
+            for evaluator in RUBRIC_EVALUATORS
+        ], SCORE_LATENCY)
+    except Exception as e:
+        return _failed(e)
+    return {
+        'success': True,
+        'scores': scores,
+        'evaluator': evaluator
+    }
+
+
+def merge_scores(score_a, score_b, label_a, label_b):
+    """Combine two independent scores into the pairwise rubric result"""
+    for score in (score_a, score_b):
+        if not score.get('success'):
+            return score
+
+    a, b = score_a['scores'], score_b['scores']
+    if a['total'] == b['total']:
+        overall = f"Both responses score {a['total']}/50. {a.get('summary', '')} {b.get('summary', '')}"
+        recommendation = 'Either response: they rate equally on the rubric.'
+    else:
+        a_wins = a['total'] > b['total']
+        letter, label, winner, loser = ('A', label_a, a, b) if a_wins else ('B', label_b, b, a)
+        overall = f"Response {letter} ({label}) scores higher, {winner['total']}/50 vs {loser['total']}/50. {winner.get('summary', '')}"
+        ahead = [criterion for criterion in CRITERIA if winner.get(criterion, 0) > loser.get(criterion, 0)]
+        recommendation = f"Response {letter} ({label})"
+        if ahead:
+            recommendation += f", which is stronger on {', '.join(ahead)}"
+        recommendation += '.'
+
+    evaluators = dict.fromkeys([score_a['evaluator'], score_b['evaluator']])
+    return {
+        'success': True,
+        'rubric': {
+            'response_a': a,
+            'response_b': b,
+            'overall_comparison': overall.strip(),
+            'recommendation': recommendation,
+        },
+        'evaluator': ' / '.join(evaluators),
+        'rubric_mode': 'pipelined',
+    }
+
+
+def respond_and_score(provider, prompt, use_cache=True):
+    """Get a provider's response and score it as soon as it arrives; returns (result, score)"""
+    started = time.perf_counter()
+    result = provider.respond(prompt, use_cache=use_cache)
+    result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    if result.get('error'):
+        return result, None
+    return result, score_response(prompt, result['response'], provider.description, use_cache=use_cache)
+
+
+async def arespond_and_score(provider, prompt, use_cache=True):
+    """Async counterpart of respond_and_score"""
+    started = time.perf_counter()
+    result = await provider.arespond(prompt, use_cache=use_cache)
+    result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    if result.get('error'):
+        return result, None
+    return result, await ascore_response(prompt, result['response'], provider.description, use_cache=use_cache)
+
+
+def evaluation_timeout():
+    """Deadline in seconds for scoring a response: the evaluators' timeouts, as they are asked in turn when one fails"""
+    return round(sum(get_provider_timeout(name) for name, _, _ in RUBRIC_EVALUATORS), 3)
+
+
+def pipeline_timeout(provider):
+    """Deadline in seconds for a provider's response plus its score"""
+    return round(get_provider_timeout(provider.name) + evaluation_timeout(), 3)
+
+
+def wait_for_score(future):
+    """Result of a score_response future, or a failed score once evaluation_timeout has passed"""
+    timeout = evaluation_timeout()
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        return _failed(TimeoutError(f'Rubric evaluation timed out after {timeout}s'))
+
+
+async def await_score(task):
+    """Async counterpart of wait_for_score for an ascore_response task (cancelled on timeout)"""
+    timeout = evaluation_timeout()
+    try:
+        return await asyncio.wait_for(task, timeout)
+    except asyncio.TimeoutError:
+        return _failed(TimeoutError(f'Rubric evaluation timed out after {timeout}s'))
+
+
+def _pipeline_result(future, provider, started):
+    """(result, score) of a respond_and_score future; a call that misses its deadline fails like in fan_out"""
+    timeout = pipeline_timeout(provider)
+    try:
+        return future.result(timeout=max(timeout - (time.perf_counter() - started), 0))
+    except TimeoutError:
+        future.cancel()
+        print(f'{provider.label} timed out after {timeout}s')
+        return failed_result(provider.label, f'{provider.label} timed out after {timeout}s', started), None
+    except Exception as e:
+        print(f'{provider.label} error: {str(e)}')
+        return failed_result(provider.label, str(e), started), None
+
+
+async def _apipeline_result(provider, prompt, use_cache):
+    """Async counterpart of _pipeline_result"""
+    started = time.perf_counter()
+    timeout = pipeline_timeout(provider)
+    try:
+        return await asyncio.wait_for(arespond_and_score(provider, prompt, use_cache), timeout)
+    except asyncio.TimeoutError:
+        print(f'{provider.label} timed out after {timeout}s')
+        return failed_result(provider.label, f'{provider.label} timed out after {timeout}s', started), None
+    except Exception as e:
+        print(f'{provider.label} error: {str(e)}')
+        return failed_result(provider.label, str(e), started), None
+
+
+def pipelined_rubric(prompt, provider_a, provider_b, use_cache=True):
+    """
+    Responses and rubric with each response's evaluation overlapping the other
+    model's generation.
+
+    Returns ({name: result}, rubric_result); rubric_result is None when a
+    response failed.
+    """
+    started = time.perf_counter()
+    futures = [submit_pipeline(respond_and_score, provider, prompt, use_cache) for provider in (provider_a, provider_b)]
+    (result_a, score_a), (result_b, score_b) = [
+        _pipeline_result(future, provider, started) for future, provider in zip(futures, (provider_a, provider_b))
+    ]
+    results = {provider_a.name: result_a, provider_b.name: result_b}
+    if score_a is None or score_b is None:
+        return results, None
+    return results, merge_scores(score_a, score_b, provider_a.description, provider_b.description)
+
+
+async def apipelined_rubric(prompt, provider_a, provider_b, use_cache=True):
+    """Async counterpart of pipelined_rubric"""
+    (result_a, score_a), (result_b, score_b) = await asyncio.gather(
+        _apipeline_result(provider_a, prompt, use_cache),
+        _apipeline_result(provider_b, prompt, use_cache),
+    )
+    results = {provider_a.name: result_a, provider_b.name: result_b}
+    if score_a is None or score_b is None:
+        return results, None
+    return results, merge_scores(score_a, score_b, provider_a.description, provider_b.description)
+
+
+def rubric_comparison(prompt, provider_a, provider_b, rubric_mode, use_cache=True):
+    """
+    Both providers' responses and their rubric evaluation.
+
+    Returns ({name: result}, rubric_result); rubric_result is None when a
+    response failed.
+    """
+    if rubric_mode == 'pipelined':
+        # each response is scored as soon as it arrives, overlapping the other model
+        return pipelined_rubric(prompt, provider_a, provider_b, use_cache=use_cache)
+
+    results = fan_out({
+        provider.name: (provider.label, partial(provider.respond, use_cache=use_cache), prompt)
+        for provider in (provider_a, provider_b)
+    })
+    result_a = results[provider_a.name]
+    result_b = results[provider_b.name]
+    if result_a.get('error') or result_b.get('error'):
+        return results, None
+    # get AI-based comparison and rubric in a single evaluator call
+    return results, get_ai_comparison_rubric(
+        prompt,
+        result_a.get('response'),
+        result_b.get('response'),
+        provider_a.description,
+        provider_b.description,
+        use_cache=use_cache
+    )
@@ -0,0 +1,199 @@
+"""
+Full-text search over query history: a tsvector table with a GIN index on
+PostgreSQL, an FTS5 table on SQLite
+"""
+import re
+from django.conf import settings
+from django.db import connection, transaction
+
+TABLE = 'api_query_search'
+# search terms used from one query string
+MAX_TERMS = 16
+# text indexed per prompt or response set (a tsvector is limited to 1 MB)
+MAX_DOCUMENT_CHARS = 100000
+
+
+class SearchUnavailable(Exception):
+    """The database has no search index"""
+
+
+def search_terms(text):
+    """The words of a search string, lowercased"""
+    return re.findall(r'\w+', text.lower())[:MAX_TERMS]
+
+
+class PostgresSearch:
+    """
+    One row per query with its prompt (weight A) and responses (weight B) as a
+    tsvector, GIN indexed. A trigger removes the row with its query.
+    """
+
+    def create(self, cursor):
+        cursor.execute(f'''
+            CREATE TABLE {TABLE} (
+                query_id bigint PRIMARY KEY,
+                user_id bigint NOT NULL,
+                document tsvector NOT NULL
+            )
+        ''')
+        cursor.execute(f'CREATE INDEX {TABLE}_document ON {TABLE} USING gin (document)')
+        cursor.execute(f'CREATE INDEX {TABLE}_user ON {TABLE} (user_id)')
+        cursor.execute(f'''
+            CREATE FUNCTION {TABLE}_delete() RETURNS trigger AS $$
+            BEGIN
+                DELETE FROM {TABLE} WHERE query_id = OLD.id;
+                RETURN OLD;
+            END
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER {TABLE}_delete AFTER DELETE ON api_queryhistory
+            FOR EACH ROW EXECUTE FUNCTION {TABLE}_delete()
+        ''')
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {TABLE}_delete ON api_queryhistory')
+        cursor.execute(f'DROP FUNCTION IF EXISTS {TABLE}_delete()')
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+    def index(self, cursor, documents):
+        language = settings.SEARCH_LANGUAGE
+        cursor.executemany(f'''
+            INSERT INTO {TABLE} (query_id, user_id, document)
+            VALUES (%s, %s, setweight(to_tsvector(%s::regconfig, %s), 'A')
+                         || setweight(to_tsvector(%s::regconfig, %s), 'B'))
+            ON CONFLICT (query_id) DO UPDATE SET document = EXCLUDED.document
+        ''', [(query_id, user_id, language, prompt, language, responses)
+              for query_id, user_id, prompt, responses in documents])
+
+    def clear(self, cursor):
+        cursor.execute(f'TRUNCATE {TABLE}')
+
+    def search(self, cursor, user_id, terms, limit, offset):
+        # every term must match, the last one as a prefix; quoted, so a term can't
+        # be read as tsquery syntax (terms never contain quotes)
+        lexemes = [f"'{term}'" for term in terms]
+        query = ' & '.join(lexemes[:-1] + [f'{lexemes[-1]}:*'])
+        cursor.execute(f'''
+            SELECT query_id, ts_rank_cd(document, query) AS rank
+            FROM {TABLE}, to_tsquery(%s::regconfig, %s) query
+            WHERE user_id = %s AND document @@ query
+            ORDER BY rank DESC, query_id DESC
+            LIMIT %s OFFSET %s
+        ''', [settings.SEARCH_LANGUAGE, query, user_id, limit, offset])
+        return cursor.fetchall()
+
+
+class SQLiteSearch:
+    """
+    A contentless FTS5 table (the text itself is only stored compressed in the
+    history tables) keyed by query id, ranked by bm25 with prompts weighted
+    over responses. Each row carries an owner token, so a user's matches are
+    found through the index. Rows of deleted queries can't be removed from a
+    contentless table; search_page reads past them and rebuild_search_index
+    drops them.
+    """
+
+    def create(self, cursor):
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE {TABLE} USING fts5(
+                owner, prompt, responses, content='', tokenize='porter unicode61'
+            )
+        ''')
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}, rank) VALUES ('rank', 'bm25(0.0, 4.0, 1.0)')")
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+    def index(self, cursor, documents):
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, owner, prompt, responses) VALUES (%s, %s, %s, %s)',
+            [(query_id, f'u{user_id}', prompt, responses) for query_id, user_id, prompt, responses in documents],
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('delete-all')")
+
+    def search(self, cursor, user_id, terms, limit, offset):
+        phrases = [f'"{term}"' for term in terms]
+        # prefix queries aren't stemmed, so the last word also matches as a whole (stemmed) word
+        phrases[-1] = f'({phrases[-1]} OR {phrases[-1]}*)'
+        match = f'owner:u{int(user_id)} AND {{prompt responses}}: ({" AND ".join(phrases)})'
+        cursor.execute(
+            f'SELECT rowid, -rank FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY rank, rowid DESC LIMIT %s OFFSET %s',
+            [match, limit, offset],
+        )
+        return cursor.fetchall()
+
+
+BACKENDS = {
+    'postgresql': PostgresSearch,
+    'sqlite': SQLiteSearch,
+}
+
+
+def get_backend(vendor=None):
+    """The search backend for a database vendor (default: the default database's), or None"""
+    backend = BACKENDS.get(vendor or connection.vendor)
+    return backend() if backend is not None else None
+
+
+def build_document(query, rows):
+    """(query id, user id, prompt, responses) to index for a saved history entry"""
+    from .models import ModelResponse
+    responses = '\n'.join(row.response for row in rows if isinstance(row, ModelResponse))
+    return query.pk, query.user_id, query.prompt[:MAX_DOCUMENT_CHARS], responses[:MAX_DOCUMENT_CHARS]
+
+
+def index_entries(entries):
+    """Add saved (query, rows) history entries to the index; a failure is logged rather than raised"""
+    backend = get_backend()
+    if not settings.SEARCH_ENABLED or backend is None:
+        return
+    documents = [build_document(query, rows) for query, rows in entries if query is not None]
+    if not documents:
+        return
+    try:
+        # a savepoint, so a failed index write leaves the history rows to commit
+        with transaction.atomic(), connection.cursor() as cursor:
+            backend.index(cursor, documents)
+    except Exception as e:
+        print(f'Search index error: {str(e)}')
+
+
+def search_history(user_id, text, limit, offset=0):
+    """[(query id, rank)] of the user's queries matching every word of text, best first"""
+    backend = get_backend()
+    if not settings.SEARCH_ENABLED:
+        raise SearchUnavailable('Search is disabled')
+    if backend is None:
+        raise SearchUnavailable(f'Search is not available on {connection.vendor}')
+    terms = search_terms(text)
+    if not terms:
+        return []
+    with connection.cursor() as cursor:
+        return backend.search(cursor, user_id, terms, limit, offset)
+
+
+def search_page(user_id, text, limit, offset, load):
+    """
+    One page of search_history: ([(item, rank)], offset of the next page or None).
+
+    load(query_ids) returns {query id: item} for the queries that still exist.
+    Matches of deleted queries (which the SQLite index keeps until it is rebuilt)
+    are skipped and more are read in their place, so a page is only short when
+    there are no more results; reading stops past SEARCH_MAX_OFFSET.
+    """
+    page = []
+    while True:
+        matches = search_history(user_id, text, limit + 1, offset)
+        items = load([query_id for query_id, _ in matches])
+        for position, (query_id, rank) in enumerate(matches):
+            if query_id not in items:
+                continue
+            if len(page) == limit:
+                return page, offset + position
+            page.append((items[query_id], rank))
+        offset += len(matches)
+        if len(matches) <= limit or offset > settings.SEARCH_MAX_OFFSET:
+            return page, None
@@ -0,0 +1,83 @@
+"""
+Single-flight coalescing of concurrent identical provider calls
+"""
+import asyncio
+import threading
+import weakref
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Let concurrent callers with the same key share one upstream call.
+
+    The first caller (the leader) runs the call; callers arriving while it is in
+    flight wait for it and receive the same result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args):
+        """Run func(*args) once per key in flight; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Event-loop counterpart of SingleFlight.
+
+    The shared call runs as its own task, so a caller that is cancelled (e.g. by
+    a provider timeout) does not cancel it for the others waiting on it. A task
+    can only be awaited on its own loop, so calls are coalesced per event loop.
+    """
+
+    def __init__(self):
+        self._loops = weakref.WeakKeyDictionary()
+
+    async def do(self, key, func, *args):
+        """Await func(*args) once per key in flight on this loop; returns (result, shared)"""
+        tasks = self._loops.setdefault(asyncio.get_running_loop(), {})
+        task = tasks.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(func(*args))
+        tasks[key] = task
+        task.add_done_callback(lambda _: tasks.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def in_flight(self):
+        return sum(len(tasks) for tasks in list(self._loops.values()))
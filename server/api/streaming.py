@@ -0,0 +1,122 @@
+"""
+Server-sent-event streaming of model responses
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from .concurrency import get_provider_timeout, submit
+
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _finished(label, parts, started):
+    """Result dict for a completed stream, shaped like Provider.complete's"""
+    return {
+        'model': label,
+        'response': ''.join(parts),
+        'timestamp': datetime.now().isoformat(),
+        'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def _failed(label, error, started):
+    return {
+        'model': label,
+        'error': error,
+        'response': f'Failed to get response from {label}',
+        'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def merge_streams(streams):
+    """
+    Interleave several provider token streams in arrival order.
+
+    streams maps a name to a (label, generator_func, *args) tuple. Yields
+    (name, 'token', text) as chunks arrive, then (name, 'done', result) or
+    (name, 'error', result) once per provider. Each stream runs on the shared
+    provider pool and is abandoned once it misses its timeout.
+    """
+    events = queue.Queue()
+    stop = threading.Event()
+    started = time.perf_counter()
+
+    def produce(name, label, func, *args):
+        parts = []
+        try:
+            for text in func(*args):
+                if stop.is_set():
+                    return
+                parts.append(text)
+                events.put((name, 'token', text))
+            events.put((name, 'done', _finished(label, parts, started)))
+        except Exception as e:
+            print(f'{label} stream error: {str(e)}')
+            events.put((name, 'error', _failed(label, str(e), started)))
+
+    for name, call in streams.items():
+        submit(produce, name, *call)
+
+    pending = set(streams)
+    try:
+        while pending:
+            deadline = max(get_provider_timeout(name) for name in pending)
+            try:
+                name, kind, payload = events.get(timeout=max(deadline - (time.perf_counter() - started), 0))
+            except queue.Empty:
+                for name in pending:
+                    label = streams[name][0]
+                    timeout = get_provider_timeout(name)
+                    yield name, 'error', _failed(label, f'{label} timed out after {timeout}s', started)
+                return
+            if kind != 'token':
+                pending.discard(name)
+            yield name, kind, payload
+    finally:
+        # stop producers early if the client disconnected or a stream timed out
+        stop.set()
+
+
+async def amerge_streams(streams):
+    """Async counterpart of merge_streams; streams map names to async generator funcs"""
+    events = asyncio.Queue()
+    started = time.perf_counter()
+
+    async def produce(name, label, func, *args):
+        parts = []
+        try:
+            async for text in func(*args):
+                parts.append(text)
+                await events.put((name, 'token', text))
+            await events.put((name, 'done', _finished(label, parts, started)))
+        except Exception as e:
+            print(f'{label} stream error: {str(e)}')
+            await events.put((name, 'error', _failed(label, str(e), started)))
+
+    tasks = [asyncio.create_task(produce(name, *call)) for name, call in streams.items()]
+    pending = set(streams)
+    try:
+        while pending:
+            deadline = max(get_provider_timeout(name) for name in pending)
+            try:
+                name, kind, payload = await asyncio.wait_for(
+                    events.get(), max(deadline - (time.perf_counter() - started), 0)
+                )
+            except asyncio.TimeoutError:
+                for name in pending:
+                    label = streams[name][0]
+                    timeout = get_provider_timeout(name)
+                    yield name, 'error', _failed(label, f'{label} timed out after {timeout}s', started)
+                return
+            if kind != 'token':
+                pending.discard(name)
+            yield name, kind, payload
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,34 @@
+import json
+from django.test import SimpleTestCase, override_settings
+from api.batch import InvalidBatch, parse_prompts, read_jsonl
+
+
+class ParsePromptsTests(SimpleTestCase):
+
+    def test_valid(self):
+        self.assertEqual(parse_prompts(['a', 'b']), ['a', 'b'])
+
+    def test_invalid(self):
+        for prompts in ([], 'a', ['a', ''], ['a', 3], None):
+            with self.subTest(prompts=prompts), self.assertRaises(InvalidBatch):
+                parse_prompts(prompts)
+
+    @override_settings(BATCH_MAX_PROMPTS=2)
+    def test_too_many(self):
+        with self.assertRaises(InvalidBatch):
+            parse_prompts(['a', 'b', 'c'])
+
+
+class ReadJsonlTests(SimpleTestCase):
+
+    def test_strings_and_objects(self):
+        lines = [json.dumps('first'), '', json.dumps({'prompt': 'second'}).encode('utf-8')]
+        self.assertEqual(read_jsonl(lines), ['first', 'second'])
+
+    def test_reports_the_bad_line(self):
+        with self.assertRaisesMessage(InvalidBatch, 'Line 2'):
+            read_jsonl([json.dumps('first'), '{not json'])
+
+    def test_object_without_prompt(self):
+        with self.assertRaises(InvalidBatch):
+            read_jsonl([json.dumps({'text': 'first'})])
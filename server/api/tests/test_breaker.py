@@ -0,0 +1,57 @@
+import threading
+from django.test import SimpleTestCase, override_settings
+from api.breaker import CircuitBreaker, CircuitOpen
+
+
+@override_settings(BREAKER_ENABLED=True)
+class CircuitBreakerTests(SimpleTestCase):
+
+    def breaker(self, probe=lambda: None, open_seconds=60):
+        return CircuitBreaker(
+            'test', probe, window=4, min_calls=4, failure_rate=0.5, open_seconds=open_seconds, max_open_seconds=60,
+        )
+
+    def test_stays_closed_below_min_calls(self):
+        breaker = self.breaker()
+        for _ in range(3):
+            breaker.record_failure()
+        breaker.check()
+        self.assertEqual(breaker.stats()['state'], 'closed')
+
+    def test_stays_closed_below_failure_rate(self):
+        breaker = self.breaker()
+        for _ in range(3):
+            breaker.record_success()
+        breaker.record_failure()
+        breaker.check()
+        self.assertFalse(breaker.is_open)
+
+    def test_opens_and_rejects(self):
+        breaker = self.breaker()
+        breaker.record_success()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(CircuitOpen):
+            breaker.check()
+        stats = breaker.stats()
+        self.assertEqual((stats['state'], stats['opened'], stats['rejected']), ('open', 1, 1))
+
+    def test_successful_probe_closes(self):
+        probed = threading.Event()
+        breaker = self.breaker(probe=probed.set, open_seconds=0.01)
+        for _ in range(4):
+            breaker.record_failure()
+        self.assertTrue(probed.wait(5))
+        breaker._prober.join(5)
+        self.assertFalse(breaker.is_open)
+        breaker.check()
+        self.assertEqual(breaker.stats()['failure_rate'], 0.0)
+
+    @override_settings(BREAKER_ENABLED=False)
+    def test_disabled(self):
+        breaker = self.breaker()
+        for _ in range(4):
+            breaker.record_failure()
+        self.assertFalse(breaker.is_open)
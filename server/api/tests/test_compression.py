@@ -0,0 +1,54 @@
+from django.test import TestCase, override_settings
+from api.compression import CODECS, PLAIN, ZLIB, compress, decompress, stored_format, train_dictionary
+from api.fields import stored_bytes
+from api.models import CompressionDictionary, ModelResponse, QueryHistory, User
+
+TEXT = 'Quantum computers use qubits, which can be in a superposition of states. ' * 20
+
+
+@override_settings(HISTORY_COMPRESSION_MIN_SIZE=64, HISTORY_COMPRESSION_DICTIONARY=True)
+class CompressionTests(TestCase):
+
+    def test_round_trip(self):
+        for codec in ('none', 'zlib'):
+            with self.subTest(codec=codec):
+                self.assertEqual(decompress(compress(TEXT, codec, dictionary_id=0)), TEXT)
+
+    def test_short_text_is_stored_plain(self):
+        self.assertEqual(stored_format(compress('short', 'zlib', dictionary_id=0)), (PLAIN, 0))
+
+    def test_compressed_text_is_smaller(self):
+        stored = compress(TEXT, 'zlib', dictionary_id=0)
+        self.assertEqual(stored_format(stored), (ZLIB, 0))
+        self.assertLess(len(stored), len(TEXT) // 3)
+
+    def test_max_chars_stops_early(self):
+        stored = compress('é' * 500, 'zlib', dictionary_id=0)
+        self.assertEqual(decompress(stored, max_chars=10), 'é' * 10)
+
+    def test_dictionary_round_trip(self):
+        data = train_dictionary([TEXT] * 5, 'zlib', 4096)
+        dictionary = CompressionDictionary.objects.create(codec='zlib', data=data, samples=5)
+        stored = compress(TEXT, 'zlib', dictionary_id=dictionary.id)
+        self.assertEqual(stored_format(stored), (CODECS['zlib'], dictionary.id))
+        self.assertEqual(decompress(stored), TEXT)
+
+
+class CompressedTextFieldTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('user@example.com', 'password')
+        self.query = QueryHistory.objects.create(user=user, prompt='Explain qubits', mode='both')
+        ModelResponse.objects.create(query=self.query, provider='groq', response=TEXT)
+
+    def test_model_access(self):
+        self.assertEqual(ModelResponse.objects.get().response, TEXT)
+        self.assertEqual(QueryHistory.objects.get().prompt, 'Explain qubits')
+
+    def test_values_are_decompressed(self):
+        self.assertEqual(ModelResponse.objects.values_list('response', flat=True).get(), TEXT)
+        self.assertEqual(QueryHistory.objects.values('prompt').get(), {'prompt': 'Explain qubits'})
+
+    def test_stored_bytes(self):
+        stored = ModelResponse.objects.values_list(stored_bytes('response'), flat=True).get()
+        self.assertEqual(decompress(stored), TEXT)
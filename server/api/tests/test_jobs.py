@@ -0,0 +1,48 @@
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api.jobs import _JobEventState, _job_snapshot, claim_next, enqueue_comparison, purge_finished_jobs
+from api.models import ComparisonJob
+from api.providers import get_provider
+
+
+@override_settings(JOB_WEB_WORKERS=0, JOB_STALE_SECONDS=60)
+class JobQueueTests(TestCase):
+
+    def enqueue(self, prompt='Explain qubits'):
+        return enqueue_comparison(None, prompt, [get_provider('groq'), get_provider('gemini')], 'pairwise')
+
+    def test_claims_oldest_first_once(self):
+        first, second = self.enqueue('first'), self.enqueue('second')
+        claimed = claim_next('worker-1')
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts), (first.id, ComparisonJob.RUNNING, 1))
+        self.assertEqual(claimed.locked_by, 'worker-1')
+        self.assertEqual(claim_next('worker-2').id, second.id)
+        self.assertIsNone(claim_next('worker-3'))
+
+    def test_reclaims_a_stale_job(self):
+        job = self.enqueue()
+        claim_next('worker-1')
+        ComparisonJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=120))
+        claimed = claim_next('worker-2')
+        self.assertEqual((claimed.id, claimed.locked_by, claimed.attempts), (job.id, 'worker-2', 2))
+
+    @override_settings(JOB_RETENTION_SECONDS=60)
+    def test_purges_old_finished_jobs(self):
+        old, recent, queued = self.enqueue(), self.enqueue(), self.enqueue()
+        ComparisonJob.objects.filter(pk=old.pk).update(
+            status=ComparisonJob.DONE, finished_at=timezone.now() - timedelta(seconds=120)
+        )
+        ComparisonJob.objects.filter(pk=recent.pk).update(status=ComparisonJob.FAILED, finished_at=timezone.now())
+        self.assertEqual(purge_finished_jobs(), 1)
+        self.assertCountEqual(ComparisonJob.objects.values_list('pk', flat=True), [recent.pk, queued.pk])
+
+    def test_events(self):
+        job = self.enqueue()
+        state = _JobEventState()
+        self.assertIn('event: status', state.events(_job_snapshot(job.id))[0])
+        self.assertEqual(state.events(_job_snapshot(job.id)), [])
+        ComparisonJob.objects.filter(pk=job.pk).update(status=ComparisonJob.DONE, result={'prompt': 'Explain qubits'})
+        events = state.events(_job_snapshot(job.id))
+        self.assertEqual([event.split('\n')[0] for event in events], ['event: status', 'event: result', 'event: end'])
+        self.assertTrue(state.finished)
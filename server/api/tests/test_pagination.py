@@ -0,0 +1,53 @@
+from datetime import timedelta
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from api.models import QueryHistory, User
+from api.pagination import (
+    InvalidCursor, decode_cursor, decode_offset_cursor, encode_cursor, encode_offset_cursor, keyset_page,
+)
+
+
+class CursorTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        created_at = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+        self.assertEqual(decode_offset_cursor(encode_offset_cursor(30)), 30)
+
+    def test_invalid(self):
+        for cursor in ('garbage', encode_offset_cursor(5)):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+        with self.assertRaises(InvalidCursor):
+            decode_offset_cursor(encode_cursor(timezone.now(), 1))
+
+
+class KeysetPageTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('user@example.com', 'password')
+        QueryHistory.objects.bulk_create([
+            QueryHistory(user=user, prompt=f'prompt {i}', mode='both') for i in range(7)
+        ])
+        # two rows share a timestamp, so the id has to break the tie
+        now = timezone.now()
+        for i, query in enumerate(QueryHistory.objects.order_by('id')):
+            query.created_at = now + timedelta(seconds=min(i, 5))
+            query.save(update_fields=['created_at'])
+        self.queryset = QueryHistory.objects.filter(user=user)
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = keyset_page(self.queryset, cursor, 3)
+            seen.extend(row.id for row in rows)
+            if cursor is None:
+                break
+        expected = list(self.queryset.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_last_page_has_no_cursor(self):
+        rows, cursor = keyset_page(self.queryset, None, 7)
+        self.assertEqual(len(rows), 7)
+        self.assertIsNone(cursor)
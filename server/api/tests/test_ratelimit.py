@@ -0,0 +1,84 @@
+import asyncio
+import tempfile
+import time
+from django.test import SimpleTestCase
+from api.ratelimit import ProviderLimiter, RateLimited, parse_retry_after
+
+
+class ProviderLimiterTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def limiter(self, rpm=60, burst=2, concurrency=2, max_wait=0.5):
+        return ProviderLimiter('test', rpm, burst, concurrency, self.directory, max_wait)
+
+    def test_burst_then_rejects(self):
+        limiter = self.limiter(rpm=1)
+        for _ in range(2):
+            with limiter.limit():
+                pass
+        with self.assertRaises(RateLimited):
+            with limiter.limit():
+                pass
+        stats = limiter.stats()
+        self.assertEqual((stats['admitted'], stats['rejected']), (2, 1))
+
+    def test_waits_for_a_token(self):
+        limiter = self.limiter(rpm=600, burst=1)
+        with limiter.limit():
+            pass
+        started = time.monotonic()
+        with limiter.limit():
+            pass
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+    def test_deadline_cuts_the_wait(self):
+        limiter = self.limiter(rpm=1, burst=1, max_wait=30)
+        with limiter.limit():
+            pass
+        started = time.monotonic()
+        with self.assertRaises(RateLimited):
+            with limiter.limit(deadline=time.monotonic() + 0.1):
+                pass
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_concurrency_cap(self):
+        limiter = self.limiter(rpm=0, concurrency=1, max_wait=0.1)
+        with limiter.limit():
+            with self.assertRaises(RateLimited):
+                with limiter.limit():
+                    pass
+        with limiter.limit():
+            pass
+
+    def test_penalize_blocks_and_halves_the_rate(self):
+        limiter = self.limiter(rpm=60, burst=5, max_wait=0.1)
+        limiter.penalize(10)
+        with self.assertRaises(RateLimited):
+            with limiter.limit():
+                pass
+        stats = limiter.stats()
+        self.assertEqual((stats['throttled'], stats['rate_scale']), (1, 0.5))
+
+    def test_async(self):
+        limiter = self.limiter(rpm=1, burst=1, max_wait=0.1)
+
+        async def run():
+            async with limiter.alimit():
+                pass
+            await limiter.apenalize(10)
+            with self.assertRaises(RateLimited):
+                async with limiter.alimit():
+                    pass
+
+        asyncio.run(run())
+        stats = limiter.stats()
+        self.assertEqual((stats['admitted'], stats['throttled'], stats['rejected']), (1, 1, 1))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('2.5'), 2.5)
+        self.assertEqual(parse_retry_after('-1'), 0.0)
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
@@ -0,0 +1,61 @@
+import json
+from django.test import SimpleTestCase
+from api.rubric import (
+    CRITERIA, RubricParseError, extract_json, merge_scores, parse_rubric_text, repair_json, validate_scores,
+)
+
+
+def scores(value, **extra):
+    return {**dict.fromkeys(CRITERIA, value), **extra}
+
+
+class RepairJsonTests(SimpleTestCase):
+
+    def assertRepairs(self, text, expected):
+        self.assertEqual(json.loads(repair_json(text)), expected)
+
+    def test_valid_json_is_unchanged(self):
+        self.assertRepairs('{"a": [1, 2], "b": "x"}', {'a': [1, 2], 'b': 'x'})
+
+    def test_trailing_commas_and_comments(self):
+        self.assertRepairs('{"a": 1, // first\n "b": [1, 2,], /* done */}', {'a': 1, 'b': [1, 2]})
+
+    def test_smart_quotes_and_raw_newlines(self):
+        self.assertRepairs('{“a”: "line one\nline two"}', {'a': 'line one\nline two'})
+
+    def test_text_after_the_object(self):
+        self.assertRepairs('{"a": 1} I hope this helps!', {'a': 1})
+
+    def test_truncated_reply(self):
+        self.assertRepairs('{"a": {"b": [1, 2', {'a': {'b': [1, 2]}})
+        self.assertRepairs('{"a": "unfinished', {'a': 'unfinished'})
+        self.assertRepairs('{"a": 1, "b"', {'a': 1, 'b': None})
+
+
+class ParseRubricTests(SimpleTestCase):
+
+    def test_extract_json_from_code_fence(self):
+        self.assertEqual(extract_json('Here you go:\n```json\n{"a": 1}\n```'), '{"a": 1}')
+        with self.assertRaises(RubricParseError):
+            extract_json('no json here')
+
+    def test_scores_are_clamped_and_totalled(self):
+        result = validate_scores({**scores(8), 'accuracy': '9/10', 'clarity': 14, 'total': 3})
+        self.assertEqual((result['accuracy'], result['clarity'], result['total']), (9, 10, 43))
+        with self.assertRaises(RubricParseError):
+            validate_scores(scores(None))
+
+    def test_parse_repairs_truncated_rubric(self):
+        text = json.dumps({'response_a': scores(7), 'response_b': scores(8), 'overall_comparison': 'B'})
+        rubric = parse_rubric_text(text[:-1])
+        self.assertEqual((rubric['response_a']['total'], rubric['response_b']['total']), (35, 40))
+        self.assertEqual(rubric['recommendation'], '')
+
+    def test_merge_scores(self):
+        a = {'success': True, 'scores': validate_scores(scores(6)), 'evaluator': 'Gemini Flash'}
+        b = {'success': True, 'scores': validate_scores(scores(9)), 'evaluator': 'Gemini Flash'}
+        merged = merge_scores(a, b, 'Groq', 'Gemini')
+        self.assertTrue(merged['rubric']['recommendation'].startswith('Response B (Gemini)'))
+        self.assertEqual(merged['evaluator'], 'Gemini Flash')
+        failed = {'success': False, 'error': 'timed out'}
+        self.assertIs(merge_scores(a, failed, 'Groq', 'Gemini'), failed)
@@ -0,0 +1,46 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from api.models import QueryHistory, User
+from api.search import get_backend, index_entries, search_page, search_terms
+
+
+class SearchTermsTests(SimpleTestCase):
+
+    def test_words_are_lowercased_and_stripped(self):
+        self.assertEqual(search_terms('Quantum, "computing"!'), ['quantum', 'computing'])
+        self.assertEqual(search_terms('  ?! '), [])
+
+
+class SearchPageTests(TestCase):
+
+    def setUp(self):
+        if get_backend(connection.vendor) is None:
+            self.skipTest(f'no search backend for {connection.vendor}')
+        self.user = User.objects.create_user('user@example.com', 'password')
+        other = User.objects.create_user('other@example.com', 'password')
+        self.queries = [
+            QueryHistory.objects.create(user=self.user, prompt=f'apple question {i}', mode='both') for i in range(9)
+        ]
+        index_entries([(query, []) for query in self.queries])
+        index_entries([(QueryHistory.objects.create(user=other, prompt='apple pie', mode='both'), [])])
+
+    def pages(self, text, limit):
+        load = QueryHistory.objects.filter(user=self.user).in_bulk
+        pages, offset = [], 0
+        while offset is not None:
+            page, offset = search_page(self.user.id, text, limit, offset, load)
+            pages.append([query.id for query, _ in page])
+        return pages
+
+    def test_pages_cover_the_users_matches(self):
+        pages = self.pages('appl', 4)
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+        self.assertCountEqual(sum(pages, []), [query.id for query in self.queries])
+
+    def test_deleted_queries_dont_shorten_pages(self):
+        QueryHistory.objects.filter(id__in=[query.id for query in self.queries[2:7]]).delete()
+        pages = self.pages('apple', 2)
+        self.assertEqual([len(page) for page in pages], [2, 2])
+
+    def test_no_match(self):
+        self.assertEqual(self.pages('banana', 5), [[]])
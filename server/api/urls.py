@@ -1,18 +1,37 @@
 """
 API URL Configuration - RESTful Design
 """
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# AI endpoints (and the long-lived result streams) are async when served through ASGI
+ai_views = async_views if settings.ASYNC_AI_VIEWS else views
 
 urlpatterns = [
     # Health check
     path('health', views.health_check, name='health'),
+    path('metrics', views.metrics_view, name='metrics'),  # GET - Prometheus text format
     
     # AI endpoints - Resource-based
-    path('ai/groq', views.groq_view, name='groq'),
-    path('ai/gemini', views.gemini_view, name='gemini'),
-    path('ai/compare', views.compare_view, name='compare'),
-    path('ai/compare-with-rubric', views.compare_with_rubric_view, name='compare_with_rubric'),
+    path('ai/groq', ai_views.groq_view, name='groq'),
+    path('ai/gemini', ai_views.gemini_view, name='gemini'),
+    path('ai/providers', views.providers_view, name='providers'),
+    path('ai/providers/<str:name>', ai_views.provider_view, name='provider'),
+    path('ai/compare', ai_views.compare_view, name='compare'),
+    path('ai/compare-with-rubric', ai_views.compare_with_rubric_view, name='compare_with_rubric'),
+    path('ai/compare/stream', ai_views.compare_stream_view, name='compare_stream'),
+    path('ai/compare-with-rubric/stream', ai_views.compare_with_rubric_stream_view, name='compare_with_rubric_stream'),
+    path('ai/jobs/<uuid:job_id>', views.comparison_job_view, name='comparison_job'),  # GET - Poll a background comparison
+    path('ai/jobs/<uuid:job_id>/events', ai_views.comparison_job_events_view, name='comparison_job_events'),  # GET - SSE
+    path('ai/batch', views.batch_view, name='batch'),  # GET - List jobs, POST - Start a job
+    path('ai/batch/<int:job_id>', views.batch_detail_view, name='batch_detail'),
+    path('ai/batch/<int:job_id>/results', ai_views.batch_results_view, name='batch_results'),  # GET - JSONL
+    path('ai/batch/<int:job_id>/resume', views.batch_resume_view, name='batch_resume'),
+    path('ai/batch/<int:job_id>/cancel', views.batch_cancel_view, name='batch_cancel'),
+
+    # Usage stats
+    path('stats/providers', views.provider_stats_view, name='provider_stats'),  # GET - Latency/tokens per provider
     
     # Authentication endpoints
     path('auth/register', views.register_view, name='register'),
@@ -21,6 +40,9 @@ urlpatterns = [
     
     # User resources - RESTful endpoints
     path('users/queries', views.history_view, name='user_queries'),  # GET - List user's queries
+    path('users/queries/search', views.history_search_view, name='user_query_search'),  # GET - Ranked full-text search
+    path('users/queries/<int:query_id>', views.history_detail_view, name='user_query_detail'),  # GET - One query with full responses
+    path('users/stats', views.user_stats_view, name='user_stats'),  # GET - Latency/tokens of the user's responses
     path('users/profile', views.profile_view, name='user_profile'),  # GET/PUT/DELETE - CRUD on profile
 ]
 
@@ -0,0 +1,161 @@
+"""
+Per-call accounting of provider latency, tokens, cache hits and errors
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Aggregate, Avg, Count, FloatField, Q, Sum
+from django.utils import timezone
+from .history import arecord_rows, record_rows
+from .metrics import observe_provider_call
+from .models import ProviderCall
+
+PERCENTILES = (50, 95, 99)
+
+
+def _call_row(provider, purpose, latency, usage=None, cached=False, error=None):
+    usage = usage or {}
+    return ProviderCall(
+        provider=provider.name,
+        model=provider.model,
+        purpose=purpose,
+        latency_ms=round(latency * 1000, 1),
+        prompt_tokens=usage.get('prompt_tokens'),
+        completion_tokens=usage.get('completion_tokens'),
+        cached=cached,
+        error=(str(error) or type(error).__name__) if error is not None else '',
+        created_at=timezone.now(),
+    )
+
+
+def record_call(provider, purpose, latency, usage=None, cached=False, error=None):
+    """Record one provider call (latency in seconds) in the metrics and through the history write-behind queue"""
+    observe_provider_call(provider, purpose, latency, usage, cached, error)
+    if not settings.USAGE_TRACKING_ENABLED:
+        return
+    try:
+        record_rows([_call_row(provider, purpose, latency, usage, cached, error)])
+    except Exception as e:
+        # accounting must never fail the call it describes
+        print(f'Usage tracking error: {str(e)}')
+
+
+async def arecord_call(provider, purpose, latency, usage=None, cached=False, error=None):
+    observe_provider_call(provider, purpose, latency, usage, cached, error)
+    if not settings.USAGE_TRACKING_ENABLED:
+        return
+    try:
+        await arecord_rows([_call_row(provider, purpose, latency, usage, cached, error)])
+    except Exception as e:
+        print(f'Usage tracking error: {str(e)}')
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(1, -(-p * len(values) // 100))
+    return values[int(rank) - 1]
+
+
+class Percentile(Aggregate):
+    """PostgreSQL's percentile_cont ordered-set aggregate (p from 0 to 100)"""
+
+    function = 'percentile_cont'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+    def __init__(self, expression, p, **extra):
+        super().__init__(expression, fraction=p / 100, output_field=FloatField(), **extra)
+
+
+def _rounded(value):
+    return round(value, 1) if value is not None else None
+
+
+def _aggregates(upstream, failed, exact_percentiles):
+    aggregates = {
+        'calls': Count('pk'),
+        'errors': Count('pk', filter=failed),
+        'cache_hits': Count('pk', filter=Q(cached=True) & ~failed),
+        'latency_mean': Avg('latency_ms', filter=upstream),
+        'prompt_total': Sum('prompt_tokens', filter=upstream),
+        'completion_total': Sum('completion_tokens', filter=upstream),
+        'prompt_mean': Avg('prompt_tokens', filter=upstream),
+        'completion_mean': Avg('completion_tokens', filter=upstream),
+    }
+    if exact_percentiles:
+        for p in PERCENTILES:
+            aggregates[f'p{p}'] = Percentile('latency_ms', p, filter=upstream)
+    return aggregates
+
+
+def _sampled_percentiles(calls, upstream):
+    """Latency percentiles of the STATS_SAMPLE_SIZE most recent upstream calls"""
+    latencies = sorted(calls.filter(upstream, latency_ms__isnull=False).order_by('-pk').values_list(
+        'latency_ms', flat=True
+    )[:settings.STATS_SAMPLE_SIZE])
+    return {f'p{p}': percentile(latencies, p) for p in PERCENTILES}
+
+
+def _summary(totals, percentiles):
+    calls = totals['calls']
+    latency = {f'p{p}': _rounded(percentiles[f'p{p}']) for p in PERCENTILES}
+    latency['mean'] = _rounded(totals['latency_mean'])
+    return {
+        'calls': calls,
+        'errors': totals['errors'],
+        'error_rate': round(totals['errors'] / calls, 3) if calls else 0.0,
+        'cache_hits': totals['cache_hits'],
+        'cache_hit_rate': round(totals['cache_hits'] / calls, 3) if calls else 0.0,
+        'latency_ms': latency,
+        'tokens': {
+            'prompt': totals['prompt_total'] or 0,
+            'completion': totals['completion_total'] or 0,
+            'mean_prompt': _rounded(totals['prompt_mean']),
+            'mean_completion': _rounded(totals['completion_mean']),
+        },
+    }
+
+
+def summarize(calls):
+    """
+    Stats per provider and overall of a queryset with provider, latency_ms,
+    prompt_tokens, completion_tokens, cached and error fields, aggregated in the
+    database. Latency percentiles are exact on PostgreSQL and taken from the
+    STATS_SAMPLE_SIZE most recent calls elsewhere.
+    """
+    calls = calls.order_by()
+    failed = ~Q(error='')
+    # cache hits would drag latency down and carry no tokens, so only real calls count
+    upstream = Q(cached=False, error='')
+    exact = connection.vendor == 'postgresql'
+    aggregates = _aggregates(upstream, failed, exact)
+
+    providers = {}
+    for totals in calls.values('provider').annotate(**aggregates).order_by('provider'):
+        provider_calls = calls.filter(provider=totals['provider'])
+        providers[totals['provider']] = _summary(totals, totals if exact else _sampled_percentiles(provider_calls, upstream))
+    totals = calls.aggregate(**aggregates)
+    return {
+        'providers': providers,
+        'overall': _summary(totals, totals if exact else _sampled_percentiles(calls, upstream)),
+    }
+
+
+def provider_stats(since, purpose=None):
+    """Stats over the ProviderCall rows recorded since a datetime"""
+    calls = ProviderCall.objects.filter(created_at__gte=since)
+    if purpose:
+        calls = calls.filter(purpose=purpose)
+    return summarize(calls)
+
+
+def prune_calls(before, batch_size=5000):
+    """Delete ProviderCall rows recorded before a datetime, in batches; returns how many were deleted"""
+    deleted = 0
+    while True:
+        ids = list(ProviderCall.objects.filter(created_at__lt=before).order_by().values_list('pk', flat=True)[
+            :batch_size
+        ])
+        if not ids:
+            return deleted
+        deleted += ProviderCall.objects.filter(pk__in=ids).delete()[0]
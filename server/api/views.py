@@ -2,107 +2,81 @@
 API Views for AI Comparator
 """
 import json
-from datetime import datetime
-from django.http import JsonResponse
+from datetime import datetime, timedelta
+from functools import partial
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import RefreshToken
-from groq import Groq
-import google.generativeai as genai
-from .models import QueryHistory
+from django.db.models import CharField, Value
+from .auth import get_authenticated_user, issue_tokens
+from .batch import (
+    cancel_job, create_job, is_active, job_to_dict, parse_prompts, read_jsonl, start_job, stream_results
+)
+from .cache import cache_stats, should_use_cache
+from .concurrency import fan_out, hedge_stats, submit_pipeline
+from .history import history_writer_stats, record_query
+from .jobs import enqueue_comparison, job_events, job_queue_stats, job_status
+from .metrics import registry as metrics_registry
+from .models import BatchJob, ComparisonJob, ModelResponse, QueryHistory
+from .pagination import InvalidCursor, decode_offset_cursor, encode_offset_cursor, keyset_page
+from .passwords import HashingBusy, check_user_password, hash_password
+from .providers import UnknownProvider, available_providers, comparison_mode, get_provider, resolve_providers
+from .rubric import (
+    get_ai_comparison_rubric, get_rubric_mode, merge_scores, rubric_comparison, rubric_stats, score_response,
+    wait_for_score,
+)
+from .search import SearchUnavailable, search_page, search_terms
+from .streaming import merge_streams, sse_event
+from .usage import provider_stats, summarize
 
 User = get_user_model()
 
 
-def get_authenticated_user(request):
-    """Helper function to get authenticated user from JWT token"""
-    try:
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return None
-        
-        token = auth_header.split(' ')[1]
-        from rest_framework_simplejwt.tokens import AccessToken
-        access_token = AccessToken(token)
-        user_id = access_token['user_id']
-        return User.objects.get(id=user_id)
-    except Exception:
-        return None
-
-
-def get_groq_response(prompt):
-    """Get response from Groq API"""
-    if not settings.GROQ_API_KEY:
-        return {
-            'model': 'Groq',
-            'response': 'API key not configured',
-            'error': 'Please configure GROQ_API_KEY in .env file'
-        }
-    
-    try:
-        client = Groq(api_key=settings.GROQ_API_KEY)
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1000,
-        )
-        return {
-            'model': 'Groq',
-            'response': completion.choices[0].message.content,
-            'timestamp': datetime.now().isoformat(),
-        }
-    except Exception as e:
-        print(f'Groq error: {str(e)}')
-        return {
-            'model': 'Groq',
-            'error': str(e),
-            'response': 'Failed to get response from Groq',
-        }
-
-
-def get_gemini_response(prompt):
-    """Get response from Gemini API"""
-    if not settings.GEMINI_API_KEY:
-        return {
-            'model': 'Gemini',
-            'response': 'API key not configured',
-            'error': 'Please configure GEMINI_API_KEY in .env file'
-        }
-    
-    try:
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-flash-latest')
-        result = model.generate_content(prompt)
-        return {
-            'model': 'Gemini',
-            'response': result.text,
-            'timestamp': datetime.now().isoformat(),
-        }
-    except Exception as e:
-        print(f'Gemini error: {str(e)}')
-        return {
-            'model': 'Gemini',
-            'error': str(e),
-            'response': 'Failed to get response from Gemini',
-        }
-
-
 # API Endpoints
 @require_http_methods(["GET"])
 def health_check(request):
     """Health check endpoint"""
     return JsonResponse({
         'status': 'ok',
-        'message': 'AI Comparator API is running'
+        'message': 'AI Comparator API is running',
+        'cache': cache_stats(),
+        'history_writer': history_writer_stats(),
+        'rate_limits': {provider.name: provider.limiter.stats() for provider in available_providers()},
+        'circuits': {provider.name: provider.breaker.stats() for provider in available_providers()},
+        'hedging': hedge_stats(),
+        'rubric_parsing': rubric_stats(),
+        'jobs': job_queue_stats(),
     })
 
-# for testing purposes and separate endpoints for each model
-@csrf_exempt
-@require_http_methods(["POST"])
-def groq_view(request):
-    """Groq endpoint"""
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """Metrics of every worker process on this host in the Prometheus text format"""
+    if not settings.METRICS_ENABLED:
+        return JsonResponse({'error': 'Metrics are disabled'}, status=404)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_http_methods(["GET"])
+def providers_view(request):
+    """List the registered AI providers and the default comparison set"""
+    return JsonResponse({
+        'providers': [{
+            'name': provider.name,
+            'label': provider.label,
+            'model': provider.model,
+            'configured': provider.configured,
+        } for provider in available_providers()],
+        'default': settings.COMPARE_PROVIDERS,
+    })
+
+
+def single_model_response(request, name):
+    """Shared body of the single-provider endpoints"""
+    provider = get_provider(name)
     try:
         data = json.loads(request.body)
         prompt = data.get('prompt')
@@ -110,16 +84,16 @@ def groq_view(request):
         if not prompt:
             return JsonResponse({'error': 'Prompt is required'}, status=400)
         
-        result = get_groq_response(prompt)
+        result = provider.respond(prompt, use_cache=should_use_cache(request, data))
         
         # Save to history if user is authenticated
         user = get_authenticated_user(request)
-        if user and not result.get('error'):
-            QueryHistory.objects.create(
-                user=user,
+        if user is not None and not result.get('error'):
+            record_query(
+                user_id=user.id,
                 prompt=prompt,
-                response_groq=result.get('response'),
-                mode='groq'
+                mode=name,
+                responses={name: result}
             )
         
         status = 500 if result.get('error') else 200
@@ -127,70 +101,72 @@ def groq_view(request):
         
     except Exception as e:
         return JsonResponse({
-            'error': 'Failed to get response from Groq',
+            'error': f'Failed to get response from {provider.label}',
             'details': str(e)
         }, status=500)
 
 
+# for testing purposes and separate endpoints for each model
+@csrf_exempt
+@require_http_methods(["POST"])
+def groq_view(request):
+    """Groq endpoint"""
+    return single_model_response(request, 'groq')
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def gemini_view(request):
     """Gemini endpoint"""
+    return single_model_response(request, 'gemini')
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def provider_view(request, name):
+    """Single-model endpoint for any registered provider"""
     try:
-        data = json.loads(request.body)
-        prompt = data.get('prompt')
-        
-        if not prompt:
-            return JsonResponse({'error': 'Prompt is required'}, status=400)
-        
-        result = get_gemini_response(prompt)
-        
-        # Save to history if user is authenticated
-        user = get_authenticated_user(request)
-        if user and not result.get('error'):
-            QueryHistory.objects.create(
-                user=user,
-                prompt=prompt,
-                response_gemini=result.get('response'),
-                mode='gemini'
-            )
-        
-        status = 500 if result.get('error') else 200
-        return JsonResponse(result, status=status)
-        
-    except Exception as e:
-        return JsonResponse({
-            'error': 'Failed to get response from Gemini',
-            'details': str(e)
-        }, status=500)
+        get_provider(name)
+    except UnknownProvider as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    return single_model_response(request, name)
+
+
+def respond_all(providers, prompt, use_cache=True):
+    """Ask every provider in parallel; returns {name: result}"""
+    return fan_out({
+        provider.name: (provider.label, partial(provider.respond, use_cache=use_cache), prompt)
+        for provider in providers
+    })
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def compare_view(request):
-    """Compare endpoint - gets responses from all AIs"""
+    """Compare endpoint - gets responses from all requested AIs"""
     try:
         data = json.loads(request.body)
         prompt = data.get('prompt')
         
         if not prompt:
             return JsonResponse({'error': 'Prompt is required'}, status=400)
+
+        try:
+            providers = resolve_providers(data.get('providers'))
+        except UnknownProvider as e:
+            return JsonResponse({'error': str(e)}, status=400)
         
-        # Get responses from all models
-        results = {
-            'groq': get_groq_response(prompt),
-            'gemini': get_gemini_response(prompt),
-        }
+        # Get responses from all models concurrently
+        results = respond_all(providers, prompt, use_cache=should_use_cache(request, data))
         
         # Save to history if user is authenticated
         user = get_authenticated_user(request)
-        if user and not results['groq'].get('error') and not results['gemini'].get('error'):
-            QueryHistory.objects.create(
-                user=user,
+        if user is not None and not any(result.get('error') for result in results.values()):
+            record_query(
+                user_id=user.id,
                 prompt=prompt,
-                response_groq=results['groq'].get('response'),
-                response_gemini=results['gemini'].get('response'),
-                mode='both'
+                mode=comparison_mode(providers),
+                responses=results
             )
         
         return JsonResponse(results)
@@ -203,97 +179,29 @@ def compare_view(request):
         }, status=500)
 
 
-def get_ai_comparison_rubric(prompt, groq_response, gemini_response):
-    comparison_prompt = f"""You are an expert AI evaluator. Compare these two AI responses to the same prompt and provide a detailed evaluation.
-
-Original Prompt: {prompt}
-
-Response A (Groq/Llama 3.3): {groq_response}
-
-Response B (Gemini): {gemini_response}
-
-Please evaluate both responses using the following rubric (score each criterion from 1-10):
-
-1. **Accuracy**: How factually correct and reliable is the information?
-2. **Relevance**: How well does it address the prompt?
-3. **Clarity**: How clear and easy to understand is the response?
-4. **Completeness**: How thorough and comprehensive is the answer?
-5. **Usefulness**: How practical and helpful is the response?
-
-Provide your evaluation in the following JSON format:
-{{
-    "response_a": {{
-        "accuracy": <score>,
-        "relevance": <score>,
-        "clarity": <score>,
-        "completeness": <score>,
-        "usefulness": <score>,
-        "total": <sum of all scores>,
-        "strengths": ["strength 1", "strength 2"],
-        "weaknesses": ["weakness 1", "weakness 2"]
-    }},
-    "response_b": {{
-        "accuracy": <score>,
-        "relevance": <score>,
-        "clarity": <score>,
-        "completeness": <score>,
-        "usefulness": <score>,
-        "total": <sum of all scores>,
-        "strengths": ["strength 1", "strength 2"],
-        "weaknesses": ["weakness 1", "weakness 2"]
-    }},
-    "overall_comparison": "Brief summary of which is better and why",
-    "recommendation": "Which response would you recommend and why?"
-}}"""
+def wants_job(request, data):
+    """Whether the client asked for a background job ({"job": true} or Prefer: respond-async)"""
+    return data.get('job') is True or 'respond-async' in request.headers.get('Prefer', '')
+
+
+def job_accepted(job):
+    """202 response pointing the client at a queued job"""
+    status_url = reverse('comparison_job', args=[job.id])
+    response = JsonResponse({
+        **job_status(job),
+        'status_url': status_url,
+        'events_url': reverse('comparison_job_events', args=[job.id]),
+    }, status=202)
+    response['Location'] = status_url
+    return response
 
-    try:
-        # use Gemini for comparison and parse JSON
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-flash-latest')
-        result = model.generate_content(comparison_prompt)
-
-        response_text = result.text
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        rubric = json.loads(response_text)
-        return {
-            'success': True,
-            'rubric': rubric,
-            'evaluator': 'Gemini Flash'
-        }
-    except Exception as e:
-        print(f'Rubric generation error: {str(e)}')
-        # fallback: try with Groq
-        try:
-            client = Groq(api_key=settings.GROQ_API_KEY)
-            completion = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": comparison_prompt}],
-                max_tokens=2000,
-            )
-            response_text = completion.choices[0].message.content
-            
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-            
-            rubric = json.loads(response_text)
-            return {
-                'success': True,
-                'rubric': rubric,
-                'evaluator': 'Groq Llama 3.3'
-            }
-        except Exception as e2:
-            print(f'Fallback rubric error: {str(e2)}')
-            return {
-                'success': False,
-                'error': 'Failed to generate comparison rubric',
-                'details': str(e2)
-            }
+
+def resolve_rubric_pair(data):
+    """The two providers a rubric comparison scores (response A and response B)"""
+    providers = resolve_providers(data.get('providers', settings.COMPARE_PROVIDERS[:2]))
+    if len(providers) != 2:
+        raise UnknownProvider('Rubric comparison needs exactly two providers')
+    return providers
 
 
 @csrf_exempt
@@ -306,42 +214,45 @@ def compare_with_rubric_view(request):
         if not prompt:
             return JsonResponse({'error': 'Prompt is required'}, status=400)
         
-        # get responses from both models
-        groq_result = get_groq_response(prompt)
-        gemini_result = get_gemini_response(prompt)
-        
-        if groq_result.get('error') or gemini_result.get('error'):
+        try:
+            provider_a, provider_b = resolve_rubric_pair(data)
+            rubric_mode = get_rubric_mode(data)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        if wants_job(request, data):
+            # answer now and let a job worker run the comparison
+            user = get_authenticated_user(request)
+            job = enqueue_comparison(
+                user.id if user is not None else None, prompt, [provider_a, provider_b], rubric_mode,
+                use_cache=should_use_cache(request, data)
+            )
+            return job_accepted(job)
+
+        results, rubric_result = rubric_comparison(
+            prompt, provider_a, provider_b, rubric_mode, use_cache=should_use_cache(request, data)
+        )
+
+        if rubric_result is None:
             return JsonResponse({
                 'error': 'Failed to get responses from one or both AI models',
-                'groq': groq_result,
-                'gemini': gemini_result
+                **results
             }, status=500)
-        
-        # get AI-based comparison and rubric
-        rubric_result = get_ai_comparison_rubric(
-            prompt,
-            groq_result.get('response'),
-            gemini_result.get('response')
-        )
-        
+
         # prepare response and save to history
         response_data = {
             'prompt': prompt,
-            'responses': {
-                'groq': groq_result,
-                'gemini': gemini_result
-            },
+            'responses': results,
             'evaluation': rubric_result
         }
 
         user = get_authenticated_user(request)
-        if user and rubric_result.get('success'):
-            QueryHistory.objects.create(
-                user=user,
+        if user is not None and rubric_result.get('success'):
+            record_query(
+                user_id=user.id,
                 prompt=prompt,
-                response_groq=groq_result.get('response'),
-                response_gemini=gemini_result.get('response'),
-                mode='compare_with_rubric'
+                mode='compare_with_rubric',
+                responses=results
             )
         
         return JsonResponse(response_data)
@@ -354,8 +265,332 @@ def compare_with_rubric_view(request):
         }, status=500)
 
 
+def compare_stream_events(prompt, user, providers, rubric_mode=None):
+    """
+    Yield SSE events for a streamed comparison.
+
+    'token' events carry text as each model produces it, 'done'/'error' close each
+    model's stream, 'rubric' follows when requested and 'end' finishes the stream.
+    """
+    results = {}
+    scores = {}
+    descriptions = {provider.name: provider.description for provider in providers}
+    for name, kind, payload in merge_streams({
+        provider.name: (provider.label, provider.stream_text, prompt) for provider in providers
+    }):
+        if kind == 'token':
+            yield sse_event('token', {'provider': name, 'text': payload})
+            continue
+        results[name] = payload
+        if kind == 'done' and rubric_mode == 'pipelined':
+            # start scoring this response while the other model is still streaming
+            scores[name] = submit_pipeline(score_response, prompt, payload['response'], descriptions[name])
+        # tokens were already sent, so don't repeat the full text
+        summary = {key: value for key, value in payload.items() if key != 'response'}
+        yield sse_event(kind, {'provider': name, **summary})
+
+    if any(result.get('error') for result in results.values()):
+        yield sse_event('end', {'success': False})
+        return
+
+    rubric_result = None
+    if rubric_mode is not None:
+        provider_a, provider_b = providers
+        if rubric_mode == 'pipelined':
+            rubric_result = merge_scores(
+                wait_for_score(scores[provider_a.name]),
+                wait_for_score(scores[provider_b.name]),
+                provider_a.description,
+                provider_b.description
+            )
+        else:
+            rubric_result = get_ai_comparison_rubric(
+                prompt,
+                results[provider_a.name].get('response'),
+                results[provider_b.name].get('response'),
+                provider_a.description,
+                provider_b.description
+            )
+        yield sse_event('rubric', rubric_result)
+
+    if user is not None and (rubric_result is None or rubric_result.get('success')):
+        record_query(
+            user_id=user.id,
+            prompt=prompt,
+            mode='compare_with_rubric' if rubric_mode is not None else comparison_mode(providers),
+            responses=results
+        )
+
+    yield sse_event('end', {'success': True})
+
+
+def stream_comparison(request, with_rubric):
+    """Shared body of the streaming compare endpoints"""
+    try:
+        data = json.loads(request.body)
+        prompt = data.get('prompt')
+
+        if not prompt:
+            return JsonResponse({'error': 'Prompt is required'}, status=400)
+
+        try:
+            if with_rubric:
+                providers = resolve_rubric_pair(data)
+                rubric_mode = get_rubric_mode(data)
+            else:
+                providers = resolve_providers(data.get('providers'))
+                rubric_mode = None
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        user = get_authenticated_user(request)
+        response = StreamingHttpResponse(
+            compare_stream_events(prompt, user, providers, rubric_mode),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        print(f'Compare stream error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to stream AI responses',
+            'details': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def compare_stream_view(request):
+    """Compare endpoint streamed as server-sent events"""
+    return stream_comparison(request, with_rubric=False)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def compare_with_rubric_stream_view(request):
+    """Compare-with-rubric endpoint streamed as server-sent events"""
+    return stream_comparison(request, with_rubric=True)
+
+
+def get_comparison_job(request, job_id):
+    """The job, or the error response to return instead; a user's jobs are only visible to them"""
+    try:
+        job = ComparisonJob.objects.get(id=job_id)
+    except ComparisonJob.DoesNotExist:
+        return None, JsonResponse({'error': 'Job not found'}, status=404)
+    if job.user_id is not None:
+        user = get_authenticated_user(request)
+        if user is None or user.id != job.user_id:
+            return None, JsonResponse({'error': 'Job not found'}, status=404)
+    return job, None
+
+
+@require_http_methods(["GET"])
+def comparison_job_view(request, job_id):
+    """Status of a background comparison job, with its result once finished"""
+    try:
+        job, error = get_comparison_job(request, job_id)
+        if error:
+            return error
+        return JsonResponse(job_status(job))
+
+    except Exception as e:
+        print(f'Job error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to get job',
+            'details': str(e)
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def comparison_job_events_view(request, job_id):
+    """Subscribe to a background comparison job as server-sent events"""
+    try:
+        job, error = get_comparison_job(request, job_id)
+        if error:
+            return error
+        response = StreamingHttpResponse(job_events(job.id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        print(f'Job events error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to stream job events',
+            'details': str(e)
+        }, status=500)
+
+
+# batch comparison jobs
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def batch_view(request):
+    """
+    GET - List the user's batch jobs, newest first
+    POST - Start a batch job from a JSON body ({"prompts": [...]}) or an
+    uploaded JSONL file (multipart field "file"); "providers", "rubric_mode"
+    and "cache" work as for /ai/compare-with-rubric
+    """
+    try:
+        user = get_authenticated_user(request)
+        if user is None:
+            return JsonResponse({
+                'error': 'Authentication required'
+            }, status=401)
+
+        if request.method == 'GET':
+            jobs = BatchJob.objects.filter(user_id=user.id).defer('summary')[:settings.HISTORY_MAX_PAGE_SIZE]
+            return JsonResponse({'jobs': [{
+                'id': job.id,
+                'status': job.status,
+                'active': is_active(job),
+                'providers': job.providers,
+                'total': job.total,
+                'done': job.done,
+                'failed': job.failed,
+                'created_at': job.created_at.isoformat(),
+            } for job in jobs]})
+
+        try:
+            if 'file' in request.FILES:
+                data = request.POST.dict()
+                if data.get('providers'):
+                    data['providers'] = [name.strip() for name in data['providers'].split(',') if name.strip()]
+                if 'cache' in data:
+                    data['cache'] = data['cache'].lower() == 'true'
+                prompts = read_jsonl(request.FILES['file'])
+            else:
+                data = json.loads(request.body)
+                prompts = parse_prompts(data.get('prompts'))
+            providers = resolve_rubric_pair(data)
+            rubric_mode = get_rubric_mode(data)
+        except (UnicodeDecodeError, ValueError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        job = create_job(user.id, prompts, providers, rubric_mode, use_cache=should_use_cache(request, data))
+        start_job(job.id)
+        job.refresh_from_db()
+        return JsonResponse({'job': job_to_dict(job)}, status=201)
+
+    except Exception as e:
+        print(f'Batch error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to start batch job',
+            'details': str(e)
+        }, status=500)
+
+
+def get_user_job(request, job_id):
+    """The requesting user's job, or the error response to return instead"""
+    user = get_authenticated_user(request)
+    if user is None:
+        return None, JsonResponse({'error': 'Authentication required'}, status=401)
+    try:
+        return BatchJob.objects.get(id=job_id, user_id=user.id), None
+    except BatchJob.DoesNotExist:
+        return None, JsonResponse({'error': 'Batch job not found'}, status=404)
+
+
+@require_http_methods(["GET"])
+def batch_detail_view(request, job_id):
+    """Progress of a batch job and its aggregate rubric scores per model"""
+    try:
+        job, error = get_user_job(request, job_id)
+        if error:
+            return error
+        return JsonResponse({'job': job_to_dict(job)})
+
+    except Exception as e:
+        print(f'Batch detail error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to get batch job',
+            'details': str(e)
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def batch_results_view(request, job_id):
+    """
+    Stream a batch job's finished prompts as JSONL, in the order they finished
+
+    Query params: follow=true keeps the stream open until the job stops running.
+    """
+    try:
+        job, error = get_user_job(request, job_id)
+        if error:
+            return error
+        follow = request.GET.get('follow', '').lower() == 'true'
+        response = StreamingHttpResponse(stream_results(job.id, follow), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        print(f'Batch results error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to get batch results',
+            'details': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def batch_resume_view(request, job_id):
+    """Resume a batch job that was interrupted (e.g. by a server restart)"""
+    try:
+        job, error = get_user_job(request, job_id)
+        if error:
+            return error
+        if not start_job(job.id):
+            return JsonResponse({
+                'error': 'Batch job is already running or has finished'
+            }, status=409)
+        job.refresh_from_db()
+        return JsonResponse({'job': job_to_dict(job)})
+
+    except Exception as e:
+        print(f'Batch resume error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to resume batch job',
+            'details': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def batch_cancel_view(request, job_id):
+    """Cancel a batch job; prompts that already finished keep their results"""
+    try:
+        job, error = get_user_job(request, job_id)
+        if error:
+            return error
+        if not cancel_job(job):
+            return JsonResponse({
+                'error': 'Batch job has already finished'
+            }, status=409)
+        job.refresh_from_db()
+        return JsonResponse({'job': job_to_dict(job)})
+
+    except Exception as e:
+        print(f'Batch cancel error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to cancel batch job',
+            'details': str(e)
+        }, status=500)
+
 
 # auth endpoints
+def password_busy_response():
+    response = JsonResponse({
+        'error': 'Too many logins in progress, please retry shortly'
+    }, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def register_view(request):
@@ -383,12 +618,15 @@ def register_view(request):
             }, status=400)
         
         # create user, jtw token, and return
-        user = User.objects.create_user(
-            email=email,
-            password=password,
+        try:
+            password_hash = hash_password(password)
+        except HashingBusy:
+            return password_busy_response()
+        user = User.objects.create(
+            email=User.objects.normalize_email(email),
+            password=password_hash,
             username=username
         )
-        refresh = RefreshToken.for_user(user)
         
         return JsonResponse({
             'message': 'User registered successfully',
@@ -397,10 +635,7 @@ def register_view(request):
                 'email': user.email,
                 'username': user.username,
             },
-            'tokens': {
-                'access': str(refresh.access_token),
-                'refresh': str(refresh),
-            }
+            'tokens': issue_tokens(user)
         }, status=201)
         
     except Exception as e:
@@ -434,15 +669,16 @@ def login_view(request):
                 'error': 'Invalid email or password'
             }, status=401)
         
-        # Check password
-        if not user.check_password(password):
+        # Check password (a hash with outdated settings is upgraded)
+        try:
+            valid = check_user_password(user, password)
+        except HashingBusy:
+            return password_busy_response()
+        if not valid:
             return JsonResponse({
                 'error': 'Invalid email or password'
             }, status=401)
         
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
-        
         return JsonResponse({
             'message': 'Login successful',
             'user': {
@@ -450,10 +686,7 @@ def login_view(request):
                 'email': user.email,
                 'username': user.username,
             },
-            'tokens': {
-                'access': str(refresh.access_token),
-                'refresh': str(refresh),
-            }
+            'tokens': issue_tokens(user)
         })
         
     except Exception as e:
@@ -469,7 +702,7 @@ def get_user_view(request):
     """Get current user info (requires JWT authentication)"""
     try:
         user = get_authenticated_user(request)
-        if not user:
+        if user is None:
             return JsonResponse({
                 'error': 'Authentication required'
             }, status=401)
@@ -489,31 +722,56 @@ def get_user_view(request):
         }, status=401)
 
 
+def history_list_queryset(user_id):
+    """A user's queries with what the history list shows of them"""
+    # the preview is stored with the query, so the list never reads a response
+    return QueryHistory.objects.filter(user_id=user_id).only('id', 'prompt', 'mode', 'preview', 'created_at')
+
+
+def history_list_item(q):
+    return {
+        'id': q.id,
+        'prompt': q.prompt,
+        'mode': q.mode,
+        'created_at': q.created_at.isoformat(),
+        'preview': q.preview[:settings.HISTORY_PREVIEW_CHARS] if q.preview is not None else None,
+    }
+
+
 @require_http_methods(["GET"])
 def history_view(request):
-    """Get user's query history (last 5 queries)"""
+    """
+    Get user's query history, newest first (cursor paginated)
+
+    Query params: limit (default 5, max 100), cursor (next_cursor of the
+    previous page) and mode (e.g. groq, gemini, both, compare_with_rubric).
+    """
     try:
         user = get_authenticated_user(request)
-        if not user:
+        if user is None:
             return JsonResponse({
                 'error': 'Authentication required'
             }, status=401)
         
-        # Get last 5 queries for the user
-        queries = QueryHistory.objects.filter(user=user)[:5]
-        
-        history = [{
-            'id': q.id,
-            'prompt': q.prompt,
-            'mode': q.mode,
-            'created_at': q.created_at.isoformat(),
-            'responses': {
-                'groq': q.response_groq,
-                'gemini': q.response_gemini,
-            }
-        } for q in queries]
+        try:
+            limit = int(request.GET.get('limit', settings.HISTORY_PAGE_SIZE))
+        except ValueError:
+            return JsonResponse({'error': 'limit must be an integer'}, status=400)
+        limit = max(1, min(limit, settings.HISTORY_MAX_PAGE_SIZE))
+
+        queries = history_list_queryset(user.id)
+        mode = request.GET.get('mode')
+        if mode:
+            queries = queries.filter(mode=mode)
+
+        try:
+            queries, next_cursor = keyset_page(queries, request.GET.get('cursor'), limit)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        history = [history_list_item(q) for q in queries]
         
-        return JsonResponse({'history': history})
+        return JsonResponse({'history': history, 'next_cursor': next_cursor})
         
     except Exception as e:
         print(f'History error: {str(e)}')
@@ -523,6 +781,166 @@ def history_view(request):
         }, status=500)
 
 
+@require_http_methods(["GET"])
+def history_search_view(request):
+    """
+    Search the user's prompts and responses, best match first
+
+    Query params: q (every word must match, the last one as a prefix), limit
+    (default 5, max 100) and cursor (next_cursor of the previous page).
+    """
+    try:
+        user = get_authenticated_user(request)
+        if user is None:
+            return JsonResponse({
+                'error': 'Authentication required'
+            }, status=401)
+
+        text = request.GET.get('q', '')
+        if not search_terms(text):
+            return JsonResponse({'error': 'q must contain at least one word'}, status=400)
+        try:
+            limit = int(request.GET.get('limit', settings.HISTORY_PAGE_SIZE))
+        except ValueError:
+            return JsonResponse({'error': 'limit must be an integer'}, status=400)
+        limit = max(1, min(limit, settings.HISTORY_MAX_PAGE_SIZE))
+        try:
+            offset = decode_offset_cursor(request.GET['cursor']) if request.GET.get('cursor') else 0
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        if offset > settings.SEARCH_MAX_OFFSET:
+            return JsonResponse({'error': 'Refine the search to see more results'}, status=400)
+
+        try:
+            page, next_offset = search_page(
+                user.id, text, limit, offset, history_list_queryset(user.id).in_bulk
+            )
+        except SearchUnavailable as e:
+            return JsonResponse({'error': str(e)}, status=501)
+        next_cursor = encode_offset_cursor(next_offset) if next_offset is not None else None
+
+        results = [{
+            **history_list_item(query),
+            'rank': rank,
+        } for query, rank in page]
+
+        return JsonResponse({'results': results, 'next_cursor': next_cursor})
+
+    except Exception as e:
+        print(f'History search error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to search history',
+            'details': str(e)
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def history_detail_view(request, query_id):
+    """Get one history item with its full responses"""
+    try:
+        user = get_authenticated_user(request)
+        if user is None:
+            return JsonResponse({
+                'error': 'Authentication required'
+            }, status=401)
+
+        try:
+            q = QueryHistory.objects.prefetch_related('responses').get(id=query_id, user_id=user.id)
+        except QueryHistory.DoesNotExist:
+            return JsonResponse({'error': 'Query not found'}, status=404)
+
+        return JsonResponse({
+            'query': {
+                'id': q.id,
+                'prompt': q.prompt,
+                'mode': q.mode,
+                'created_at': q.created_at.isoformat(),
+                'responses': {r.provider: r.response for r in q.responses.all()}
+            }
+        })
+
+    except Exception as e:
+        print(f'History detail error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to get query',
+            'details': str(e)
+        }, status=500)
+
+
+def stats_since(request):
+    """Start of the stats window from the days query param; None if it is invalid"""
+    try:
+        days = int(request.GET.get('days', settings.STATS_DEFAULT_DAYS))
+    except ValueError:
+        return None
+    if days < 1:
+        return None
+    return timezone.now() - timedelta(days=min(days, settings.STATS_MAX_DAYS))
+
+
+@require_http_methods(["GET"])
+def provider_stats_view(request):
+    """
+    Latency percentiles, token usage, cache hit and error rates per provider
+
+    Query params: days (default 7, max 90) and purpose (response, rubric or stream).
+    """
+    try:
+        user = get_authenticated_user(request)
+        if user is None:
+            return JsonResponse({
+                'error': 'Authentication required'
+            }, status=401)
+
+        since = stats_since(request)
+        if since is None:
+            return JsonResponse({'error': 'days must be a positive integer'}, status=400)
+
+        return JsonResponse({
+            'since': since.isoformat(),
+            **provider_stats(since, request.GET.get('purpose')),
+        })
+
+    except Exception as e:
+        print(f'Provider stats error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to get provider stats',
+            'details': str(e)
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def user_stats_view(request):
+    """Latency percentiles, token usage and cache hits of the user's saved responses (days param as above)"""
+    try:
+        user = get_authenticated_user(request)
+        if user is None:
+            return JsonResponse({
+                'error': 'Authentication required'
+            }, status=401)
+
+        since = stats_since(request)
+        if since is None:
+            return JsonResponse({'error': 'days must be a positive integer'}, status=400)
+
+        # only successful responses are saved to history
+        rows = ModelResponse.objects.filter(
+            query__user_id=user.id, query__created_at__gte=since
+        ).annotate(error=Value('', output_field=CharField()))
+
+        return JsonResponse({
+            'since': since.isoformat(),
+            **summarize(rows),
+        })
+
+    except Exception as e:
+        print(f'User stats error: {str(e)}')
+        return JsonResponse({
+            'error': 'Failed to get stats',
+            'details': str(e)
+        }, status=500)
+
+
 @csrf_exempt
 def profile_view(request):
     """
@@ -533,7 +951,7 @@ def profile_view(request):
     """
     try:
         user = get_authenticated_user(request)
-        if not user:
+        if user is None:
             return JsonResponse({
                 'error': 'Authentication required'
             }, status=401)
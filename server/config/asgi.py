@@ -0,0 +1,20 @@
+"""
+ASGI config for AI Comparator project.
+
+Serves the async AI views (ASYNC_AI_VIEWS defaults to true when settings are
+loaded from here), e.g.:
+    gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker
+"""
+
+import os
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+application = get_asgi_application()
+
+if settings.PRELOAD_SDKS:
+    from api.clients import preload_sdks
+    preload_sdks()
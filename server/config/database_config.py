@@ -1,9 +1,30 @@
 import os
 from pathlib import Path
 
-def get_database_config():
+
+def _connection_tuning(async_views=False):
+    """
+    Connection reuse settings shared by both databases.
+
+    Django has no connection pool: DB_CONN_MAX_AGE keeps each worker thread's
+    connection open for that many seconds (0 = reconnect on every request,
+    empty = forever), so a worker holds at most one connection per thread, and
+    the pool size is the number of worker threads. Under ASGI sync code runs
+    on short-lived sync_to_async threads, whose persistent connections would
+    pile up, so with async_views (ASYNC_AI_VIEWS) it defaults to 0.
+    DB_CONN_HEALTH_CHECKS pings a reused connection before the request uses it.
+    """
+    max_age = os.getenv('DB_CONN_MAX_AGE', '0' if async_views else '60')
+    return {
+        'CONN_MAX_AGE': int(max_age) if max_age else None,
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
+    }
+
+
+def get_database_config(async_views=False):
     """
-    Get database configuration based on environment variables.
+    Get database configuration based on environment variables (async_views:
+    whether the AI views are served async, see _connection_tuning).
     
     Supports two methods:
     1. DB_TYPE=postgresql or DB_TYPE=sqlite (new method)
@@ -30,6 +51,7 @@ def get_database_config():
     
     if use_postgresql:
         # PostgreSQL configuration
+        statement_timeout = os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000')
         return {
             'default': {
                 'ENGINE': 'django.db.backends.postgresql',
@@ -38,6 +60,12 @@ def get_database_config():
                 'PASSWORD': os.getenv('DB_PASSWORD', ''),
                 'HOST': os.getenv('DB_HOST', 'localhost'),
                 'PORT': os.getenv('DB_PORT', '5432'),
+                **_connection_tuning(async_views),
+                'OPTIONS': {
+                    'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+                    # server-side cap so a runaway query can't pin a connection
+                    'options': f'-c statement_timeout={statement_timeout}',
+                },
             }
         }
     else:
@@ -47,5 +75,25 @@ def get_database_config():
             'default': {
                 'ENGINE': 'django.db.backends.sqlite3',
                 'NAME': BASE_DIR / 'db.sqlite3',
+                **_connection_tuning(async_views),
+                'OPTIONS': {
+                    # seconds a writer waits on a locked database before failing
+                    'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')) / 1000,
+                },
             }
-        }
\ No newline at end of file
+        }
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    connection_created handler applying SQLite pragmas.
+
+    WAL lets readers proceed while one writer commits, and synchronous=NORMAL is
+    safe under WAL while avoiding an fsync per transaction.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode={os.getenv('SQLITE_JOURNAL_MODE', 'wal')}")
+        cursor.execute(f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'normal')}")
+        cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}")
@@ -3,18 +3,18 @@ Django settings for AI Comparator project.
 """
 
 import os
+import sys
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 # Load environment variables FIRST (before importing database_config)
 load_dotenv()
 
 from .database_config import get_database_config
 
-# Use dynamic config (after load_dotenv)
-DATABASES = get_database_config()
-
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -31,13 +31,15 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.staticfiles',
     'django.contrib.auth',
-    'rest_framework',
-    'rest_framework_simplejwt',
+    # rest_framework_simplejwt only issues and checks tokens (api.auth); no DRF views
+    # are served, so neither DRF app is installed
     'corsheaders',
     'api',
 ]
 
 MIDDLEWARE = [
+    # first, so it times everything below it
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,9 +80,15 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
+
+# Serve the AI endpoints from api.async_views; unset, this is on when config/asgi.py loads the settings
+SERVING_ASGI = 'config.asgi' in sys.modules
+ASYNC_AI_VIEWS = (os.getenv('ASYNC_AI_VIEWS') or str(SERVING_ASGI)).lower() == 'true'
 
 # Database configuration is handled by database_config.py
 # Use DB_TYPE=postgresql or DB_TYPE=sqlite in .env to switch
+DATABASES = get_database_config(async_views=ASYNC_AI_VIEWS)
 
 # Internationalization
 LANGUAGE_CODE = 'en-us'
@@ -101,11 +109,149 @@ AUTH_USER_MODEL = 'api.User'
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
-# REST Framework settings
-REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    ),
+# Provider calls (seconds) - compare endpoints fan out to all providers at once
+PROVIDER_TIMEOUT = float(os.getenv('PROVIDER_TIMEOUT', '60'))
+PROVIDER_TIMEOUTS = {
+    'groq': float(os.getenv('GROQ_TIMEOUT') or PROVIDER_TIMEOUT),
+    'gemini': float(os.getenv('GEMINI_TIMEOUT') or PROVIDER_TIMEOUT),
+}
+# in-flight requests allowed per provider, shared by all worker processes on the host
+PROVIDER_MAX_CONCURRENCY = int(os.getenv('PROVIDER_MAX_CONCURRENCY', '8'))
+PROVIDER_CONCURRENCY = {
+    'groq': int(os.getenv('GROQ_MAX_CONCURRENCY') or PROVIDER_MAX_CONCURRENCY),
+    'gemini': int(os.getenv('GEMINI_MAX_CONCURRENCY') or PROVIDER_MAX_CONCURRENCY),
+}
+# requests per minute each provider may receive from this host (0 = unlimited, the
+# default); set from the account's quota, leaving room for other clients of the key
+PROVIDER_RATE_LIMITS = {
+    'groq': float(os.getenv('GROQ_RPM') or 0),
+    'gemini': float(os.getenv('GEMINI_RPM') or 0),
+}
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '5'))
+# how long a request may queue for capacity before it fails (seconds)
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '10'))
+# back-off when a 429 carries no Retry-After, and time for the rate to recover after one
+RATE_LIMIT_BACKOFF = float(os.getenv('RATE_LIMIT_BACKOFF', '5'))
+RATE_LIMIT_RECOVERY = float(os.getenv('RATE_LIMIT_RECOVERY', '60'))
+RATE_LIMIT_RETRIES = int(os.getenv('RATE_LIMIT_RETRIES', '2'))
+# limiter state shared between worker processes
+RATE_LIMIT_DIR = os.getenv('RATE_LIMIT_DIR') or os.path.join(tempfile.gettempdir(), 'ai-comparator-ratelimit')
+# circuit breaker: stop calling a provider once failure_rate of the last BREAKER_WINDOW
+# calls failed, then probe it in the background (seconds between probes double)
+BREAKER_ENABLED = os.getenv('BREAKER_ENABLED', 'true').lower() == 'true'
+BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', '20'))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '5'))
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '15'))
+BREAKER_MAX_OPEN_SECONDS = float(os.getenv('BREAKER_MAX_OPEN_SECONDS', '300'))
+BREAKER_PROBE_TIMEOUT = float(os.getenv('BREAKER_PROBE_TIMEOUT', '10'))
+# start the backup rubric evaluator once the primary runs past this latency percentile;
+# off by default, as each hedge pays for a second evaluator call (the backup is still
+# asked when the primary fails)
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'false').lower() == 'true'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_WINDOW = int(os.getenv('HEDGE_WINDOW', '200'))
+# rubric evaluation: 'pairwise' compares both responses in one evaluator call,
+# 'pipelined' (opt-in) scores each response as soon as it is ready
+RUBRIC_MODE = os.getenv('RUBRIC_MODE', 'pairwise')
+# ask evaluators for native JSON output (Groq json_object, Gemini application/json)
+RUBRIC_JSON_MODE = os.getenv('RUBRIC_JSON_MODE', 'true').lower() == 'true'
+# providers /ai/compare uses when the request does not name any
+COMPARE_PROVIDERS = [name.strip() for name in os.getenv('COMPARE_PROVIDERS', 'groq,gemini').split(',') if name.strip()]
+PROVIDER_MAX_WORKERS = int(os.getenv('PROVIDER_MAX_WORKERS', '16'))
+# keep-alive connections each provider client holds open per worker
+PROVIDER_POOL_SIZE = int(os.getenv('PROVIDER_POOL_SIZE', '20'))
+
+# Batch comparison jobs (POST /ai/batch)
+BATCH_MAX_PROMPTS = int(os.getenv('BATCH_MAX_PROMPTS', '1000'))
+# prompts in flight per process, further capped by the providers' concurrency limits
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+BATCH_MAX_ATTEMPTS = int(os.getenv('BATCH_MAX_ATTEMPTS', '3'))
+# a running job whose heartbeat is older than this is treated as interrupted
+BATCH_STALE_SECONDS = int(os.getenv('BATCH_STALE_SECONDS', '60'))
+
+# Background jobs for compare-with-rubric ({"job": true}), queued in the database
+# worker threads started by `manage.py run_job_workers`
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+# worker threads each web process runs itself (0 to leave jobs to run_job_workers)
+JOB_WEB_WORKERS = int(os.getenv('JOB_WEB_WORKERS', '2'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1.0'))
+# a running job not finished after this long is assumed lost and retried
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+# finished jobs are deleted after this long
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', '86400'))
+
+# Query history pagination
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '5'))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '100'))
+HISTORY_PREVIEW_CHARS = int(os.getenv('HISTORY_PREVIEW_CHARS', '200'))
+
+# History rows are buffered and bulk-inserted off the request path
+HISTORY_WRITE_BEHIND = os.getenv('HISTORY_WRITE_BEHIND', 'true').lower() == 'true'
+HISTORY_FLUSH_SIZE = int(os.getenv('HISTORY_FLUSH_SIZE', '50'))
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '1.0'))
+HISTORY_QUEUE_MAX = int(os.getenv('HISTORY_QUEUE_MAX', '10000'))
+
+# History prompts and responses are stored compressed: zlib, zstd (needs `pip install
+# zstandard`) or none. Texts under HISTORY_COMPRESSION_MIN_SIZE bytes are stored as they are
+HISTORY_COMPRESSION = os.getenv('HISTORY_COMPRESSION', 'zlib')
+if HISTORY_COMPRESSION not in ('zlib', 'zstd', 'none'):
+    raise ImproperlyConfigured('HISTORY_COMPRESSION must be one of zlib, zstd, none')
+if HISTORY_COMPRESSION == 'zstd':
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured('HISTORY_COMPRESSION=zstd needs zstandard (pip install zstandard)')
+HISTORY_COMPRESSION_LEVEL = int(os.getenv('HISTORY_COMPRESSION_LEVEL') or (3 if HISTORY_COMPRESSION == 'zstd' else 6))
+HISTORY_COMPRESSION_MIN_SIZE = int(os.getenv('HISTORY_COMPRESSION_MIN_SIZE', '128'))
+# compress with the newest dictionary trained by `manage.py compress_history --train`
+HISTORY_COMPRESSION_DICTIONARY = os.getenv('HISTORY_COMPRESSION_DICTIONARY', 'true').lower() == 'true'
+
+# Full-text search of history (/users/queries/search): tsvector + GIN on PostgreSQL, FTS5 on
+# SQLite. SEARCH_LANGUAGE is the PostgreSQL text search configuration (SQLite stems English)
+SEARCH_ENABLED = os.getenv('SEARCH_ENABLED', 'true').lower() == 'true'
+SEARCH_LANGUAGE = os.getenv('SEARCH_LANGUAGE', 'english')
+SEARCH_MAX_OFFSET = int(os.getenv('SEARCH_MAX_OFFSET', '1000'))
+
+# Import the provider SDKs when the WSGI/ASGI app loads instead of on first use, so a
+# pre-fork parent (gunicorn --preload) shares them with its workers copy-on-write
+PRELOAD_SDKS = os.getenv('PRELOAD_SDKS', 'false').lower() == 'true'
+
+# Provider call accounting (latency, tokens, cache hits) behind /stats/providers
+USAGE_TRACKING_ENABLED = os.getenv('USAGE_TRACKING_ENABLED', 'true').lower() == 'true'
+STATS_DEFAULT_DAYS = int(os.getenv('STATS_DEFAULT_DAYS', '7'))
+STATS_MAX_DAYS = int(os.getenv('STATS_MAX_DAYS', '90'))
+# latency percentiles come from this many most recent calls per provider (exact on PostgreSQL)
+STATS_SAMPLE_SIZE = int(os.getenv('STATS_SAMPLE_SIZE', '10000'))
+# provider call rows older than this are deleted by `manage.py prune_usage` (0 = keep them)
+USAGE_RETENTION_DAYS = int(os.getenv('USAGE_RETENTION_DAYS', str(STATS_MAX_DAYS)))
+
+# Prometheus metrics at /metrics; worker processes on a host share them through METRICS_DIR
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_DIR = os.getenv('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'ai-comparator-metrics')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1.0'))
+
+# Response cache for identical prompts (backend: local, django or database)
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'local')
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+# concurrent identical requests share one upstream call
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # used by RESPONSE_CACHE_BACKEND=database (create it with `python manage.py createcachetable`)
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'ai_response_cache',
+        'TIMEOUT': RESPONSE_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': RESPONSE_CACHE_MAX_ENTRIES},
+    },
 }
 
 # JWT settings
@@ -120,3 +266,40 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# validated access tokens kept per worker until they expire
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '10000'))
+# how often (seconds) a cached token's user is checked to still exist and be active;
+# deleting or deactivating a user drops its tokens at once in the worker that did it
+AUTH_USER_CHECK_INTERVAL = float(os.getenv('AUTH_USER_CHECK_INTERVAL', '60'))
+
+# Password hashing: pbkdf2, argon2 (needs `pip install argon2-cffi`) or scrypt. Hashes
+# made by the other hashers, or with other costs, are rehashed with this one at login
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2')
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'api.hashers.PBKDF2PasswordHasher',
+    'argon2': 'api.hashers.Argon2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+}
+if PASSWORD_HASHER not in _PASSWORD_HASHERS:
+    raise ImproperlyConfigured(f'PASSWORD_HASHER must be one of {", ".join(_PASSWORD_HASHERS)}')
+if PASSWORD_HASHER == 'argon2':
+    try:
+        import argon2
+    except ImportError:
+        raise ImproperlyConfigured('PASSWORD_HASHER=argon2 needs argon2-cffi (pip install argon2-cffi)')
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', '600000'))
+# argon2id memory cost in KiB; the defaults are OWASP's minimum (19 MiB, 2 passes, 1 lane)
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '2'))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', '19456'))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', '1'))
+# processes hashing passwords for each worker (0 = in the request thread), and the hashes
+# that may wait or run at once before logins and registrations get a 503
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+
@@ -4,9 +4,14 @@ WSGI config for AI Comparator project.
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
 
+if settings.PRELOAD_SDKS:
+    from api.clients import preload_sdks
+    preload_sdks()
+